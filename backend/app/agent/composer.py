@@ -1,16 +1,24 @@
 import json
+import re
 import uuid
 import logging
-from typing import List, Dict
-from groq import Groq
+from typing import Any, AsyncIterator, List, Dict
 
 from app.core.config import settings
 from app.models.schemas import ChatResponse
+from app.services.chat_service import ChatService
+from app.services.latex_lint import lint_latex
+from app.services.latex_patch import PatchError, parse_patch, apply_patch
+from app.services.llm_client import llm_client
+from app.services.prompt_budget import PromptPiece, count_tokens, fit_pieces
 from .registry import ToolRegistry
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Simple URL detection regex
+URL_PATTERN = r'https?://[^\s<>"{}|\\^`\[\]]+'
+
 
 class AgentComposer:
     """High-level orchestrator that combines LaTeX + Manim outputs into a final LaTeX document.
@@ -20,14 +28,142 @@ class AgentComposer:
       2. Generate each animation using the Manim tool.
       3. Build context describing produced animations (with links/paths).
       4. Call LaTeX tool with augmented prompt to produce final document referencing animations.
+      5. Lint the generated LaTeX and ask for one repair if it is structurally broken.
     """
 
-    def __init__(self):
+    def __init__(self, use_cache: bool = True):
         self.registry = ToolRegistry()
-        self.client = Groq(api_key=settings.groq_api_key)
+        # False makes every LLM call skip cached answers
+        self.use_cache = use_cache
 
     async def compose_document(self, prompt: str) -> ChatResponse:
         logger.info(f"Starting document composition for prompt: {prompt[:100]}...")
+        latex_tool = self.registry.get("generate_latex")
+        if not latex_tool:
+            return ChatResponse(message="Latex tool unavailable.", latex="", error="Missing tool")
+        augmented_prompt, animations, success_anims = await self._build_prompt(prompt)
+
+        # Generate final LaTeX
+        latex_result = await latex_tool.run({"prompt": augmented_prompt, "use_cache": self.use_cache})  # type: ignore[attr-defined]
+        message = latex_result.get("message", "Document composed.")
+        latex_code = latex_result.get("latex", "")
+
+        message, latex_code, lint_issues = await self._repair(augmented_prompt, message, latex_code)
+        message = self._summarize(message, animations, success_anims)
+        return ChatResponse(
+            message=message,
+            latex=latex_code,
+            lint_issues=[i.to_dict() for i in lint_issues],
+            prompt_tokens=count_tokens(augmented_prompt),
+        )
+
+    async def compose_document_stream(self, prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        """Compose a document, streaming the LaTeX generation as events.
+
+        `status` events mark the slow stages (animations, scraping, repair),
+        `message` and `latex` events carry model output as it is generated,
+        and a final `done` event holds the same fields as `compose_document`'s
+        response. A repair replaces the streamed LaTeX, so clients should
+        render the `done` event's LaTeX once it arrives.
+        """
+        logger.info(f"Starting streamed document composition for prompt: {prompt[:100]}...")
+        if not self.registry.get("generate_latex"):
+            yield {"type": "failed", "message": "Latex tool unavailable.", "detail": "Missing tool"}
+            return
+        try:
+            yield {"type": "status", "stage": "context"}
+            augmented_prompt, animations, success_anims = await self._build_prompt(prompt)
+
+            yield {"type": "status", "stage": "generating"}
+            message, latex_code = "Document composed.", ""
+            async for event in ChatService.stream_message_and_latex(augmented_prompt, self.use_cache):
+                if event["type"] == "done":
+                    message, latex_code = event["message"], event["latex"]
+                else:
+                    yield event
+
+            if lint_latex(latex_code, require_document=False):
+                yield {"type": "status", "stage": "repairing"}
+            message, latex_code, lint_issues = await self._repair(augmented_prompt, message, latex_code)
+            message = self._summarize(message, animations, success_anims)
+            response = ChatResponse(
+                message=message,
+                latex=latex_code,
+                lint_issues=[i.to_dict() for i in lint_issues],
+                prompt_tokens=count_tokens(augmented_prompt),
+            )
+            yield {"type": "done", **response.model_dump()}
+        except Exception as e:
+            logger.error(f"COMPOSER: Streamed composition failed: {e}")
+            yield {"type": "failed", "message": "Generation failed.", "detail": str(e)}
+
+    async def edit_document(self, instruction: str, original: str, full_prompt: str) -> ChatResponse:
+        """Apply `instruction` to an attached document through a patch.
+
+        The model only returns the changed lines, which the server applies
+        to `original`. If the patch doesn't fit or leaves the document with
+        more structural issues than it had, the document is regenerated in
+        full from `full_prompt` instead.
+        """
+        response = await self._patch_document(instruction, original)
+        if response is not None:
+            return response
+        return await self.compose_document(full_prompt)
+
+    async def edit_document_stream(self, instruction: str, original: str, full_prompt: str) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming counterpart of `edit_document`.
+
+        A patch is small, so it comes back as a single `done` event; the
+        fallback streams like `compose_document_stream`.
+        """
+        yield {"type": "status", "stage": "editing"}
+        response = await self._patch_document(instruction, original)
+        if response is not None:
+            yield {"type": "done", **response.model_dump()}
+            return
+        async for event in self.compose_document_stream(full_prompt):
+            yield event
+
+    async def _patch_document(self, instruction: str, original: str) -> ChatResponse | None:
+        # Animations and web pages need the full composition pipeline
+        if "video" in instruction.lower() or re.search(URL_PATTERN, instruction):
+            return None
+        try:
+            message, kind, body = await ChatService.generate_patch(instruction, original, self.use_cache)
+        except Exception as e:
+            logger.warning(f"COMPOSER: Patch generation failed, regenerating the document: {e}")
+            return None
+
+        edits = None
+        if kind == "latex":
+            latex_code = body
+        else:
+            try:
+                edits = parse_patch(body)
+                latex_code = apply_patch(original, edits)
+            except PatchError as e:
+                logger.warning(f"COMPOSER: Patch does not apply, regenerating the document: {e}")
+                return None
+
+        lint_issues = lint_latex(latex_code, require_document=False)
+        if len(lint_issues) > len(lint_latex(original, require_document=False)):
+            logger.warning(f"COMPOSER: Patched document has {len(lint_issues)} structural issue(s), regenerating")
+            return None
+        logger.info(f"COMPOSER: Edited document with {len(edits) if edits else 'a full'} {'edit(s)' if edits else 'rewrite'}")
+        return ChatResponse(
+            message=message,
+            latex=latex_code,
+            lint_issues=[i.to_dict() for i in lint_issues],
+            prompt_tokens=count_tokens(instruction) + count_tokens(original),
+            edits=len(edits) if edits else None,
+        )
+
+    async def _build_prompt(self, prompt: str) -> tuple[str, List[Dict], List[Dict]]:
+        """Gather animations, web content and a template into the LaTeX prompt.
+
+        Returns the augmented prompt, the requested animations and the ones
+        that were generated successfully.
+        """
         
         # Only extract animations if the prompt contains "video"
         animations = []
@@ -140,27 +276,52 @@ class AgentComposer:
                 logger.info(f"Detected template type: {template_type}, retrieving template...")
                 template_result = await template_tool.run({"type": template_type})
                 if template_result.get("success"):
-                    template_content = template_result.get("template_content", "")
-                    augmented_prompt += f"\n\n% ==== TEMPLATE EXAMPLE: {template_type.upper()} ====\n% Use this as reference for structure and formatting:\n{template_content}"
-                    logger.info(f"Retrieved template '{template_type}' ({len(template_content)} characters)")
+                    # The example only gets what the prompt leaves of the budget
+                    header = f"\n\n% ==== TEMPLATE EXAMPLE: {template_type.upper()} ====\n% Use this as reference for structure and formatting:\n"
+                    template = PromptPiece(template_type, "template", template_result.get("template_content", ""))
+                    fit_pieces(
+                        [PromptPiece("prompt", "prompt", augmented_prompt + header, required=True), template],
+                        settings.chat_prompt_budget_tokens,
+                    )
+                    if template.text:
+                        augmented_prompt += header + template.text
+                        logger.info(f"Retrieved template '{template_type}' ({template.original_tokens} -> {template.tokens} tokens)")
+                    else:
+                        logger.info(f"Retrieved template '{template_type}' but the prompt budget leaves no room for it")
                 else:
                     logger.warning(f"Failed to retrieve template '{template_type}': {template_result.get('error')}")
 
-        # Generate final LaTeX
-        if latex_tool:
-            latex_result = await latex_tool.run({"prompt": augmented_prompt})  # type: ignore[attr-defined]
-            message = latex_result.get("message", "Document composed.")
-            latex_code = latex_result.get("latex", "")
-        else:
-            return ChatResponse(message="Latex tool unavailable.", latex="", error="Missing tool")
+        logger.info(f"COMPOSER: Final prompt is ~{count_tokens(augmented_prompt)} tokens (budget {settings.chat_prompt_budget_tokens})")
+        return augmented_prompt, animations, success_anims
+
+    async def _repair(self, augmented_prompt: str, message: str, latex_code: str) -> tuple[str, str, list]:
+        """Lint generated LaTeX and ask for one repair if it has structural issues."""
+        latex_tool = self.registry.get("generate_latex")
+        lint_issues = lint_latex(latex_code, require_document=False)
+        if lint_issues:
+            logger.warning(f"COMPOSER: Generated LaTeX has {len(lint_issues)} structural issue(s), requesting a repair")
+            problems = "\n".join(f"% line {i.line}, column {i.column}: {i.message}" for i in lint_issues)
+            repair_prompt = (
+                f"{augmented_prompt}\n\n% ==== PREVIOUS ATTEMPT ====\n{latex_code}\n% ==== END PREVIOUS ATTEMPT ====\n"
+                f"% The previous attempt has these structural problems:\n{problems}\n"
+                "Output the corrected LaTeX."
+            )
+            repair_result = await latex_tool.run({"prompt": repair_prompt, "use_cache": self.use_cache})  # type: ignore[attr-defined]
+            repaired = repair_result.get("latex", "")
+            repaired_issues = lint_latex(repaired, require_document=False)
+            if repaired and len(repaired_issues) < len(lint_issues):
+                message = repair_result.get("message", message)
+                latex_code, lint_issues = repaired, repaired_issues
+        return message, latex_code, lint_issues
 
+    @staticmethod
+    def _summarize(message: str, animations: List[Dict], success_anims: List[Dict]) -> str:
         # Append summary of animations to message
         if success_anims:
             message += f" Generated {len(success_anims)} animation(s)."
         elif animations and not success_anims:
             message += " All requested animations failed to generate."  # keep latex_code anyway
-
-        return ChatResponse(message=message, latex=latex_code)
+        return message
 
     async def _extract_animation_specs(self, prompt: str) -> List[Dict[str, str]]:
         """Use LLM to extract animation descriptions as JSON.
@@ -176,15 +337,17 @@ class AgentComposer:
             "Return ONLY JSON with key 'animations' mapping to a list of objects each having a 'description' string. "
             "If no animations are implied, return {\"animations\": []}. No extra text."
         )
-        completion = self.client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": prompt}
-            ]
-        )
         try:
-            raw = completion.choices[0].message.content.strip()  # type: ignore[attr-defined]
+            raw = await llm_client.complete(
+                model="llama-3.3-70b-versatile",
+                messages=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt}
+                ],
+                site="animations",
+                use_cache=self.use_cache
+            )
+            raw = raw.strip()
         except Exception:
             return []
 
@@ -237,10 +400,7 @@ class AgentComposer:
         if not web_scraper_tool:
             return []
         
-        # Simple URL detection regex
-        import re
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
-        urls = re.findall(url_pattern, prompt)
+        urls = re.findall(URL_PATTERN, prompt)
         
         if not urls:
             return []
@@ -251,7 +411,7 @@ class AgentComposer:
         for i, url in enumerate(urls, start=1):
             logger.info(f"WEB_SCRAPER: Detected URL {i}: {url}")
             try:
-                scrape_result = await web_scraper_tool.run({"url": url})
+                scrape_result = await web_scraper_tool.run({"url": url, "use_cache": self.use_cache})
                 if scrape_result.get("success"):
                     summary = scrape_result.get("summary", "")
                     web_content_lines.append(f"% URL {i}: {url}")
@@ -16,5 +16,5 @@ class LatexTool:
         prompt = args["prompt"]
         if ctx := args.get("context"):
             prompt += f"\n\n% CONTEXT\n{ctx}"
-        msg, latex = await ChatService.generate_message_and_latex(prompt)
+        msg, latex = await ChatService.generate_message_and_latex(prompt, args.get("use_cache", True))
         return {"message": msg, "latex": latex}
\ No newline at end of file
@@ -1,9 +1,8 @@
 import re
 import logging
 from typing import Any, Dict
-from groq import Groq
 
-from app.core.config import settings
+from app.services.llm_client import llm_client
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -29,9 +28,6 @@ class WebScraperTool:
         "required": ["url"]
     }
 
-    def __init__(self):
-        self.client = Groq(api_key=settings.groq_api_key)
-
     async def run(self, args: Dict[str, Any]) -> Dict[str, Any]:
         """Scrape and summarize a web page."""
         try:
@@ -52,7 +48,7 @@ class WebScraperTool:
             logger.info(f"WEB_SCRAPER: Scraping URL: {url}")
             
             # Use Groq compound model to scrape and summarize the page
-            completion = self.client.chat.completions.create(
+            summary = await llm_client.complete(
                 messages=[
                     {
                         "role": "user",
@@ -60,9 +56,10 @@ class WebScraperTool:
                     }
                 ],
                 model="groq/compound",
+                site="web_scraper",
+                use_cache=args.get("use_cache", True),
             )
-            
-            summary = completion.choices[0].message.content.strip()
+            summary = summary.strip()
             
             logger.info(f"WEB_SCRAPER: Successfully scraped URL ({len(summary)} characters)")
             
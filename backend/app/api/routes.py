@@ -1,27 +1,97 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
+import logging
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Query
 from fastapi.responses import JSONResponse
 from app.services.chat_service import ChatService
 from app.services.audio_service import AudioService
 from app.agent.composer import AgentComposer
-from app.services.pdf_service import PDFService
+from app.services.pdf_service import PDFService, DEFAULT_ENGINE
+from app.services.compile_cache import pdf_cache
+from app.services.llm_cache import llm_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.prompt_budget import PromptPiece, fit_pieces
+from app.services.raster_service import RasterService
 from app.services.html_service import HTMLService
 from app.services.manim_service.manim_service import ManimService
 from app.models.schemas import ChatRequest, CompileRequest, ManimAnimationOutput, ManimAnimationInput
+from app.core.config import settings
+from app.utils.sse import sse_response
+
+# Set up logging
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/compile")
-async def compile_endpoint(file: UploadFile = File(...)):
-    response = await PDFService.compile_pdf(file)
+async def compile_endpoint(
+    file: UploadFile = File(...),
+    session_id: str | None = Form(None),
+    max_errors: int | None = Form(None, ge=1),
+    engine: str = Form(DEFAULT_ENGINE),
+):
+    response = await PDFService.compile_pdf(file, session_id, max_errors, engine)
     return response
 
-@router.post("/chat")
-async def chat_endpoint(prompt: str = Form(...), source: UploadFile | None = None, attached: UploadFile | None = None):
-    if not source and not attached:
-        return await ChatService.process_chat(ChatRequest(prompt=prompt))
+@router.post("/compile/stream")
+async def compile_stream_endpoint(
+    file: UploadFile = File(...),
+    session_id: str | None = Form(None),
+    max_errors: int | None = Form(None, ge=1),
+    engine: str = Form(DEFAULT_ENGINE),
+):
+    return await PDFService.compile_pdf_stream(file, session_id, max_errors, engine)
+
+@router.post("/compile/batch")
+async def compile_batch_endpoint(
+    files: list[UploadFile] = File(...),
+    max_errors: int | None = Form(None, ge=1),
+    engine: str = Form(DEFAULT_ENGINE),
+):
+    return await PDFService.compile_batch(files, max_errors, engine)
+
+@router.post("/compile/project")
+async def compile_project_endpoint(
+    main: str = Form("main.tex"),
+    manifest: str | None = Form(None),
+    files: list[UploadFile] = File([]),
+    bundle: UploadFile | None = File(None),
+    session_id: str | None = Form(None),
+    max_errors: int | None = Form(None, ge=1),
+    engine: str = Form(DEFAULT_ENGINE),
+):
+    return await PDFService.compile_project(main, manifest, files, bundle, session_id, max_errors, engine)
+
+@router.get("/compile/result/{cache_key}")
+async def compile_result_endpoint(cache_key: str):
+    return await PDFService.get_result(cache_key)
+
+@router.get("/compile/result/{cache_key}/delta")
+async def compile_delta_endpoint(cache_key: str, since: str, format: str = Query("json")):
+    return await PDFService.get_delta(cache_key, since, format)
 
-    tex_segments: str = ""
-    context_segments: list[str] = []
+@router.get("/compile/result/{cache_key}/pages")
+async def compile_pages_endpoint(cache_key: str):
+    return await PDFService.get_pages(cache_key)
+
+@router.get("/compile/result/{cache_key}/pages/{page}")
+async def compile_page_endpoint(
+    cache_key: str,
+    page: int,
+    dpi: int = Query(96, ge=24, le=600),
+    format: str = Query("png"),
+):
+    return await RasterService.render_page(cache_key, page, dpi, format)
+
+@router.get("/compile/cache/stats")
+async def compile_cache_stats_endpoint():
+    return pdf_cache.stats()
+
+@router.get("/llm/cache/stats")
+async def llm_cache_stats_endpoint():
+    return {**llm_cache.stats(), "semantic": semantic_cache.stats()}
+
+async def _read_attachments(source: UploadFile | None, attached: UploadFile | None) -> list[PromptPiece]:
+    """Read the attached files into prompt pieces (audio is transcribed)."""
+    pieces: list[PromptPiece] = []
 
     for f in filter(lambda x: x is not None, [source, attached]):
         if not f.filename.endswith((".mp3", ".wav", ".m4a", ".txt", ".tex", ".md")):
@@ -30,7 +100,7 @@ async def chat_endpoint(prompt: str = Form(...), source: UploadFile | None = Non
         if f.filename.lower().endswith((".mp3", ".wav", ".m4a")): 
             try:
                 text: str = await AudioService.process_audio(f)
-                context_segments.append(f"% ---- CONTEXT {f.filename} ----\n{text}")
+                pieces.append(PromptPiece(f.filename, "transcript", text))
             except Exception:
                 raise HTTPException(status_code=500, detail=f"Could not process audio file: {f.filename}") 
         else:
@@ -40,37 +110,126 @@ async def chat_endpoint(prompt: str = Form(...), source: UploadFile | None = Non
             except Exception:
                 text = raw.decode("latin-1", errors="ignore")
                 
-            if f.filename.lower().endswith(".tex"):
-                tex_segments += f"% ---- BEGIN ORIGINAL {f.filename} ----\n{text}\n% ---- END ORIGINAL {f.filename} ----"
-            else:
-                context_segments.append(f"% ---- CONTEXT {f.filename} ----\n{text}")
-
-    # Build augmented prompt
-    if tex_segments:
-        prompt += tex_segments
-    
+            kind = "tex" if f.filename.lower().endswith(".tex") else "context"
+            pieces.append(PromptPiece(f.filename, kind, text))
+    return pieces
+
+def _augment_prompt(prompt: str, pieces: list[PromptPiece]) -> str:
+    """Append the original .tex sources and any context files to the prompt."""
+    for piece in pieces:
+        if piece.kind == "tex":
+            prompt += f"% ---- BEGIN ORIGINAL {piece.name} ----\n{piece.text}\n% ---- END ORIGINAL {piece.name} ----"
+
+    context_segments = [
+        f"% ---- CONTEXT {piece.name} ----\n{piece.text}"
+        for piece in pieces if piece.kind != "tex" and piece.text
+    ]
     if context_segments:
         prompt += "\n\n% ==== BEGIN CONTEXT FILES ====\n" + "\n\n".join(context_segments) + "\n% ==== END CONTEXT FILES ===="
+    return prompt
+
+def _fit_attachments(prompt: str, pieces: list[PromptPiece]) -> None:
+    """Trim attachments so prompt and attachments fit the chat prompt budget.
+
+    Attached .tex sources are never trimmed: the model rewrites or patches
+    the document from them, so a shortened copy would silently lose content.
+    Raises 413 when the prompt and .tex sources alone don't fit.
+    """
+    for piece in pieces:
+        piece.required = piece.kind == "tex"
+    # The BEGIN/END and CONTEXT headers around each attachment count too
+    headers = _augment_prompt("", [PromptPiece(piece.name, piece.kind, " ") for piece in pieces])
+    request = PromptPiece("prompt", "prompt", prompt + headers, required=True)
+    required = request.tokens + sum(piece.tokens for piece in pieces if piece.required)
+    if required > settings.chat_prompt_budget_tokens:
+        raise HTTPException(
+            status_code=413,
+            detail=f"The prompt and attached .tex files take about {required} tokens, "
+                   f"more than the {settings.chat_prompt_budget_tokens} allowed"
+        )
+    report = fit_pieces([request, *pieces], settings.chat_prompt_budget_tokens)
+    trimmed = [f"{p['name']}: {', '.join(p['actions'])}" for p in report["pieces"] if p["actions"]]
+    logger.info(f"CHAT: Attachments fit into {report['tokens']}/{report['budget']} tokens" + (f" ({'; '.join(trimmed)})" if trimmed else ""))
+
+@router.post("/chat")
+async def chat_endpoint(
+    prompt: str = Form(...),
+    source: UploadFile | None = None,
+    attached: UploadFile | None = None,
+    no_cache: bool = Form(False),
+):
+    if not source and not attached:
+        return await ChatService.process_chat(ChatRequest(prompt=prompt, no_cache=no_cache))
 
+    pieces = await _read_attachments(source, attached)
+    tex_files = [piece for piece in pieces if piece.kind == "tex"]
+    edit = settings.chat_edit_mode and len(tex_files) == 1
+    _fit_attachments(prompt, pieces)
+    full_prompt = _augment_prompt(prompt, pieces)
+    composer = AgentComposer(use_cache=not no_cache)
+    if edit:
+        instruction = _augment_prompt(prompt, [piece for piece in pieces if piece.kind != "tex"])
+        return await composer.edit_document(instruction, tex_files[0].text, full_prompt)
     # return await ChatService.process_chat(ChatRequest(prompt=prompt))
-    composer = AgentComposer()
-    return await composer.compose_document(prompt)
+    return await composer.compose_document(full_prompt)
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(
+    prompt: str = Form(...),
+    source: UploadFile | None = None,
+    attached: UploadFile | None = None,
+    no_cache: bool = Form(False),
+):
+    if not source and not attached:
+        return await ChatService.process_chat_stream(ChatRequest(prompt=prompt, no_cache=no_cache))
+
+    pieces = await _read_attachments(source, attached)
+    tex_files = [piece for piece in pieces if piece.kind == "tex"]
+    edit = settings.chat_edit_mode and len(tex_files) == 1
+    _fit_attachments(prompt, pieces)
+    full_prompt = _augment_prompt(prompt, pieces)
+    composer = AgentComposer(use_cache=not no_cache)
+    if edit:
+        instruction = _augment_prompt(prompt, [piece for piece in pieces if piece.kind != "tex"])
+        return sse_response(composer.edit_document_stream(instruction, tex_files[0].text, full_prompt))
+    return sse_response(composer.compose_document_stream(full_prompt))
 
 @router.post("/compose")
-async def compose_endpoint(prompt: str = Form(...)):
-    composer = AgentComposer()
+async def compose_endpoint(prompt: str = Form(...), no_cache: bool = Form(False)):
+    composer = AgentComposer(use_cache=not no_cache)
     return await composer.compose_document(prompt)
 
+@router.post("/compose/stream")
+async def compose_stream_endpoint(prompt: str = Form(...), no_cache: bool = Form(False)):
+    composer = AgentComposer(use_cache=not no_cache)
+    return sse_response(composer.compose_document_stream(prompt))
+
 @router.post("/test")
 async def test_endpoint(request: CompileRequest):
     response = await PDFService.compile_pdf(request)
     return response
 
 @router.post("/compile-html")
-async def compile_html_endpoint(file: UploadFile = File(...)):
-    response = await HTMLService.compile_html(file)
+async def compile_html_endpoint(
+    file: UploadFile = File(...),
+    session_id: str | None = Form(None),
+    bundle: bool = Form(False),
+    mode: str = Form("document"),
+    known: str | None = Form(None),
+):
+    if mode == "sections":
+        return await HTMLService.compile_html_sections(file, known)
+    if mode == "fast":
+        return await HTMLService.compile_html_fast(file, session_id)
+    if mode != "document":
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {mode}. Choose document, fast or sections")
+    response = await HTMLService.compile_html(file, session_id, bundle)
     return response
 
+@router.get("/compile-html/result/{cache_key}/{name:path}")
+async def compile_html_asset_endpoint(cache_key: str, name: str):
+    return await HTMLService.get_asset(cache_key, name)
+
 @router.get("/test-html")
 async def test_html_endpoint():
     """Test endpoint using a simple LaTeX file"""
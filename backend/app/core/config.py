@@ -1,3 +1,5 @@
+import os
+
 from pydantic_settings import BaseSettings
 from typing import Optional
 
@@ -5,6 +7,79 @@ class Settings(BaseSettings):
     app_name: str = "FastAPI Backend"
     groq_api_key: str
     debug: bool = False
+
+    # Shared LLM client
+    llm_max_concurrency: int = 16
+    llm_timeout_seconds: float = 60
+    llm_connect_timeout_seconds: float = 10
+    llm_max_retries: int = 2
+
+    # Cache of LLM completions; set a directory to also keep them on disk
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 512
+    llm_cache_dir: str = ""
+    llm_cache_max_mb: int = 64
+    # Seconds a completion stays fresh, per call site (0 disables caching there)
+    llm_cache_ttl_seconds: dict[str, int] = {"chat": 3600, "edit": 3600, "animations": 86400, "web_scraper": 1800}
+    # Reuse chat answers for reworded prompts (needs numpy); only short,
+    # standalone prompts are matched so attached documents never collide.
+    # Answers expire with the "chat" TTL above
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.88
+    semantic_cache_max_entries: int = 4096
+    semantic_cache_dim: int = 4096
+    semantic_cache_max_prompt_chars: int = 500
+    # Edit an attached .tex through a patch instead of regenerating it
+    chat_edit_mode: bool = True
+    # Approximate tokens allowed for the prompt, attachments and template example
+    chat_prompt_budget_tokens: int = 16000
+
+    # LaTeX compile pool
+    compile_workers: int = max(1, os.cpu_count() or 1)
+    compile_queue_size: int = 16
+    # Reject structurally broken sources before spawning TeX
+    compile_prelint: bool = True
+    compile_batch_max_files: int = 500
+
+    # Per-compile resource limits (0 disables a limit)
+    compile_timeout_seconds: int = 60
+    compile_cpu_seconds: int = 60
+    compile_memory_mb: int = 2048
+    compile_max_output_mb: int = 200
+
+    # Content-addressed cache of compiled PDFs
+    compile_cache_dir: str = "cache/pdf"
+    compile_cache_max_mb: int = 512
+
+    # Precompiled preamble formats (mylatexformat)
+    format_cache_dir: str = "cache/fmt"
+    format_cache_max_entries: int = 32
+
+    # Rasterized page images (PNG/WebP)
+    raster_cache_dir: str = "cache/pages"
+    raster_cache_max_mb: int = 256
+
+    # Per-page content hashes of compiled PDFs
+    page_index_dir: str = "cache/page_index"
+    page_index_max_mb: int = 16
+
+    # LaTeX to HTML conversion ("auto", "make4ht" or "pandoc")
+    html_converter: str = "auto"
+    html_cache_dir: str = "cache/html"
+    html_cache_max_mb: int = 256
+    # Try the in-process renderer before the converter for section previews
+    html_fast_path: bool = True
+
+    # Multi-file projects and their content-addressed asset store
+    asset_store_dir: str = "cache/assets"
+    asset_store_max_mb: int = 1024
+    project_max_files: int = 1000
+    project_max_mb: int = 100
+
+    # Persistent per-session compile workspaces
+    workspace_dir: str = "workspaces"
+    workspace_idle_minutes: int = 30
+    compile_max_passes: int = 3
     
     class Config:
         env_file = ".env"
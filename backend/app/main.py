@@ -1,11 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.api.routes import router as api_router
 from app.core.config import settings
+from app.services.llm_client import llm_client
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
-app = FastAPI(title="Backend API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close pooled LLM connections on shutdown
+    await llm_client.aclose()
+
+app = FastAPI(title="Backend API", version="1.0.0", lifespan=lifespan)
 
 # Need to figure this out later
 origins = [
@@ -18,6 +26,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Compile-Key",
+        "X-Compile-Cache",
+        "X-Compile-Passes",
+        "X-Page-Count",
+        "X-Changed-Pages",
+        "X-HTML-Assets",
+        "X-HTML-Renderer",
+    ],
 )
 
 # Mount static files for videos - handle subdirectories
@@ -10,6 +10,7 @@ class CompileRequest(BaseModel):
 class ChatRequest(BaseModel):
     """Model for a natural language prompt request"""
     prompt: str
+    no_cache: bool = False
 
 # RESPONSE MODELS
 
@@ -17,6 +18,9 @@ class ChatResponse(BaseModel):
     message: str
     latex: str
     error: Optional[str] = None
+    lint_issues: list[dict] = Field(default_factory=list, description="Structural problems found in the generated LaTeX")
+    prompt_tokens: Optional[int] = Field(default=None, description="Approximate size of the final prompt sent to the model, in tokens")
+    edits: Optional[int] = Field(default=None, description="Patch edits applied to the attached document; None when it was regenerated")
 
 class ManimAnimationInput(BaseModel):
     height: int = Field(
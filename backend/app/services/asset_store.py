@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path, PurePosixPath
+from typing import Any, Mapping
+
+from app.core.config import settings
+from app.services.compile_cache import CompileCache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Written into a workspace to remember which project files it was given
+PROJECT_FILES = ".project_files.json"
+
+
+class MissingAssetsError(Exception):
+    """A project refers to files whose content the server doesn't have."""
+
+    def __init__(self, missing: dict[str, str]):
+        super().__init__(f"{len(missing)} project file(s) missing from the asset store")
+        self.missing = missing
+
+
+def project_path(name: str) -> str | None:
+    """Normalise a project-relative file name, or None if it's unsafe.
+
+    Names use forward slashes and must stay inside the project: absolute
+    paths, `..` and hidden components (which could clobber workspace
+    bookkeeping files) are refused.
+    """
+    path = PurePosixPath(name.replace("\\", "/"))
+    parts = [part for part in path.parts if part != "."]
+    if not parts or path.is_absolute() or any(part == ".." or part.startswith(".") for part in parts):
+        return None
+    return "/".join(parts)
+
+
+class AssetStore:
+    """Content-addressed store for the files of multi-file projects.
+
+    Every file is kept once under the sha256 of its bytes, so a client only
+    uploads what the server hasn't seen, and a project is just a mapping of
+    paths to digests. Workspaces are populated with hard links (or symlinks
+    across filesystems) instead of copies.
+    """
+
+    def __init__(self, root: Path | str, max_bytes: int):
+        self._blobs = CompileCache(Path(root).resolve(), max_bytes, suffix=".blob")
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def add(self, data: bytes) -> str:
+        """Store `data` (if new) and return its digest."""
+        digest = self.digest(data)
+        if self._blobs.get(digest, count=False) is None:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                blob = Path(temp_dir) / "blob"
+                blob.write_bytes(data)
+                self._blobs.put(digest, blob)
+        return digest
+
+    def read(self, digest: str) -> bytes | None:
+        path = self._blobs.get(digest, count=False)
+        return path.read_bytes() if path is not None else None
+
+    def missing(self, files: Mapping[str, str]) -> dict[str, str]:
+        """The subset of `files` (path -> digest) not in the store."""
+        return {
+            path: digest for path, digest in files.items()
+            if self._blobs.get(digest, count=False) is None
+        }
+
+    def materialize(self, files: Mapping[str, str], work_dir: Path) -> None:
+        """Make `work_dir` contain exactly the project `files`.
+
+        Files already linked to the right content are left alone, files the
+        project no longer has are removed, and build products (aux files,
+        the PDF) are kept.
+
+        Raises MissingAssetsError when some content isn't in the store.
+        """
+        missing = self.missing(files)
+        if missing:
+            raise MissingAssetsError(missing)
+
+        marker = work_dir / PROJECT_FILES
+        try:
+            previous = json.loads(marker.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            previous = {}
+        for path in previous:
+            if path not in files:
+                (work_dir / path).unlink(missing_ok=True)
+
+        for path, digest in files.items():
+            blob = self._blobs.get(digest, count=False)
+            dest = work_dir / path
+            if dest.exists() and os.path.samefile(dest, blob):
+                continue
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            # Never write through an existing link: it may point into the store
+            dest.unlink(missing_ok=True)
+            try:
+                os.link(blob, dest)
+            except OSError:
+                try:
+                    os.symlink(blob, dest)
+                except OSError:
+                    shutil.copyfile(blob, dest)
+        marker.write_text(json.dumps(dict(files)), encoding="utf-8")
+
+    def stats(self) -> dict[str, Any]:
+        return self._blobs.stats()
+
+
+asset_store = AssetStore(settings.asset_store_dir, settings.asset_store_max_mb * 1024 * 1024)
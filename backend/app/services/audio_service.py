@@ -1,17 +1,13 @@
 from fastapi import UploadFile
-from groq import Groq
-from app.core.config import settings
+from app.services.llm_client import llm_client
 
 class AudioService:
 
     @staticmethod
     async def process_audio(audio_file: UploadFile) -> str:
-         
-        client = Groq(api_key=settings.groq_api_key)
-
         file_bytes = await audio_file.read()
 
-        transcription = client.audio.transcriptions.create(
+        transcription = await llm_client.transcribe(
             file=("audio.mp3", file_bytes), 
             model="whisper-large-v3",
             response_format="text",
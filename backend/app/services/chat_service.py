@@ -1,7 +1,23 @@
-from app.models.schemas import ChatRequest, ChatResponse
+import hashlib
+import logging
+from typing import Any, AsyncIterator
+
+from fastapi.responses import StreamingResponse
+
 from app.core.config import settings
+from app.models.schemas import ChatRequest, ChatResponse
+from app.services.llm_client import llm_client
+from app.services.latex_patch import SEARCH_MARKER, DIVIDER_MARKER, REPLACE_MARKER
+from app.services.marker_stream import MarkerStreamParser, MESSAGE_MARKER, LATEX_MARKER
+from app.services.prompt_budget import count_tokens
+from app.services.semantic_cache import semantic_cache
+from app.utils.sse import sse_response
+
+# Set up logging
+logger = logging.getLogger(__name__)
 
-from groq import Groq
+CHAT_MODEL = "openai/gpt-oss-120b"
+PATCH_MARKER = "<<<PATCH>>>"
 
 class ChatService:
 
@@ -9,13 +25,32 @@ class ChatService:
     async def process_chat(request: ChatRequest) -> ChatResponse:
         prompt_text = request.prompt
         try:
-            message, generated_latex = await ChatService.generate_message_and_latex(prompt_text)
-            return ChatResponse(message=message, latex=generated_latex)
+            message, generated_latex = await ChatService.generate_message_and_latex(prompt_text, not request.no_cache)
+            return ChatResponse(message=message, latex=generated_latex, prompt_tokens=count_tokens(prompt_text))
         except Exception as e:
             return ChatResponse(message="Generation failed.", latex="", error=str(e))
 
     @staticmethod
-    async def generate_message_and_latex(prompt: str) -> tuple[str, str]:
+    async def process_chat_stream(request: ChatRequest) -> StreamingResponse:
+        """Stream the chat reply as Server-Sent Events.
+
+        `message` and `latex` events carry text as the model produces it; a
+        final `done` event has the complete message and LaTeX (the same
+        values `process_chat` would return), or a `failed` event ends the
+        stream on error.
+        """
+        async def events() -> AsyncIterator[dict[str, Any]]:
+            try:
+                async for event in ChatService.stream_message_and_latex(request.prompt, not request.no_cache):
+                    yield event
+            except Exception as e:
+                logger.error(f"CHAT: Streaming generation failed: {e}")
+                yield {"type": "failed", "message": "Generation failed.", "detail": str(e)}
+
+        return sse_response(events())
+
+    @staticmethod
+    async def generate_message_and_latex(prompt: str, use_cache: bool = True) -> tuple[str, str]:
         """Ask Groq for both a user-facing message and LaTeX using delimiter markers.
 
         The model is instructed to output EXACTLY the following two blocks in order:
@@ -26,8 +61,167 @@ class ChatService:
         <ONLY raw LaTeX code>
 
         Anything outside those markers is ignored. Fallback: if markers missing, treat full output as LaTeX.
+        Identical prompts are answered from the LLM cache unless `use_cache` is False,
+        and reworded ones from the semantic cache when it is enabled.
+        """
+        if use_cache and (hit := ChatService._semantic_lookup(prompt)) is not None:
+            (message, latex), _ = hit
+            return message, latex
+        raw = await llm_client.complete(
+            messages=ChatService._messages(prompt),
+            model=CHAT_MODEL,
+            site="chat",
+            use_cache=use_cache
+        )
+        raw = raw.strip()
+
+        # Locate markers
+        msg_index = raw.find(MESSAGE_MARKER)
+        latex_index = raw.find(LATEX_MARKER)
+
+        if msg_index == -1 or latex_index == -1 or latex_index < msg_index:
+            # Fallback: treat entire output as LaTeX
+            return ("Generated LaTeX (fallback mode).", ChatService._clean_fenced_code(raw))
+
+        # Extract between markers
+        after_msg = raw[msg_index + len(MESSAGE_MARKER):latex_index]
+        after_latex = raw[latex_index + len(LATEX_MARKER):]
+
+        message = after_msg.strip()
+        latex = ChatService._clean_fenced_code(after_latex.strip())
+        message = ChatService._final_message(message, latex)
+        ChatService._semantic_store(prompt, message, latex)
+        return message, latex
+
+    @staticmethod
+    async def stream_message_and_latex(prompt: str, use_cache: bool = True) -> AsyncIterator[dict[str, Any]]:
+        """Streaming counterpart of `generate_message_and_latex`.
+
+        Yields `{"type": "message" | "latex", "text": ...}` events while the
+        completion is generated, then `{"type": "done", "message", "latex"}`.
+        A semantic cache hit is sent as one event of each kind, and its
+        `done` event carries the match's `similarity`.
+        """
+        if use_cache and (hit := ChatService._semantic_lookup(prompt)) is not None:
+            (message, latex), similarity = hit
+            yield {"type": "message", "text": message}
+            yield {"type": "latex", "text": latex}
+            yield {"type": "done", "message": message, "latex": latex, "similarity": similarity}
+            return
+
+        parser = MarkerStreamParser()
+        async for text in llm_client.stream_chat(
+            messages=ChatService._messages(prompt), model=CHAT_MODEL, site="chat", use_cache=use_cache
+        ):
+            for kind, chunk in parser.feed(text):
+                yield {"type": kind, "text": chunk}
+        for kind, chunk in parser.finish():
+            yield {"type": kind, "text": chunk}
+
+        message = "Generated LaTeX (fallback mode)." if parser.fallback else parser.message
+        message = ChatService._final_message(message, parser.latex)
+        ChatService._semantic_store(prompt, message, parser.latex)
+        yield {"type": "done", "message": message, "latex": parser.latex}
+
+    @staticmethod
+    def _semantic_scope() -> str:
+        # Answers are only interchangeable for the same model and instructions
+        system = ChatService._messages("")[0]["content"]
+        return hashlib.sha256(f"{CHAT_MODEL}\0{system}".encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _semantic_applies(prompt: str) -> bool:
+        return (
+            settings.semantic_cache_enabled
+            and semantic_cache.available
+            and len(prompt) <= settings.semantic_cache_max_prompt_chars
+        )
+
+    @staticmethod
+    def _semantic_lookup(prompt: str) -> tuple[tuple[str, str], float] | None:
+        if not ChatService._semantic_applies(prompt):
+            return None
+        hit = semantic_cache.lookup(ChatService._semantic_scope(), prompt)
+        if hit is not None:
+            logger.info(f"CHAT: Semantic cache hit (similarity {hit[1]:.3f}) for prompt: {prompt[:60]}")
+        return hit
+
+    @staticmethod
+    def _semantic_store(prompt: str, message: str, latex: str) -> None:
+        if latex and ChatService._semantic_applies(prompt):
+            semantic_cache.store(
+                ChatService._semantic_scope(),
+                prompt,
+                (message, latex),
+                settings.llm_cache_ttl_seconds.get("chat", 0),
+            )
+
+    @staticmethod
+    async def generate_patch(instruction: str, original: str, use_cache: bool = True) -> tuple[str, str, str]:
+        """Ask for an edit of `original` as SEARCH/REPLACE blocks instead of a whole document.
+
+        Returns `(message, kind, body)`: kind is "patch" with the blocks as
+        body, or "latex" with a full document when the model decided the
+        change touches most of it. Raises ValueError when the output has
+        neither block.
         """
-        client = Groq(api_key=settings.groq_api_key)
+        system_instructions = (
+            "### ROLE\n"
+            "You edit an existing LaTeX document. Instead of repeating the document, you output only the changes.\n\n"
+            "### OUTPUT CONTRACT\n"
+            "Output EXACTLY these two blocks in this order:\n\n"
+            f"{MESSAGE_MARKER}\n"
+            "<One plain-text sentence describing the change>\n"
+            f"{PATCH_MARKER}\n"
+            "<One or more edit blocks, each formatted as:>\n"
+            f"{SEARCH_MARKER}\n"
+            "<lines copied VERBATIM from the document, just enough to be unique>\n"
+            f"{DIVIDER_MARKER}\n"
+            "<the lines that replace them>\n"
+            f"{REPLACE_MARKER}\n\n"
+            "### EDIT RULES\n"
+            "- Every SEARCH text must appear exactly once in the document, copied character for character.\n"
+            "- Keep blocks small: a few lines around each change.\n"
+            "- To insert, SEARCH for a nearby line and repeat it in the replacement next to the new lines.\n"
+            "- To delete, leave the replacement empty.\n"
+            "- Blocks are applied in order; do not overlap them.\n"
+            "- No markdown fences, no commentary.\n\n"
+            "### LARGE REWRITES\n"
+            f"If the request changes most of the document, replace the {PATCH_MARKER} block with {LATEX_MARKER} "
+            "followed by the complete new document."
+        )
+        user = (
+            f"% ==== DOCUMENT ====\n{original}\n% ==== END DOCUMENT ====\n\n"
+            f"% ==== REQUEST ====\n{instruction}"
+        )
+        raw = await llm_client.complete(
+            messages=[
+                {"role": "system", "content": system_instructions},
+                {"role": "user", "content": user}
+            ],
+            model=CHAT_MODEL,
+            site="edit",
+            use_cache=use_cache
+        )
+        msg_index = raw.find(MESSAGE_MARKER)
+        for kind, marker in (("patch", PATCH_MARKER), ("latex", LATEX_MARKER)):
+            index = raw.find(marker)
+            if index != -1:
+                message = raw[msg_index + len(MESSAGE_MARKER):index].strip() if -1 < msg_index < index else ""
+                body = raw[index + len(marker):].strip()
+                if kind == "latex":
+                    body = ChatService._clean_fenced_code(body)
+                return message or "Document edited.", kind, body
+        raise ValueError("Edit output has neither a patch nor a LaTeX block")
+
+    @staticmethod
+    def _final_message(message: str, latex: str) -> str:
+        if not latex:
+            return "Empty LaTeX block returned."
+        return message or "LaTeX generated."
+
+    @staticmethod
+    def _messages(prompt: str) -> list[dict[str, str]]:
         system_instructions = (
             "### ROLE\n"
             "You are a precise LaTeX generation assistant. You must produce exactly two marked sections: a conversational response and LaTeX code.\n\n"
@@ -63,43 +257,10 @@ class ChatService:
             "\\\\documentclass{article}\\n\\\\title{Quantum Notes}\\n\\\\author{}\\n\\\\date{}\\n\\\\begin{document}\\n\\\\maketitle\\n\\\\section{Introduction}\\nContent goes here.\\n\\\\end{document}\n"
             "Remember: EXACTLY those two blocks."
         )
-        completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_instructions},
-                {"role": "user", "content": prompt}
-            ],
-            # model="llama-3.3-70b-versatile"
-            model="openai/gpt-oss-120b"
-        )
-        try:
-            raw = completion.choices[0].message.content  # type: ignore[attr-defined]
-        except Exception:
-            raw = str(completion)
-
-        raw = raw.strip()
-        msg_marker = "<<<MESSAGE>>>"
-        latex_marker = "<<<LATEX>>>"
-
-        # Locate markers
-        msg_index = raw.find(msg_marker)
-        latex_index = raw.find(latex_marker)
-
-        if msg_index == -1 or latex_index == -1 or latex_index < msg_index:
-            # Fallback: treat entire output as LaTeX
-            return ("Generated LaTeX (fallback mode).", ChatService._clean_fenced_code(raw))
-
-        # Extract between markers
-        after_msg = raw[msg_index + len(msg_marker):latex_index]
-        after_latex = raw[latex_index + len(latex_marker):]
-
-        message = after_msg.strip()
-        latex = ChatService._clean_fenced_code(after_latex.strip())
-
-        if not latex:
-            return ("Empty LaTeX block returned.", "")
-        if not message:
-            message = "LaTeX generated."
-        return (message, latex)
+        return [
+            {"role": "system", "content": system_instructions},
+            {"role": "user", "content": prompt}
+        ]
 
     @staticmethod
     def _clean_fenced_code(content: str) -> str:
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Mapping
+
+from app.core.config import settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Shape of a key from CompileCache.make_key; check client-supplied keys
+# against it before they go anywhere near a path
+CACHE_KEY = re.compile(r"^[0-9a-f]{64}$")
+
+
+class CompileCache:
+    """Content-addressed on-disk cache for compiled artifacts.
+
+    Entries are stored as `<key><suffix>` under `root`, where the key is a
+    hash of the source bytes plus everything else that affects the output
+    (engine, options). When the total size goes over `max_bytes` the least
+    recently used entries are deleted. Recency survives restarts because a
+    hit bumps the file's mtime. Entries that are being served can be pinned
+    so eviction leaves them alone until the response is done; pins are
+    counted, so an entry stays pinned until every holder has unpinned it.
+    """
+
+    # Upper bound on a pin after the latest `pin`, in case a release never
+    # comes (client hung up)
+    PIN_SECONDS = 300
+
+    def __init__(self, root: Path | str, max_bytes: int, suffix: str = ".pdf"):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        # key -> (number of holders, expiry)
+        self._pins: dict[str, tuple[int, float]] = {}
+        self._load()
+
+    @staticmethod
+    def make_key(source: bytes, engine: str, options: Mapping[str, Any] | None = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(engine.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(json.dumps(options or {}, sort_keys=True).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(source)
+        return digest.hexdigest()
+
+    def _load(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = [p for p in self.root.glob(f"*{self.suffix}") if p.is_file()]
+        for path in sorted(files, key=lambda p: p.stat().st_mtime):
+            size = path.stat().st_size
+            self._entries[path.name[: -len(self.suffix)]] = size
+            self._bytes += size
+        self._evict()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / f"{key}{self.suffix}"
+
+    def get(self, key: str, count: bool = True) -> Path | None:
+        """Return the cached artifact for `key`, or None on a miss.
+
+        Pass `count=False` for internal lookups that shouldn't skew the
+        hit/miss counters.
+        """
+        path = self.path_for(key)
+        if key not in self._entries or not path.exists():
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)
+            if count:
+                self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        if count:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, artifact: Path) -> Path:
+        """Store `artifact` under `key` and return the cached path.
+
+        The artifact is hard-linked when it lives on the same filesystem, so
+        no bytes are copied. Callers must unlink (not overwrite) the original
+        before producing a new one in its place.
+        """
+        path = self.path_for(key)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(artifact, tmp)
+        except OSError:
+            shutil.copyfile(artifact, tmp)
+        os.replace(tmp, path)
+        size = path.stat().st_size
+        self._bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        self._evict()
+        return path
+
+    def discard(self, key: str) -> None:
+        """Delete the artifact for `key`, if there is one."""
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)
+        self.path_for(key).unlink(missing_ok=True)
+
+    def pin(self, key: str) -> None:
+        """Protect `key` from eviction until a matching `unpin` (or PIN_SECONDS pass)."""
+        holders, _ = self._pins.get(key, (0, 0.0))
+        self._pins[key] = (holders + 1, time.monotonic() + self.PIN_SECONDS)
+
+    def unpin(self, key: str) -> None:
+        pin = self._pins.get(key)
+        if pin is None:
+            return
+        holders, expires = pin
+        if holders > 1:
+            self._pins[key] = (holders - 1, expires)
+        else:
+            del self._pins[key]
+
+    def _is_pinned(self, key: str) -> bool:
+        pin = self._pins.get(key)
+        if pin is None:
+            return False
+        if pin[1] < time.monotonic():
+            del self._pins[key]
+            return False
+        return True
+
+    def _evict(self) -> None:
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes or len(self._entries) <= 1:
+                break
+            if self._is_pinned(key):
+                continue
+            size = self._entries.pop(key)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                self.path_for(key).unlink()
+            except FileNotFoundError:
+                pass
+            logger.info(f"COMPILE_CACHE: Evicted {key[:12]} ({size} bytes)")
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+pdf_cache = CompileCache(settings.compile_cache_dir, settings.compile_cache_max_mb * 1024 * 1024)
@@ -0,0 +1,332 @@
+import asyncio
+import codecs
+import logging
+import math
+import os
+import signal
+import subprocess
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Mapping, Optional, Sequence, TypeVar
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# time.monotonic() by which everything run under the current slot must finish
+_slot_deadline: ContextVar[float | None] = ContextVar("slot_deadline", default=None)
+
+
+class CompileQueueFullError(Exception):
+    """Raised when every compile worker is busy and the wait queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Compile queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def queue_full_error(e: CompileQueueFullError) -> HTTPException:
+    """The 429 answer for a full compile queue, with a Retry-After hint."""
+    return HTTPException(
+        status_code=429,
+        detail="Compile queue is full, please retry shortly",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+class CompileSupersededError(Exception):
+    """Raised when a newer compile for the same session replaced this one."""
+
+
+@dataclass
+class ResourceLimits:
+    """Per-process caps for a TeX run. None disables a limit."""
+    # The executor's own wall-clock limit also caps each slot as a whole
+    wall_seconds: float | None = None
+    cpu_seconds: int | None = None
+    memory_mb: int | None = None
+    output_mb: int | None = None
+
+    @classmethod
+    def from_settings(cls) -> "ResourceLimits":
+        return cls(
+            wall_seconds=settings.compile_timeout_seconds or None,
+            cpu_seconds=settings.compile_cpu_seconds or None,
+            memory_mb=settings.compile_memory_mb or None,
+            output_mb=settings.compile_max_output_mb or None,
+        )
+
+
+@dataclass
+class ProcessResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    # True when on_output asked for the process to be stopped early
+    stopped: bool = False
+    # Which limit killed the process ("wall", "cpu" or "output"), if any
+    limit: str | None = None
+
+
+class CompileExecutor:
+    """Bounded pool for TeX subprocesses.
+
+    At most `workers` compiles hold a slot at once and at most `queue_size`
+    more may wait for one. Anything beyond that is rejected straight away with
+    `CompileQueueFullError` so callers can answer 429 instead of piling up.
+    Processes are spawned with asyncio so waiting on them never blocks the
+    event loop.
+
+    Every process runs in its own process group under `limits`, so a runaway
+    document (an endless \\loop, a huge TikZ picture) is killed together with
+    anything it spawned instead of holding a worker forever. CPU, memory and
+    output-size caps use rlimits and are only enforced on POSIX; the
+    wall-clock limit applies everywhere, and also bounds everything run
+    under one `slot()` together, so reruns can't hold a worker for several
+    times the limit.
+    """
+
+    def __init__(self, workers: int, queue_size: int, limits: ResourceLimits | None = None):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.limits = limits or ResourceLimits()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pending = 0
+        # Rolling average of slot hold time, used for the Retry-After hint
+        self._avg_seconds = 3.0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def retry_after(self) -> int:
+        waves = math.ceil(max(1, self._pending - self.workers + 1) / self.workers)
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one compile worker for the duration of the block."""
+        if self._pending >= self.workers + self.queue_size:
+            raise CompileQueueFullError(self.retry_after())
+        self._pending += 1
+        try:
+            async with self._slots:
+                started = time.monotonic()
+                wall = self.limits.wall_seconds
+                token = _slot_deadline.set(started + wall if wall else None)
+                try:
+                    yield
+                finally:
+                    _slot_deadline.reset(token)
+                    elapsed = time.monotonic() - started
+                    self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+        finally:
+            self._pending -= 1
+
+    async def run_process(
+        self,
+        args: Sequence[str],
+        cwd: Path | str,
+        env: Mapping[str, str] | None = None,
+        on_output: Callable[[str], Optional[bool]] | None = None,
+        limits: ResourceLimits | None = None,
+    ) -> ProcessResult:
+        """Run a command to completion without blocking the event loop.
+
+        If `on_output` is given it is called with decoded stdout as it
+        arrives, in whatever chunks the process flushes. Returning True from
+        it kills the process and marks the result `stopped`. `limits`
+        defaults to the executor's limits. Callers are expected to hold a
+        `slot()` while doing so; the process then also gets no more than
+        what is left of the slot's wall-clock budget. Raises
+        FileNotFoundError if the executable is missing.
+        """
+        limits = limits or self.limits
+        timeout = limits.wall_seconds
+        deadline = _slot_deadline.get()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"COMPILE: Not starting {args[0]}, the compile is out of wall-clock time")
+                return ProcessResult(returncode=-1, stdout="", stderr="", limit="wall")
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=str(cwd),
+            env=dict(env) if env is not None else None,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **_isolation_options(limits),
+        )
+        timed_out = False
+        try:
+            stdout, stderr, stopped = await asyncio.wait_for(
+                self._collect(proc, on_output),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"COMPILE: {args[0]} exceeded its {timeout:.1f}s of wall-clock time")
+            timed_out = True
+            stdout, stderr, stopped = b"", b"", False
+            _kill_group(proc)
+            await proc.wait()
+        except asyncio.CancelledError:
+            # Client went away or the compile was superseded
+            _kill_group(proc)
+            await proc.wait()
+            raise
+        finally:
+            # Reap anything the process left behind in its group
+            _kill_group(proc)
+
+        returncode = proc.returncode if proc.returncode is not None else -1
+        return ProcessResult(
+            returncode=returncode,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+            stopped=stopped,
+            limit="wall" if timed_out else _limit_from_returncode(returncode),
+        )
+
+    async def _collect(
+        self,
+        proc: asyncio.subprocess.Process,
+        on_output: Callable[[str], Optional[bool]] | None,
+    ) -> tuple[bytes, bytes, bool]:
+        # Leftover children would hold the pipes open after TeX itself exits
+        exited = asyncio.create_task(_kill_group_on_exit(proc))
+        try:
+            if on_output is None:
+                stdout, stderr = await proc.communicate()
+                return stdout, stderr, False
+            stderr_task = asyncio.create_task(proc.stderr.read())
+            try:
+                stdout, stopped = await self._stream(proc.stdout, on_output)
+                if stopped:
+                    _kill_group(proc)
+                stderr = await stderr_task
+            finally:
+                stderr_task.cancel()
+            await proc.wait()
+            return stdout, stderr, stopped
+        finally:
+            exited.cancel()
+
+    @staticmethod
+    async def _stream(reader: asyncio.StreamReader, on_output: Callable[[str], Optional[bool]]) -> tuple[bytes, bool]:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        chunks: list[bytes] = []
+        while chunk := await reader.read(4096):
+            chunks.append(chunk)
+            text = decoder.decode(chunk)
+            if text and on_output(text):
+                return b"".join(chunks), True
+        tail = decoder.decode(b"", final=True)
+        if tail and on_output(tail):
+            return b"".join(chunks), True
+        return b"".join(chunks), False
+
+
+def _isolation_options(limits: ResourceLimits) -> dict:
+    """Subprocess options that give the child its own group and rlimits."""
+    if os.name != "posix":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+    def apply_limits():
+        if resource is None:
+            return
+        if limits.cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a second later
+            resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+        if limits.memory_mb:
+            size = limits.memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (size, size))
+        if limits.output_mb:
+            size = limits.output_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_FSIZE, (size, size))
+
+    return {"start_new_session": True, "preexec_fn": apply_limits}
+
+
+def _kill_group(proc: asyncio.subprocess.Process) -> None:
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    elif proc.returncode is None:
+        proc.kill()
+
+
+async def _kill_group_on_exit(proc: asyncio.subprocess.Process) -> None:
+    # proc.wait() only returns once the pipes close, so watch returncode instead
+    while proc.returncode is None:
+        await asyncio.sleep(0.05)
+    _kill_group(proc)
+
+
+def _limit_from_returncode(returncode: int) -> str | None:
+    if returncode >= 0:
+        return None
+    killed_by = -returncode
+    if killed_by == getattr(signal, "SIGXCPU", None):
+        return "cpu"
+    if killed_by == getattr(signal, "SIGXFSZ", None):
+        return "output"
+    return None
+
+
+class SessionCoalescer:
+    """Keep at most one compile in flight per editing session.
+
+    Starting a compile for a session cancels the one already running for it,
+    which kills its TeX process or drops it from the queue. The cancelled
+    caller gets `CompileSupersededError` so it can tell the client its result
+    is stale rather than failing.
+    """
+
+    def __init__(self):
+        self._running: dict[str, asyncio.Task] = {}
+        self._superseded: set[asyncio.Task] = set()
+
+    async def run(self, session_id: str, work: Awaitable[T]) -> T:
+        previous = self._running.get(session_id)
+        if previous is not None and not previous.done():
+            self._superseded.add(previous)
+            previous.cancel()
+            logger.info(f"COMPILE: Superseded in-flight compile for session {session_id}")
+
+        task = asyncio.ensure_future(work)
+        self._running[session_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._superseded:
+                raise CompileSupersededError() from None
+            raise
+        finally:
+            if self._running.get(session_id) is task:
+                del self._running[session_id]
+            self._superseded.discard(task)
+
+
+compile_executor = CompileExecutor(
+    settings.compile_workers,
+    settings.compile_queue_size,
+    ResourceLimits.from_settings(),
+)
+session_coalescer = SessionCoalescer()
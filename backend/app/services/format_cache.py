@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from app.core.config import settings
+from app.services.compile_executor import compile_executor, CompileQueueFullError
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+BEGIN_DOCUMENT = re.compile(r"\\begin\s*\{document\}")
+COMMENT = re.compile(r"(?<!\\)%.*$")
+
+
+def split_preamble(source: str) -> tuple[str, str] | None:
+    """Split a LaTeX source at the first uncommented \\begin{document}.
+
+    Returns (preamble, rest) or None when the source has no document body.
+    """
+    offset = 0
+    for line in source.splitlines(keepends=True):
+        match = BEGIN_DOCUMENT.search(COMMENT.sub("", line))
+        if match:
+            cut = offset + match.start()
+            return source[:cut], source[cut:]
+        offset += len(line)
+    return None
+
+
+def format_build_command(engine: str, name: str, preamble_file: str) -> list[str]:
+    """Command that dumps `preamble_file` into `<name>.fmt` with mylatexformat."""
+    return [
+        engine,
+        "-ini",
+        "-interaction=nonstopmode",
+        f"-jobname={name}",
+        f"&{engine}",
+        "mylatexformat.ltx",
+        preamble_file,
+    ]
+
+
+def preamble_document(preamble: str) -> str:
+    """Minimal document mylatexformat can dump `preamble` from."""
+    return preamble + "\\begin{document}\n\\end{document}\n"
+
+
+class FormatCache:
+    """Precompiled preamble formats keyed by a hash of the preamble.
+
+    A preamble is dumped with mylatexformat the first time it is seen, in the
+    background so that compile doesn't wait for it. Later compiles with the
+    same preamble load the dump via `-fmt` and skip re-reading every package.
+    Only the `max_entries` most recently used formats are kept. Preambles that
+    fail to dump are remembered and compiled the normal way.
+    """
+
+    def __init__(self, root: Path | str, max_entries: int):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, max_entries)
+        self._building: dict[str, asyncio.Task] = {}
+        self._failed: set[str] = set()
+
+    @staticmethod
+    def format_name(preamble: str, engine: str) -> str:
+        digest = hashlib.sha256(preamble.encode("utf-8")).hexdigest()
+        return f"{engine}-{digest[:24]}"
+
+    def env(self) -> dict[str, str]:
+        """Environment that lets TeX find formats in the cache directory."""
+        env = dict(os.environ)
+        # Trailing separator keeps the default search path after ours
+        env["TEXFORMATS"] = f"{self.root.resolve()}{os.pathsep}"
+        return env
+
+    def lookup(self, preamble: str, engine: str = "pdflatex") -> str | None:
+        """Return the format name for `preamble` if a dump is ready."""
+        name = self.format_name(preamble, engine)
+        path = self.root / f"{name}.fmt"
+        if not path.exists():
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return name
+
+    def discard(self, name: str) -> None:
+        """Drop a format that failed to load and don't rebuild it."""
+        self._failed.add(name)
+        (self.root / f"{name}.fmt").unlink(missing_ok=True)
+
+    def schedule_build(self, preamble: str, engine: str = "pdflatex") -> None:
+        name = self.format_name(preamble, engine)
+        if name in self._building or name in self._failed:
+            return
+        if (self.root / f"{name}.fmt").exists():
+            return
+        task = asyncio.create_task(self._build(name, preamble, engine))
+        self._building[name] = task
+        task.add_done_callback(lambda _: self._building.pop(name, None))
+
+    async def _build(self, name: str, preamble: str, engine: str) -> None:
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                temp_path = Path(temp_dir)
+                (temp_path / f"{name}.tex").write_text(preamble_document(preamble), encoding="utf-8")
+                async with compile_executor.slot():
+                    result = await compile_executor.run_process(
+                        format_build_command(engine, name, f"{name}.tex"),
+                        cwd=temp_path,
+                    )
+                fmt_file = temp_path / f"{name}.fmt"
+                if result.returncode != 0 or not fmt_file.exists():
+                    self._failed.add(name)
+                    logger.warning(f"FORMAT_CACHE: Could not dump preamble {name}")
+                    return
+                shutil.move(str(fmt_file), str(self.root / f"{name}.fmt"))
+                logger.info(f"FORMAT_CACHE: Built format {name}")
+            self._evict()
+        except CompileQueueFullError:
+            # Pool is saturated; try again next time this preamble is seen
+            pass
+        except FileNotFoundError:
+            self._failed.add(name)
+        except Exception as e:
+            self._failed.add(name)
+            logger.error(f"FORMAT_CACHE: Error building format {name}: {e}")
+
+    def _evict(self) -> None:
+        formats = sorted(self.root.glob("*.fmt"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for path in formats[self.max_entries:]:
+            path.unlink(missing_ok=True)
+            logger.info(f"FORMAT_CACHE: Evicted format {path.stem}")
+
+
+format_cache = FormatCache(settings.format_cache_dir, settings.format_cache_max_entries)
@@ -1,96 +1,391 @@
 from pathlib import Path
 from fastapi import HTTPException, UploadFile
-from fastapi.responses import FileResponse
-import tempfile
-import subprocess
-import os
+from fastapi.responses import FileResponse, Response
+from starlette.background import BackgroundTask
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import re
 import shutil
+import zipfile
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.services.compile_cache import CACHE_KEY, CompileCache
+from app.services.compile_executor import compile_executor, queue_full_error, CompileQueueFullError
+from app.services.format_cache import split_preamble, COMMENT
+from app.services.latex_html import render_document, render_fragment, UnsupportedLatex
+from app.services.workspace_service import workspace_manager
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+HEAD_TAG = re.compile(rb"<head[^>]*>", re.IGNORECASE)
+BODY = re.compile(r"<body[^>]*>(.*)</body>", re.IGNORECASE | re.DOTALL)
+STYLESHEET = re.compile(r'<link[^>]*rel=["\']stylesheet["\'][^>]*href=["\']([^"\']+)["\']', re.IGNORECASE)
+RELATIVE_URL = re.compile(r'\b(src|href)=(["\'])(?![a-z][a-z0-9+.-]*:|/|#)([^"\']+)\2', re.IGNORECASE)
+HEADING = re.compile(r"^\s*\\(part|chapter|section)(\*?)\s*[\[{]")
+END_DOCUMENT = re.compile(r"\\end\s*\{document\}")
+VERBATIM = re.compile(r"\\(begin|end)\s*\{(verbatim|Verbatim|lstlisting|minted)\*?\}")
+
+# Tried in this order when `html_converter` is "auto"
+HTML_CONVERTERS = ("make4ht", "pandoc")
+# Recently served pages kept in memory, so repeat requests skip the zip
+HTML_MEMORY_ENTRIES = 32
+# How often a section fragment retries when the shared queue is full
+FRAGMENT_QUEUE_RETRIES = 10
+
+html_cache = CompileCache(settings.html_cache_dir, settings.html_cache_max_mb * 1024 * 1024, suffix=".zip")
+# cache key -> (HTML with its <base> in place, asset names)
+_recent_html: OrderedDict[str, tuple[bytes, list[str]]] = OrderedDict()
+
+
+def converter_command(converter: str, tex_file: Path, out_dir: Path) -> list[str]:
+    """Command line that converts `tex_file` into `<stem>.html` in `out_dir`."""
+    if converter == "make4ht":
+        return [
+            "make4ht",
+            "--utf8",
+            "--format", "html5",
+            "--output-dir", str(out_dir),
+            tex_file.name,
+            "mathjax",
+        ]
+    return [
+        "pandoc",
+        tex_file.name,
+        "--from", "latex",
+        "--to", "html5",
+        "--standalone",
+        "--mathjax",
+        "--output", str(out_dir / f"{tex_file.stem}.html"),
+    ]
+
+
+def split_sections(source: str) -> tuple[str, list[tuple[dict[str, int], str]]] | None:
+    """Split a document into its preamble and top-level sectioning fragments.
+
+    The body is cut before every `\\part`, `\\chapter` and `\\section`.
+    Each fragment comes with the values the part/chapter/section counters
+    have when it starts, so it can be rendered on its own with the right
+    numbering. Returns None when the source has no document body.
+    """
+    split = split_preamble(source)
+    if split is None:
+        return None
+    preamble, body = split
+    body = body[body.index("}") + 1:]
+    end = END_DOCUMENT.search(body)
+    if end:
+        body = body[:end.start()]
+
+    counters = {"part": 0, "chapter": 0, "section": 0}
+    fragments: list[tuple[dict[str, int], str]] = []
+    current: list[str] = []
+    start = dict(counters)
+    in_verbatim = False
+    for line in body.splitlines(keepends=True):
+        code = COMMENT.sub("", line)
+        heading = None if in_verbatim else HEADING.match(code)
+        for match in VERBATIM.finditer(code):
+            in_verbatim = match.group(1) == "begin"
+        if heading:
+            if "".join(current).strip():
+                fragments.append((start, "".join(current)))
+            current = []
+            start = dict(counters)
+            if not heading.group(2):
+                counters[heading.group(1)] += 1
+                if heading.group(1) == "chapter":
+                    counters["section"] = 0
+        current.append(line)
+    if "".join(current).strip() or not fragments:
+        fragments.append((start, "".join(current)))
+    return preamble, fragments
+
+
+def fragment_document(preamble: str, counters: dict[str, int], fragment: str, uses: set[str]) -> str:
+    """A standalone document rendering just `fragment`."""
+    setters = "".join(
+        f"\\setcounter{{{name}}}{{{value}}}\n" for name, value in counters.items() if name in uses
+    )
+    return f"{preamble}\\begin{{document}}\n{setters}{fragment}\n\\end{{document}}\n"
+
 
 class HTMLService:
     @staticmethod
-    async def compile_html(file: UploadFile) -> FileResponse:
+    async def compile_html(file: UploadFile, session_id: str | None = None, bundle: bool = False) -> Response:
+        """Convert a LaTeX file to HTML with make4ht or pandoc.
+
+        Conversions go through the same pool, workspaces and resource limits
+        as PDF compiles, and their output (the HTML plus any CSS or images
+        the converter generated) is cached as a zip keyed by source hash.
+        The HTML is returned with a `<base>` pointing at its assets; with
+        `bundle` the whole zip is returned instead.
+        """
+        if not file.filename.endswith('.tex'):
+            raise HTTPException(
+                status_code=400,
+                detail="Only .tex files are allowed"
+            )
+        if session_id and not workspace_manager.is_valid_session(session_id):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid session id"
+            )
+        converter = HTMLService._converter()
+        content = await file.read()
+        stem = Path(file.filename).stem
+
+        cache_key = html_cache.make_key(content, converter, {"jobname": stem})
+        archive = html_cache.get(cache_key)
+        cache_hit = archive is not None
+        if archive is None:
+            archive = await HTMLService._convert(content, file.filename, converter, cache_key, session_id)
+
+        headers = {
+            "X-Compile-Key": cache_key,
+            "X-Compile-Cache": "hit" if cache_hit else "miss",
+            "X-HTML-Renderer": converter,
+        }
+        if bundle:
+            html_cache.pin(cache_key)
+            return FileResponse(
+                path=str(archive),
+                media_type="application/zip",
+                filename=f"{stem}.zip",
+                headers=headers,
+                background=BackgroundTask(html_cache.unpin, cache_key)
+            )
+
+        html, assets = HTMLService._load_html(cache_key, archive, stem)
+        if assets:
+            headers["X-HTML-Assets"] = ",".join(assets)
+        return Response(
+            content=html,
+            media_type="text/html",
+            headers={"Content-Disposition": f"attachment; filename={stem}.html", **headers}
+        )
+
+    @staticmethod
+    async def compile_html_fast(file: UploadFile, session_id: str | None = None) -> Response:
+        """Render with the in-process fast path, or fall back to the toolchain.
+
+        The fast path covers every template except two_row_resume and
+        needs no subprocess; anything it doesn't recognise (TikZ, `picture`,
+        `\\def` with parameters, unknown environments) goes through
+        `compile_html` instead.
+        """
+        if not file.filename.endswith('.tex'):
+            raise HTTPException(
+                status_code=400,
+                detail="Only .tex files are allowed"
+            )
+        content = await file.read()
+        try:
+            html = render_document(content.decode("utf-8", errors="replace"))
+        except UnsupportedLatex as e:
+            logger.info(f"HTML: Fast path declined {file.filename} ({e}), using the toolchain")
+            await file.seek(0)
+            return await HTMLService.compile_html(file, session_id)
+        stem = Path(file.filename).stem
+        return Response(
+            content=html,
+            media_type="text/html",
+            headers={"Content-Disposition": f"attachment; filename={stem}.html", "X-HTML-Renderer": "fast"}
+        )
+
+    @staticmethod
+    async def compile_html_sections(file: UploadFile, known: str | None = None) -> dict:
+        """Render a document section by section for live preview.
+
+        Every top-level part, chapter or section is converted as its own
+        document (with the shared preamble and the counters it starts at),
+        and cached by hash like any other conversion. After an edit only the
+        changed fragments reach the converter. Fragments are returned in
+        document order with stable IDs; those listed in `known` (IDs the
+        client already shows) come back without their HTML. Fragments the
+        fast path can render skip the converter altogether. References to
+        labels in other sections can't resolve in this mode.
+        """
         if not file.filename.endswith('.tex'):
             raise HTTPException(
                 status_code=400,
                 detail="Only .tex files are allowed"
             )
-        
-        # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
+        source = (await file.read()).decode("utf-8", errors="replace")
+        sections = split_sections(source)
+        if sections is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Document has no \\begin{document}"
+            )
+        preamble, fragments = sections
+        uses = {name for name in ("part", "chapter") if f"\\{name}" in source} | {"section"}
+        known_ids = set(known.split(",")) if known else set()
+
+        # Like a batch, a document never takes more slots than there are
+        # workers, so long documents don't flood the queue shared with others
+        limit = asyncio.Semaphore(compile_executor.workers)
+
+        async def convert(content: bytes, converter: str, cache_key: str) -> Path:
+            async with limit:
+                for attempt in range(FRAGMENT_QUEUE_RETRIES):
+                    try:
+                        return await HTMLService._convert(content, "fragment.tex", converter, cache_key, None)
+                    except HTTPException as e:
+                        if e.status_code != 429 or attempt == FRAGMENT_QUEUE_RETRIES - 1:
+                            raise
+                        retry_after = int((e.headers or {}).get("Retry-After", 1))
+                        await asyncio.sleep(min(retry_after, 10))
+
+        async def render(counters: dict[str, int], fragment: str) -> dict:
+            content = fragment_document(preamble, counters, fragment, uses).encode("utf-8")
+            entry = {"id": hashlib.sha256(content).hexdigest()[:16], "cached": True}
+            if entry["id"] in known_ids:
+                return entry
+            if settings.html_fast_path:
+                try:
+                    html = render_fragment(preamble, fragment, counters)
+                    entry.update(renderer="fast", cached=False, styles=[], html=html)
+                    return entry
+                except UnsupportedLatex:
+                    pass
             try:
-                # Save uploaded file to temporary directory
-                tex_file_path = os.path.join(temp_dir, file.filename)
-                with open(tex_file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
-                
-                # Get the path to the bat file
-                bat_file_path = os.path.join(
-                    os.path.dirname(__file__), 
-                    "html_services", 
-                    "tex2html.bat"
-                )
-                
-                # Run the bat file to convert LaTeX to HTML
-                # Pass just the filename since we're working in the temp directory
-                tex_filename = os.path.basename(tex_file_path)
-                result = subprocess.run(
-                    [bat_file_path, tex_filename, temp_dir],
-                    capture_output=True,
-                    text=True,
-                    cwd=temp_dir
+                converter = HTMLService._converter()
+                entry["renderer"] = converter
+                cache_key = html_cache.make_key(content, converter, {"jobname": "fragment"})
+                archive = html_cache.get(cache_key)
+                if archive is None:
+                    entry["cached"] = False
+                    archive = await convert(content, converter, cache_key)
+            except HTTPException as e:
+                entry["error"] = e.detail
+                return entry
+            html = HTMLService._load_html(cache_key, archive, "fragment")[0].decode("utf-8", errors="replace")
+            # Fragments share one page, so their asset links must be absolute
+            prefix = f"/compile-html/result/{cache_key}/"
+            entry["styles"] = [prefix + href for href in STYLESHEET.findall(html)]
+            body = BODY.search(html)
+            entry["html"] = RELATIVE_URL.sub(
+                lambda m: f"{m.group(1)}={m.group(2)}{prefix}{m.group(3)}{m.group(2)}",
+                body.group(1) if body else html,
+            )
+            return entry
+
+        rendered = await asyncio.gather(*(render(counters, fragment) for counters, fragment in fragments))
+        return {"fragments": list(rendered)}
+
+    @staticmethod
+    async def get_asset(cache_key: str, name: str) -> Response:
+        """Serve one file from a cached conversion."""
+        archive = html_cache.get(cache_key, count=False) if CACHE_KEY.match(cache_key) else None
+        if archive is None:
+            raise HTTPException(
+                status_code=404,
+                detail="HTML conversion not found"
+            )
+        with zipfile.ZipFile(archive) as zf:
+            try:
+                data = zf.read(name)
+            except KeyError:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Asset not found: {name}"
                 )
-                
-                if result.returncode != 0:
-                    # Capture both stdout and stderr for better debugging
-                    error_details = f"Return code: {result.returncode}\n"
-                    if result.stdout:
-                        error_details += f"STDOUT:\n{result.stdout}\n"
-                    if result.stderr:
-                        error_details += f"STDERR:\n{result.stderr}\n"
-                    
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"LaTeX to HTML conversion failed: {error_details}"
-                    )
-                
-                # Get the generated HTML file path
-                basename = Path(file.filename).stem
-                html_file_path = os.path.join(temp_dir, f"{basename}.html")
-                
-                if not os.path.exists(html_file_path):
-                    raise HTTPException(
-                        status_code=500,
-                        detail="HTML file was not generated"
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        return Response(
+            content=data,
+            media_type=media_type,
+            headers={"Cache-Control": "public, max-age=31536000, immutable"}
+        )
+
+    @staticmethod
+    def _load_html(cache_key: str, archive: Path, stem: str) -> tuple[bytes, list[str]]:
+        if cache_key in _recent_html:
+            _recent_html.move_to_end(cache_key)
+            return _recent_html[cache_key]
+        with zipfile.ZipFile(archive) as zf:
+            html = zf.read(f"{stem}.html")
+            assets = [name for name in zf.namelist() if name != f"{stem}.html"]
+        if assets:
+            # Relative links to CSS and images resolve against the asset route
+            base = f'<base href="/compile-html/result/{cache_key}/">'.encode("utf-8")
+            html = HEAD_TAG.sub(lambda m: m.group(0) + base, html, count=1)
+        _recent_html[cache_key] = (html, assets)
+        while len(_recent_html) > HTML_MEMORY_ENTRIES:
+            _recent_html.popitem(last=False)
+        return html, assets
+
+    @staticmethod
+    def _converter() -> str:
+        choices = HTML_CONVERTERS if settings.html_converter == "auto" else (settings.html_converter,)
+        for converter in choices:
+            if shutil.which(converter):
+                return converter
+        raise HTTPException(
+            status_code=500,
+            detail="No LaTeX to HTML converter found. Please install make4ht (TeX Live) or pandoc"
+        )
+
+    @staticmethod
+    async def _convert(
+        content: bytes,
+        filename: str,
+        converter: str,
+        cache_key: str,
+        session_id: str | None,
+    ) -> Path:
+        async with workspace_manager.acquire(session_id) as work_dir:
+            # tex4ht writes its own .aux; keep it away from the PDF build's
+            html_dir = work_dir / "html"
+            out_dir = html_dir / "out"
+            shutil.rmtree(out_dir, ignore_errors=True)
+            out_dir.mkdir(parents=True)
+            tex_file = html_dir / Path(filename).name
+            tex_file.unlink(missing_ok=True)
+            tex_file.write_bytes(content)
+
+            try:
+                async with compile_executor.slot():
+                    result = await compile_executor.run_process(
+                        converter_command(converter, tex_file, out_dir),
+                        cwd=html_dir,
                     )
-                
-                # Create a temporary file to return (outside the temp directory)
-                with tempfile.NamedTemporaryFile(mode='w+b', suffix='.html', delete=False) as temp_html:
-                    # Copy the generated HTML content to the temporary file
-                    with open(html_file_path, 'rb') as source:
-                        temp_html.write(source.read())
-                    
-                    temp_html_path = temp_html.name
-                
-                # Return the HTML file as FileResponse
-                return FileResponse(
-                    path=temp_html_path,
-                    filename=f"{basename}.html",
-                    media_type="text/html",
-                    headers={"Content-Disposition": f"attachment; filename={basename}.html"}
-                )
-                
-            except subprocess.CalledProcessError as e:
+            except CompileQueueFullError as e:
+                raise queue_full_error(e)
+            except FileNotFoundError:
                 raise HTTPException(
                     status_code=500,
-                    detail=f"Conversion process failed: {str(e)}"
+                    detail=f"{converter} not found. Please install make4ht (TeX Live) or pandoc"
+                )
+
+            html_file = out_dir / f"{tex_file.stem}.html"
+            if result.limit:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"LaTeX to HTML conversion exceeded its {result.limit} limit"
                 )
-            except Exception as e:
+            if result.returncode != 0 or not html_file.exists():
+                output = (result.stdout + result.stderr).strip()
                 raise HTTPException(
-                    status_code=500,
-                    detail=f"Unexpected error during conversion: {str(e)}"
+                    status_code=400,
+                    detail=f"LaTeX to HTML conversion failed: {output[-2000:]}"
                 )
-        
-        
 
-        
\ No newline at end of file
+            archive = html_dir / "out.zip"
+            # A zip left by the previous conversion is hard-linked into the
+            # cache; truncating it would corrupt that entry
+            archive.unlink(missing_ok=True)
+            try:
+                with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+                    for path in sorted(out_dir.rglob("*")):
+                        if path.is_file():
+                            zf.write(path, path.relative_to(out_dir).as_posix())
+                logger.info(f"HTML: Converted {filename} with {converter}")
+                return html_cache.put(cache_key, archive)
+            finally:
+                # The cache now owns the output; don't keep a second copy
+                archive.unlink(missing_ok=True)
+                shutil.rmtree(out_dir, ignore_errors=True)
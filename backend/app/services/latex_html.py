@@ -0,0 +1,775 @@
+import html
+import re
+from datetime import date
+
+from app.services.format_cache import split_preamble
+
+# Page furniture for standalone fast-path documents
+MATHJAX = '<script defer src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-chtml.js"></script>'
+STYLE = (
+    "<style>body{max-width:48em;margin:2em auto;padding:0 1em;font-family:serif;line-height:1.5}"
+    ".center{text-align:center}figure{text-align:center}table{border-collapse:collapse;margin:auto}"
+    "td,th{padding:.2em .6em}.title{text-align:center}.abstract{margin:1em 3em}"
+    ".parbox{display:inline-block;vertical-align:top}.frame{border:1px solid #ccc;padding:1em;margin:1em 0}</style>"
+)
+
+TOKEN = re.compile(
+    r"\\(?:[A-Za-z@]+\*?|.)"        # control word or symbol
+    r"|%[^\n]*(?:\n[ \t]*)?"        # comment, with the line end TeX swallows
+    r"|\n[ \t]*(?:\n[ \t]*)+"       # blank line(s): paragraph break
+    r"|\$\$|[{}$~&\n]|``|''|---|--"
+    r"|[^\\%{}$~&`'\n-]+"
+    r"|.",
+    re.S,
+)
+
+SECTIONS = {"part": 1, "chapter": 1, "section": 2, "subsection": 3, "subsubsection": 4, "paragraph": 5, "subparagraph": 6}
+INLINE_TAGS = {
+    "emph": "em", "textit": "i", "textsl": "i", "textbf": "strong", "texttt": "code",
+    "underline": "u", "textsc": "span", "textrm": "span", "textsf": "span", "textup": "span",
+    "textmd": "span", "textnormal": "span", "mbox": "span", "text": "span",
+}
+SYMBOLS = {
+    "\\": "<br>", "newline": "<br>", "%": "%", "&": "&amp;", "#": "#", "_": "_", "$": "$",
+    "{": "{", "}": "}", " ": " ", ",": "&thinsp;", ";": "&ensp;", "-": "", "@": "", "/": "",
+    "LaTeX": "LaTeX", "TeX": "TeX", "ldots": "&hellip;", "dots": "&hellip;", "textbackslash": "\\",
+    "copyright": "&copy;", "S": "&sect;", "quad": "&emsp;", "qquad": "&emsp;&emsp;",
+    "textasciitilde": "~", "textasciicircum": "^", "textbar": "|", "textless": "&lt;",
+    "textgreater": "&gt;", "textendash": "&ndash;", "textemdash": "&mdash;",
+}
+# Layout and font switches that only change appearance
+IGNORED = {
+    "noindent", "centering", "raggedright", "raggedleft", "hfill", "vfill", "clearpage",
+    "newpage", "pagebreak", "linebreak", "smallskip", "medskip", "bigskip", "indent",
+    "tiny", "scriptsize", "footnotesize", "small", "normalsize", "large", "Large", "LARGE",
+    "huge", "Huge", "bfseries", "itshape", "ttfamily", "rmfamily", "sffamily", "scshape",
+    "upshape", "slshape", "mdseries", "normalfont", "em", "hline", "toprule", "midrule",
+    "bottomrule", "protect", "phantomsection", "relax", "nopagebreak", "frenchspacing",
+    "bf", "it", "tt", "sc", "rm", "sf", "sl",
+}
+# Layout commands and how many arguments they take
+IGNORED_WITH_ARGS = {
+    "vspace": 1, "vspace*": 1, "hspace": 1, "hspace*": 1, "thispagestyle": 1, "pagestyle": 1, "cline": 1,
+    "setlength": 2, "addtolength": 2, "setbeamercolor": 2,
+}
+MATH_ENVIRONMENTS = {
+    "equation", "equation*", "align", "align*", "gather", "gather*", "multline", "multline*",
+    "eqnarray", "eqnarray*", "displaymath", "flalign", "flalign*", "alignat", "alignat*",
+}
+BLOCK_ENVIRONMENTS = {
+    "center": '<div class="center">', "flushleft": '<div class="flushleft">', "titlepage": '<div class="titlepage">',
+    "flushright": '<div class="flushright">', "quote": "<blockquote>", "quotation": "<blockquote>",
+}
+LIST_TAGS = {"itemize": "ul", "enumerate": "ol", "description": "dl"}
+NEWTHEOREM = re.compile(r"\\newtheorem(\*?)\s*\{([^}]*)\}\s*(?:\[([^\]]*)\])?\s*\{([^}]*)\}\s*(?:\[([^\]]*)\])?")
+ALIGN = {"l": "left", "c": "center", "r": "right", "p": "left", "m": "left", "b": "left", "X": "left"}
+DEFINE_COMMANDS = {"newcommand", "renewcommand", "providecommand"}
+# \newcommand and friends, or a \def without parameters
+DEFINITION = re.compile(r"\\(newcommand|renewcommand|providecommand)\*?(?![A-Za-z@])|\\def\s*\\([A-Za-z@]+)\s*(?=\{)")
+COMMENT = re.compile(r"(?<!\\)%[^\n]*")
+# fontawesome icons, rendered as Font Awesome class hooks
+ICON = re.compile(r"fa[A-Z][A-Za-z]*")
+# Link schemes that can't run script in the page
+SAFE_SCHEMES = {"http", "https", "mailto"}
+CONTROL_WORD_END = re.compile(r"\\[A-Za-z@]+$")
+# Guards against macros that expand forever
+MAX_EXPANSIONS = 10000
+
+
+class UnsupportedLatex(Exception):
+    """The source uses something the fast path can't render faithfully."""
+
+
+class _Par:
+    pass
+
+
+class _Item:
+    def __init__(self, label: str | None, key: str | None = None):
+        self.label = label
+        self.key = key
+
+
+PAR = _Par()
+CELL = object()
+ROW = object()
+
+
+class _Renderer:
+    def __init__(self, source: str, counters: dict[str, int] | None = None, chapters: bool = False):
+        self.src = source
+        self.pos = 0
+        self.chapters = chapters
+        self.counters = {"part": 0, "chapter": 0, "section": 0, "subsection": 0, "subsubsection": 0,
+                         "figure": 0, "table": 0}
+        self.counters.update(counters or {})
+        self.labels: dict[str, str] = {}
+        self.current_label = ""
+        self.footnotes: list[str] = []
+        self.title: dict[str, str] = {}
+        # name -> (heading, counter it numbers with, counter it resets within)
+        self.theorems: dict[str, tuple[str, str | None, str | None]] = {}
+        self.toc: list[tuple[int, str, str]] = []
+        self.bibliography: dict[str, int] = {}
+        # name -> (argument count, default of an optional first argument, body)
+        self.macros: dict[str, tuple[int, str | None, str]] = {}
+        self.expansions = [0]
+
+    # -- scanning ----------------------------------------------------------
+
+    def _token(self) -> str | None:
+        if self.pos >= len(self.src):
+            return None
+        match = TOKEN.match(self.src, self.pos)
+        self.pos = match.end()
+        return match.group(0)
+
+    def _skip_space(self) -> None:
+        while self.pos < len(self.src) and self.src[self.pos] in " \t\n":
+            if self.src.startswith("\n", self.pos) and re.match(r"\n[ \t]*\n", self.src[self.pos:]):
+                return
+            self.pos += 1
+
+    def _raw_group(self) -> str:
+        """Raw text of the next `{...}` argument."""
+        self._skip_space()
+        if not self.src.startswith("{", self.pos):
+            # A single-token argument, as in `\textbf x`
+            if self.pos >= len(self.src):
+                raise UnsupportedLatex("missing argument")
+            if self.src[self.pos] == "\\":
+                return self._token()
+            self.pos += 1
+            return self.src[self.pos - 1]
+        depth, start = 0, self.pos
+        while self.pos < len(self.src):
+            char = self.src[self.pos]
+            if char == "\\":
+                self.pos += 2
+                continue
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    return self.src[start + 1:self.pos - 1]
+            self.pos += 1
+        raise UnsupportedLatex("unbalanced braces")
+
+    def _optional(self) -> str | None:
+        saved = self.pos
+        self._skip_space()
+        if not self.src.startswith("[", self.pos):
+            self.pos = saved
+            return None
+        depth, start = 0, self.pos
+        while self.pos < len(self.src):
+            char = self.src[self.pos]
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+            elif char == "]" and depth == 0:
+                self.pos += 1
+                return self.src[start + 1:self.pos - 1]
+            self.pos += 1
+        raise UnsupportedLatex("unterminated optional argument")
+
+    def _until(self, end: str) -> str:
+        index = self.src.find(end, self.pos)
+        if index < 0:
+            raise UnsupportedLatex(f"missing {end}")
+        text = self.src[self.pos:index]
+        self.pos = index + len(end)
+        return text
+
+    # -- rendering ---------------------------------------------------------
+
+    def _inline(self, text: str) -> str:
+        """Render a fragment of source as inline HTML."""
+        sub = _Renderer(text, chapters=self.chapters)
+        sub.counters, sub.labels, sub.footnotes = self.counters, self.labels, self.footnotes
+        sub.theorems, sub.toc, sub.bibliography = self.theorems, self.toc, self.bibliography
+        sub.macros, sub.expansions = self.macros, self.expansions
+        sub.current_label = self.current_label
+        return "".join(s for s in sub._parse() if isinstance(s, str))
+
+    def _parse(self, end_env: str | None = None, stop_at_brace: bool = False) -> list:
+        out: list = []
+        while True:
+            token = self._token()
+            if token is None:
+                if end_env:
+                    raise UnsupportedLatex(f"missing \\end{{{end_env}}}")
+                if stop_at_brace:
+                    raise UnsupportedLatex("unbalanced braces")
+                return out
+            if token == "}":
+                if stop_at_brace:
+                    return out
+                raise UnsupportedLatex("unbalanced braces")
+            if token == "{":
+                out.extend(self._parse(stop_at_brace=True))
+            elif token.startswith("%"):
+                continue
+            elif token.startswith("\n") and len(token.strip(" \t")) > 1:
+                out.append(PAR)
+            elif token == "\n":
+                out.append(" ")
+            elif token == "~":
+                out.append("&nbsp;")
+            elif token == "&":
+                out.append(CELL)
+            elif token == "``":
+                out.append("&ldquo;")
+            elif token == "''":
+                out.append("&rdquo;")
+            elif token == "---":
+                out.append("&mdash;")
+            elif token == "--":
+                out.append("&ndash;")
+            elif token == "$$":
+                out.append(self._display_math(self._until("$$")))
+            elif token == "$":
+                out.append(self._inline_math(self._until("$")))
+            elif token.startswith("\\"):
+                result = self._command(token[1:], end_env)
+                if result is StopIteration:
+                    return out
+                out.extend(result)
+            else:
+                out.append(html.escape(token, quote=False))
+
+    def _command(self, name: str, end_env: str | None) -> list:
+        if name == "\\":
+            self._optional()
+            return [ROW] if end_env in ("tabular", "tabular*", "tabularx") else ["<br>"]
+        if re.fullmatch(r"[A-Za-z@]+\*?", name):
+            self._skip_space()
+        if name in self.macros:
+            self._expand(name)
+            return []
+        if name.rstrip("*") in DEFINE_COMMANDS:
+            self._define(name.rstrip("*"))
+            return []
+        if name in SYMBOLS:
+            return [SYMBOLS[name]]
+        if name in IGNORED:
+            return []
+        if name in IGNORED_WITH_ARGS:
+            for _ in range(IGNORED_WITH_ARGS[name]):
+                self._raw_group()
+            return []
+        if ICON.fullmatch(name):
+            icon = re.sub(r"(?<!^)([A-Z])", r"-\1", name[2:]).lower()
+            return [f'<i class="fa fa-{icon}" aria-hidden="true"></i>']
+        if name == "par":
+            return [PAR]
+        if name == "today":
+            return [date.today().strftime("%B %d, %Y").replace(" 0", " ")]
+        if name in INLINE_TAGS:
+            tag = INLINE_TAGS[name]
+            return [f"<{tag}>{self._inline(self._raw_group())}</{tag}>"]
+        if name == "(":
+            return [self._inline_math(self._until("\\)"))]
+        if name == "[":
+            return [self._display_math(self._until("\\]"))]
+        if name == "verb" or name == "verb*":
+            delimiter = self.src[self.pos]
+            self.pos += 1
+            return [f"<code>{html.escape(self._until(delimiter))}</code>"]
+        if name == "href":
+            url = _safe_url(self._raw_group())
+            text = self._inline(self._raw_group())
+            return [f'<a href="{html.escape(url)}">{text}</a>' if url else text]
+        if name == "url":
+            text = self._raw_group()
+            url = _safe_url(text)
+            return [f'<a href="{html.escape(url)}">{html.escape(text)}</a>' if url else html.escape(text)]
+        if name == "parbox":
+            for _ in range(3):
+                self._optional()
+            self._raw_group()
+            return [f'<span class="parbox">{self._inline(self._raw_group())}</span>']
+        if name == "raisebox":
+            self._raw_group()
+            self._optional()
+            self._optional()
+            return [f"<span>{self._inline(self._raw_group())}</span>"]
+        if name == "label":
+            key = self._raw_group().strip()
+            self.labels[key] = self.current_label
+            return [f'<a id="{html.escape(key)}"></a>']
+        if name in ("ref", "autoref", "pageref"):
+            return [f"\0ref:{self._raw_group().strip()}\0"]
+        if name in ("cite", "citep", "citet"):
+            note = self._optional()
+            keys = [f"\0cite:{key.strip()}\0" for key in self._raw_group().split(",")]
+            return [f"[{', '.join(keys)}{', ' + self._inline(note) if note else ''}]"]
+        if name == "bibitem":
+            self._optional()
+            return [_Item(None, key=self._raw_group().strip())]
+        if name == "rule":
+            self._optional()
+            self._raw_group()
+            self._raw_group()
+            return [("block", "<hr>")]
+        if name == "tableofcontents":
+            return [("block", "\0toc\0")]
+        if name == "addcontentsline":
+            self._raw_group()
+            kind = self._raw_group().strip()
+            self.toc.append((SECTIONS.get(kind, 2), "", self._inline(self._raw_group())))
+            return []
+        if name in ("footnote", "thanks"):
+            self.footnotes.append(self._inline(self._raw_group()))
+            n = len(self.footnotes)
+            return [f'<sup><a href="#fn{n}" id="fnref{n}">{n}</a></sup>']
+        if name in ("title", "author", "date"):
+            self.title[name] = self._inline(self._raw_group())
+            return []
+        if name in ("maketitle", "titlepage"):
+            return [self._maketitle()]
+        if name in ("frametitle", "framesubtitle"):
+            self._optional()
+            return [(name, self._inline(self._raw_group()))]
+        if name.rstrip("*") in SECTIONS:
+            return [self._heading(name.rstrip("*"), name.endswith("*"))]
+        if name == "item":
+            label = self._optional()
+            return [_Item(self._inline(label) if label is not None else None)]
+        if name == "includegraphics":
+            return [self._image(self._optional(), self._raw_group())]
+        if name == "caption":
+            self._optional()
+            return [("caption", self._inline(self._raw_group()))]
+        if name == "multicolumn":
+            span = self._raw_group()
+            self._raw_group()
+            return [("multicolumn", int(span), self._inline(self._raw_group()))]
+        if name == "begin":
+            return self._environment(self._raw_group().strip())
+        if name == "end":
+            env = self._raw_group().strip()
+            if env != end_env:
+                raise UnsupportedLatex(f"unexpected \\end{{{env}}}")
+            return StopIteration
+        raise UnsupportedLatex(f"\\{name}")
+
+    def _define(self, kind: str) -> None:
+        """Record a `\\newcommand`-style definition whose name comes next."""
+        self._skip_space()
+        name = self._raw_group().strip() if self.src.startswith("{", self.pos) else self._token()
+        if not name or not re.fullmatch(r"\\[A-Za-z@]+", name):
+            raise UnsupportedLatex(f"\\{kind} of {name}")
+        count = self._optional()
+        default = self._optional() if count is not None else None
+        body = self._raw_group()
+        if not (count or "0").strip().isdigit():
+            raise UnsupportedLatex(f"\\{kind} with {count} arguments")
+        if kind == "providecommand" and name[1:] in self.macros:
+            return
+        self.macros[name[1:]] = (int(count or 0), default, body)
+
+    def _expand(self, name: str) -> None:
+        """Replace a user macro and its arguments with its body, in the source."""
+        self.expansions[0] += 1
+        if self.expansions[0] > MAX_EXPANSIONS:
+            raise UnsupportedLatex(f"\\{name} keeps expanding")
+        count, default, body = self.macros[name]
+        args = []
+        if default is not None:
+            optional = self._optional()
+            args.append(default if optional is None else optional)
+        while len(args) < count:
+            args.append(self._raw_group())
+
+        def argument(match: re.Match) -> str:
+            if match.group(1) == "#":
+                return "#"
+            index = int(match.group(1))
+            if index > count:
+                raise UnsupportedLatex(f"\\{name} uses #{index}")
+            # TeX substitutes tokens: `\\small#1` must not become one control word
+            if CONTROL_WORD_END.search(match.string, 0, match.start()):
+                return " " + args[index - 1]
+            return args[index - 1]
+
+        expansion = re.sub(r"#(#|[1-9])", argument, body)
+        if CONTROL_WORD_END.search(expansion):
+            expansion += " "
+        self.src = expansion + self.src[self.pos:]
+        self.pos = 0
+
+    def _inline_math(self, math: str) -> str:
+        return f'<span class="math inline">\\({html.escape(math, quote=False)}\\)</span>'
+
+    def _display_math(self, math: str) -> str:
+        return ("block", f'<div class="math display">\\[{html.escape(math, quote=False)}\\]</div>')
+
+    def _heading(self, kind: str, starred: bool) -> tuple:
+        self._optional()
+        title = self._inline(self._raw_group())
+        level = SECTIONS[kind]
+        number = ""
+        if not starred and kind in self.counters:
+            self.counters[kind] += 1
+            order = ["chapter", "section", "subsection", "subsubsection"]
+            for name, (_, counter, within) in self.theorems.items():
+                if within == kind and counter:
+                    self.counters[counter] = 0
+            if kind in order:
+                for lower in order[order.index(kind) + 1:]:
+                    self.counters[lower] = 0
+                start = 0 if self.chapters else 1
+                parts = [str(self.counters[k]) for k in order[start:order.index(kind) + 1]]
+                number = ".".join(parts)
+                self.current_label = number
+            elif kind == "part":
+                number = f"Part {_roman(self.counters['part'])}"
+        prefix = f'<span class="secnum">{number}</span> ' if number else ""
+        anchor = f"sec-{number.replace(' ', '-')}" if number else f"sec-u{len(self.toc) + 1}"
+        if not starred:
+            self.toc.append((level, number, f'<a href="#{anchor}">{title}</a>'))
+        return ("block", f'<h{level} id="{anchor}">{prefix}{title}</h{level}>')
+
+    def _maketitle(self) -> tuple:
+        parts = [f'<h1 class="title">{self.title.get("title", "")}</h1>']
+        for name in ("author", "institute"):
+            if self.title.get(name):
+                parts.append(f'<p class="title">{self.title[name]}</p>')
+        parts.append(f'<p class="title">{self.title.get("date", date.today().strftime("%B %d, %Y"))}</p>')
+        return ("block", "".join(parts))
+
+    def _image(self, options: str | None, path: str) -> str:
+        style = ""
+        width = re.search(r"width\s*=\s*([\d.]*)\s*\\(?:text|line|column)width", options or "")
+        if width:
+            style = f' style="width:{float(width.group(1) or 1) * 100:g}%"'
+        path = path.strip()
+        return f'<img src="{html.escape(path)}" alt="{html.escape(path)}"{style}>'
+
+    def _environment(self, env: str) -> list:
+        if env in MATH_ENVIRONMENTS:
+            end = f"\\end{{{env}}}"
+            math = f"\\begin{{{env}}}{self._until(end)}{end}"
+            return [("block", f'<div class="math display">{html.escape(math, quote=False)}</div>')]
+        if env == "verbatim":
+            text = self._until("\\end{verbatim}").strip("\n")
+            return [("block", f"<pre>{html.escape(text)}</pre>")]
+        if env in LIST_TAGS:
+            # enumitem options only change spacing and labels
+            self._optional()
+            return [("block", self._list(env))]
+        if env in ("multicols", "multicols*"):
+            columns = self._raw_group().strip()
+            if not columns.isdigit():
+                raise UnsupportedLatex(f"{env} with {columns} columns")
+            body = _assemble(self._parse(end_env=env))
+            return [("block", f'<div style="column-count:{columns}">{body}</div>')]
+        if env == "frame":
+            return [("block", self._frame())]
+        if env in ("tabular", "tabular*", "tabularx"):
+            if env != "tabular":
+                self._raw_group()
+            return [("block", self._tabular(env))]
+        if env in ("figure", "figure*", "table", "table*"):
+            self._optional()
+            kind = env.rstrip("*")
+            self.counters[kind] += 1
+            previous, self.current_label = self.current_label, str(self.counters[kind])
+            content = self._parse(end_env=env)
+            self.current_label = previous
+            caption = next((s[1] for s in content if isinstance(s, tuple) and s[0] == "caption"), None)
+            body = _assemble([s for s in content if not (isinstance(s, tuple) and s[0] == "caption")])
+            figcaption = f"<figcaption>{kind.title()} {self.counters[kind]}: {caption}</figcaption>" if caption else ""
+            if kind == "table":
+                return [("block", f'<figure class="table">{figcaption}{body}</figure>')]
+            return [("block", f"<figure>{body}{figcaption}</figure>")]
+        if env in BLOCK_ENVIRONMENTS:
+            opening = BLOCK_ENVIRONMENTS[env]
+            closing = "</blockquote>" if opening == "<blockquote>" else "</div>"
+            return [("block", f"{opening}{_assemble(self._parse(end_env=env))}{closing}")]
+        if env == "thebibliography":
+            self._raw_group()
+            entries = []
+            for segment in self._parse(end_env=env):
+                if isinstance(segment, _Item):
+                    self.bibliography[segment.key] = len(entries) + 1
+                    entries.append((segment.key, []))
+                elif entries:
+                    entries[-1][1].append(segment)
+            items = "".join(
+                f'<li id="cite-{html.escape(key)}">{_assemble(content, inline=True)}</li>'
+                for key, content in entries
+            )
+            heading = "Bibliography" if self.chapters else "References"
+            return [("block", f'<h2>{heading}</h2><ol class="bibliography">{items}</ol>')]
+        if env == "proof":
+            note = self._optional()
+            title = self._inline(note) if note else "Proof"
+            body = _assemble(self._parse(end_env=env), inline=True)
+            return [("block", f'<div class="proof"><em>{title}.</em> {body} &#8718;</div>')]
+        if env.rstrip("*") in self.theorems:
+            return [("block", self._theorem(env))]
+        if env == "abstract":
+            body = _assemble(self._parse(end_env=env))
+            return [("block", f'<div class="abstract"><h3 class="center">Abstract</h3>{body}</div>')]
+        if env == "minipage":
+            self._optional()
+            self._raw_group()
+            return [("block", f"<div>{_assemble(self._parse(end_env=env))}</div>")]
+        raise UnsupportedLatex(f"environment {env}")
+
+    def _frame(self) -> str:
+        self._optional()
+        titles = []
+        for _ in range(2):
+            self._skip_space()
+            if self.src.startswith("{", self.pos):
+                titles.append(self._inline(self._raw_group()))
+        content = self._parse(end_env="frame")
+        for segment in content:
+            if isinstance(segment, tuple) and segment[0] in ("frametitle", "framesubtitle"):
+                titles.append(segment[1])
+        body = _assemble([s for s in content if not (isinstance(s, tuple) and s[0] in ("frametitle", "framesubtitle"))])
+        headings = "".join(f"<h{2 + i}>{title}</h{2 + i}>" for i, title in enumerate(titles[:2]))
+        return f'<section class="frame">{headings}{body}</section>'
+
+    def _theorem(self, env: str) -> str:
+        heading, counter, within = self.theorems[env.rstrip("*")]
+        note = self._optional()
+        number = ""
+        if counter and not env.endswith("*"):
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+            number = str(self.counters[counter])
+            if within:
+                number = f"{self.counters.get(within, 0)}.{number}"
+            self.current_label = number
+        title = f"{heading} {number}".strip()
+        if note:
+            title += f" ({self._inline(note)})"
+        body = _assemble(self._parse(end_env=env), inline=True)
+        return f'<div class="theorem"><strong>{title}.</strong> <em>{body}</em></div>'
+
+    def _list(self, env: str) -> str:
+        content = self._parse(end_env=env)
+        items: list[tuple[str | None, list]] = []
+        for segment in content:
+            if isinstance(segment, _Item):
+                items.append((segment.label, []))
+            elif items:
+                items[-1][1].append(segment)
+            elif segment is not PAR and not (isinstance(segment, str) and not segment.strip()):
+                raise UnsupportedLatex(f"text before the first \\item in {env}")
+        tag = LIST_TAGS[env]
+        if tag == "dl":
+            body = "".join(f"<dt>{label or ''}</dt><dd>{_assemble(seg, inline=True)}</dd>" for label, seg in items)
+        else:
+            body = "".join(
+                f"<li>{_assemble(seg, inline=True)}</li>" if label is None
+                else f'<li class="custom">{label} {_assemble(seg, inline=True)}</li>'
+                for label, seg in items
+            )
+        return f"<{tag}>{body}</{tag}>"
+
+    def _tabular(self, env: str) -> str:
+        self._optional()
+        spec = _column_spec(self._raw_group()).replace("|", "")
+        spec = re.sub(r"([pmbX])(\{[^}]*\})?", r"\1", spec)
+        aligns = [ALIGN[c] for c in spec if c in ALIGN]
+        content = self._parse(end_env=env)
+        rows: list[list] = [[[]]]
+        for segment in content:
+            if segment is ROW:
+                rows.append([[]])
+            elif segment is CELL:
+                rows[-1].append([])
+            else:
+                rows[-1][-1].append(segment)
+        html_rows = []
+        for row in rows:
+            cells, column = [], 0
+            for cell in row:
+                multi = next((s for s in cell if isinstance(s, tuple) and s[0] == "multicolumn"), None)
+                if multi:
+                    cells.append(f'<td colspan="{multi[1]}" style="text-align:center">{multi[2]}</td>')
+                    column += multi[1]
+                    continue
+                align = aligns[column] if column < len(aligns) else "left"
+                cells.append(f'<td style="text-align:{align}">{_assemble(cell, inline=True).strip()}</td>')
+                column += 1
+            # The trailing `\\` (and rules) leave an empty last row behind
+            if len(cells) == 1 and cells[0].endswith("></td>"):
+                continue
+            html_rows.append(f"<tr>{''.join(cells)}</tr>")
+        return f"<table>{''.join(html_rows)}</table>"
+
+    def render(self) -> str:
+        body = _assemble(self._parse())
+        if self.footnotes:
+            notes = "".join(
+                f'<li id="fn{n}">{note} <a href="#fnref{n}">&#8617;</a></li>'
+                for n, note in enumerate(self.footnotes, start=1)
+            )
+            body += f'<section class="footnotes"><hr><ol>{notes}</ol></section>'
+        body = re.sub("\0ref:([^\0]*)\0", lambda m: self._ref(m.group(1)), body)
+        body = re.sub("\0cite:([^\0]*)\0", lambda m: self._cite(m.group(1)), body)
+        return body.replace("\0toc\0", self._contents())
+
+    def _cite(self, key: str) -> str:
+        number = self.bibliography.get(key)
+        if number is None:
+            return "?"
+        return f'<a href="#cite-{html.escape(key)}">{number}</a>'
+
+    def _contents(self) -> str:
+        entries = "".join(
+            f'<li class="toc-{level}">{number + " " if number else ""}{title}</li>'
+            for level, number, title in self.toc
+        )
+        return f'<nav class="toc"><h2>Contents</h2><ul>{entries}</ul></nav>'
+
+
+    def _ref(self, key: str) -> str:
+        number = self.labels.get(key)
+        if number is None:
+            return "??"
+        return f'<a href="#{html.escape(key)}">{number}</a>'
+
+
+def _safe_url(url: str) -> str | None:
+    """`url` if it uses an allowed scheme, else None."""
+    # Browsers ignore control characters and spaces inside a scheme
+    scheme = re.match(r"([a-z][a-z0-9+.-]*):", re.sub(r"[\x00-\x20]", "", url).lower())
+    if scheme is None or scheme.group(1) not in SAFE_SCHEMES:
+        return None
+    return url.strip()
+
+
+def _column_spec(spec: str) -> str:
+    """Drop `@{...}`, `!{...}`, `>{...}` and `<{...}` insertions, nested braces included."""
+    out, index = [], 0
+    while index < len(spec):
+        if spec[index] in "@!<>" and spec.startswith("{", index + 1):
+            depth, index = 0, index + 1
+            while index < len(spec):
+                depth += {"{": 1, "}": -1}.get(spec[index], 0)
+                index += 1
+                if depth == 0:
+                    break
+            continue
+        out.append(spec[index])
+        index += 1
+    return "".join(out)
+
+
+def _preamble_macros(preamble: str) -> dict[str, tuple[int, str | None, str]]:
+    """Macros the preamble defines with `\\newcommand` or a parameterless `\\def`.
+
+    Definitions the renderer can't read are left out; the body then fails
+    on the undefined macro only if it actually uses it.
+    """
+    scanner = _Renderer(preamble)
+    for match in DEFINITION.finditer(preamble):
+        if match.start() < scanner.pos:
+            # Inside the body of the previous definition
+            continue
+        scanner.pos = match.end()
+        try:
+            if match.group(1):
+                scanner._define(match.group(1))
+            else:
+                scanner.macros[match.group(2)] = (0, None, scanner._raw_group())
+        except UnsupportedLatex:
+            continue
+    return scanner.macros
+
+
+def _roman(n: int) -> str:
+    numerals = [(1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+                (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I")]
+    out = ""
+    for value, numeral in numerals:
+        while n >= value:
+            out += numeral
+            n -= value
+    return out
+
+
+def _assemble(segments: list, inline: bool = False) -> str:
+    """Join rendered segments, wrapping runs of inline text in paragraphs."""
+    parts: list[str] = []
+    paragraph: list[str] = []
+
+    def flush():
+        text = "".join(paragraph).strip()
+        if text:
+            parts.append(text if inline else f"<p>{text}</p>")
+        paragraph.clear()
+
+    for segment in segments:
+        if segment is PAR:
+            flush()
+            if inline:
+                parts.append("<br>")
+        elif isinstance(segment, tuple) and segment[0] == "block":
+            flush()
+            parts.append(segment[1])
+        elif isinstance(segment, str):
+            paragraph.append(segment)
+        else:
+            raise UnsupportedLatex("misplaced table or list syntax")
+    flush()
+    return "".join(parts).removesuffix("<br>")
+
+
+def render_fragment(preamble: str, body: str, counters: dict[str, int] | None = None) -> str:
+    """Render a piece of a document body to HTML without running TeX.
+
+    `preamble` supplies `\\title`, `\\author`, `\\date` and `\\institute`
+    for `\\maketitle`, the macros defined with `\\newcommand` (or `\\def`
+    without parameters), and tells whether the class numbers chapters.
+    Beamer frames, boxes and the usual resume packages (enumitem,
+    multicol, fontawesome) are covered; TikZ, `picture`, `\\def` with
+    parameters and anything else outside the supported subset raise
+    UnsupportedLatex, in which case the caller should use the full
+    toolchain instead.
+    """
+    preamble = COMMENT.sub("", preamble)
+    chapters = bool(re.search(r"\\documentclass\s*(\[[^\]]*\])?\s*\{(book|report|scrbook|scrreprt|memoir)\}", preamble))
+    renderer = _Renderer(body, counters, chapters)
+    renderer.macros.update(_preamble_macros(preamble))
+    for starred, name, shared, heading, within in NEWTHEOREM.findall(preamble):
+        counter = None if starred else (shared or name)
+        renderer.theorems[name] = (heading, counter, within or None)
+    for name in ("title", "author", "date", "institute"):
+        match = re.search(rf"\\{name}\s*(?:\[[^\]]*\])?\s*\{{", preamble)
+        if match:
+            scanner = _Renderer(preamble[match.end() - 1:])
+            scanner.macros = renderer.macros
+            renderer.title[name] = renderer._inline(scanner._raw_group())
+    return renderer.render()
+
+
+def render_document(source: str) -> str:
+    """Render a whole LaTeX document to a standalone HTML page.
+
+    Raises UnsupportedLatex when the fast path can't handle the source.
+    """
+    split = split_preamble(source)
+    if split is None:
+        raise UnsupportedLatex("no \\begin{document}")
+    preamble, rest = split
+    body = rest[rest.index("}") + 1:]
+    end = re.search(r"\\end\s*\{document\}", body)
+    if end is None:
+        raise UnsupportedLatex("missing \\end{document}")
+    content = render_fragment(preamble, body[:end.start()])
+    title = re.search(r"\\title\s*(?:\[[^\]]*\])?\s*\{([^{}]*)\}", COMMENT.sub("", preamble))
+    page_title = html.escape(title.group(1)) if title else "Document"
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{page_title}</title>'
+        f"{STYLE}{MATHJAX}</head><body>{content}</body></html>"
+    )
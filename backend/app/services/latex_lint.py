@@ -0,0 +1,335 @@
+import bisect
+import re
+from dataclasses import dataclass, asdict
+from typing import Any
+
+# Control words, control symbols, braces, comments and newlines are the only
+# tokens the checker cares about; everything in between is skipped by search()
+TOKEN = re.compile(r"\\([A-Za-z@]+\*?|.)|[{}%\n]", re.DOTALL)
+ENV_NAME = re.compile(r"\s*\{([^{}\s]*)\}")
+
+# Environments whose body is not tokenized by TeX
+VERBATIM_ENVS = {"verbatim", "verbatim*", "Verbatim", "lstlisting", "minted", "comment", "filecontents", "filecontents*"}
+# Commands whose first braced argument may contain stray %, { or }
+VERBATIM_ARG_COMMANDS = {"url", "href", "path", "nolinkurl"}
+# Commands whose arguments routinely hold half an environment, by the shape
+# of those arguments; their bodies are skipped rather than matched up
+DEFINITION_COMMANDS = {
+    "let": "let",
+    "def": "def", "gdef": "def", "edef": "def", "xdef": "def",
+    "newcommand": "command", "newcommand*": "command", "renewcommand": "command", "renewcommand*": "command",
+    "providecommand": "command", "providecommand*": "command",
+    "DeclareRobustCommand": "command", "DeclareRobustCommand*": "command",
+    "newenvironment": "environment", "newenvironment*": "environment",
+    "renewenvironment": "environment", "renewenvironment*": "environment",
+    "NewDocumentCommand": "document_command", "RenewDocumentCommand": "document_command",
+    "ProvideDocumentCommand": "document_command", "DeclareDocumentCommand": "document_command",
+    "NewDocumentEnvironment": "document_environment", "RenewDocumentEnvironment": "document_environment",
+}
+# Commands that pull in other files, which may hold the preamble or body
+INPUT_COMMANDS = {"input", "include", "subfile", "import", "subimport"}
+CONDITIONAL = re.compile(r"\\(if[A-Za-z@]*|fi)(?![A-Za-z@])")
+# Commands named \if... that are not TeX conditionals and take no \fi
+NOT_CONDITIONALS = {"ifthenelse", "ifdefempty", "ifstrequal", "ifboolexpr", "ifbool", "iftoggle"}
+CONTROL_SEQUENCE = re.compile(r"\\([A-Za-z@]+|.)", re.DOTALL)
+
+MAX_ISSUES = 50
+
+
+@dataclass
+class LintIssue:
+    message: str
+    line: int
+    column: int
+    offset: int
+    # "error" when TeX is certain to fail, "warning" when it only might
+    severity: str = "error"
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class _Positions:
+    """Map string offsets to 1-based line/column."""
+
+    def __init__(self, source: str):
+        self._starts = [0] + [m.end() for m in re.finditer("\n", source)]
+
+    def issue(self, message: str, offset: int, severity: str = "error") -> LintIssue:
+        index = bisect.bisect_right(self._starts, offset) - 1
+        return LintIssue(
+            message=message,
+            line=index + 1,
+            column=offset - self._starts[index] + 1,
+            offset=offset,
+            severity=severity,
+        )
+
+
+def lint_latex(source: str, require_document: bool = True) -> list[LintIssue]:
+    """Cheap structural checks that catch sources TeX is certain to reject.
+
+    Reports unbalanced braces, mismatched `\\begin`/`\\end` pairs and, when
+    `require_document` is set, a missing `\\documentclass` or document body.
+    A `\\begin{document}` without a `\\documentclass` is always reported.
+    When the source pulls in other files (`\\input`, `\\include`...) those
+    two checks are only warnings, since the missing part may be in them.
+    This is not a parser: anything it can't be sure about (math delimiters,
+    macros that change catcodes) is left for TeX to judge, and the bodies of
+    macro definitions and `\\iffalse` blocks are skipped.
+    """
+    positions = _Positions(source)
+    issues: list[LintIssue] = []
+    braces: list[int] = []
+    envs: list[tuple[str, int, int]] = []  # (name, offset, brace depth)
+    includes_files = False
+    documentclass_at: int | None = None
+    document_at: int | None = None
+
+    pos = 0
+    length = len(source)
+    while len(issues) < MAX_ISSUES:
+        match = TOKEN.search(source, pos)
+        if match is None:
+            break
+        token = match.group(0)
+        start = match.start()
+        pos = match.end()
+
+        if token == "%":
+            newline = source.find("\n", pos)
+            pos = length if newline == -1 else newline
+        elif token == "\n":
+            continue
+        elif token == "{":
+            braces.append(start)
+        elif token == "}":
+            if braces:
+                braces.pop()
+            else:
+                issues.append(positions.issue("Unmatched '}'", start))
+        else:
+            name = match.group(1)
+            if name == "verb" or name == "verb*":
+                if pos < length:
+                    close = source.find(source[pos], pos + 1)
+                    newline = source.find("\n", pos + 1)
+                    if close == -1 or (newline != -1 and newline < close):
+                        issues.append(positions.issue("Unterminated \\verb", start))
+                        pos = length if newline == -1 else newline
+                    else:
+                        pos = close + 1
+            elif name in VERBATIM_ARG_COMMANDS:
+                pos = _skip_verbatim_arg(source, pos)
+            elif name in DEFINITION_COMMANDS:
+                pos, unclosed = _skip_definition(source, pos, DEFINITION_COMMANDS[name])
+                if unclosed is not None:
+                    issues.append(positions.issue(f"Unclosed '{{' in \\{name} definition", unclosed))
+            elif name == "iffalse":
+                pos = _skip_conditional(source, pos)
+                if pos == -1:
+                    issues.append(positions.issue("\\iffalse is never closed by \\fi", start))
+                    pos = length
+            elif name in INPUT_COMMANDS:
+                includes_files = True
+            elif name == "documentclass":
+                if documentclass_at is None:
+                    documentclass_at = start
+            elif name == "begin" or name == "end":
+                env = ENV_NAME.match(source, pos)
+                if env is None:
+                    continue
+                pos = env.end()
+                env_name = env.group(1)
+                if name == "begin":
+                    if env_name == "document" and document_at is None:
+                        document_at = start
+                    if env_name in VERBATIM_ENVS:
+                        end = source.find(f"\\end{{{env_name}}}", pos)
+                        if end == -1:
+                            issues.append(positions.issue(f"\\begin{{{env_name}}} is never closed", start))
+                            pos = length
+                        else:
+                            pos = end + len(f"\\end{{{env_name}}}")
+                        continue
+                    envs.append((env_name, start, len(braces)))
+                else:
+                    issues.extend(_close_environment(positions, envs, braces, env_name, start))
+
+    for name, offset, _ in reversed(envs):
+        issues.append(positions.issue(f"\\begin{{{name}}} is never closed", offset))
+    for offset in reversed(braces):
+        issues.append(positions.issue("Unclosed '{'", offset))
+
+    severity = "warning" if includes_files else "error"
+    if document_at is not None and documentclass_at is None:
+        issues.append(positions.issue("\\begin{document} without a \\documentclass", document_at, severity))
+    elif require_document:
+        if documentclass_at is None:
+            issues.append(positions.issue("Missing \\documentclass", 0, severity))
+        if document_at is None:
+            issues.append(positions.issue("Missing \\begin{document}", 0, severity))
+
+    issues.sort(key=lambda issue: issue.offset)
+    return issues[:MAX_ISSUES]
+
+
+def _close_environment(
+    positions: _Positions,
+    envs: list[tuple[str, int, int]],
+    braces: list[int],
+    name: str,
+    offset: int,
+) -> list[LintIssue]:
+    if not envs:
+        return [positions.issue(f"\\end{{{name}}} without a matching \\begin", offset)]
+    open_name, open_offset, depth = envs[-1]
+    if open_name != name:
+        if any(env_name == name for env_name, _, _ in envs):
+            # Something nested was left open; report it and unwind to the match
+            issues = []
+            while envs[-1][0] != name:
+                inner_name, inner_offset, _ = envs.pop()
+                issues.append(positions.issue(f"\\begin{{{inner_name}}} is never closed", inner_offset))
+            envs.pop()
+            return issues
+        envs.pop()
+        line = positions.issue("", open_offset).line
+        return [positions.issue(f"\\end{{{name}}} does not match \\begin{{{open_name}}} on line {line}", offset)]
+    envs.pop()
+    issues = []
+    while len(braces) > depth:
+        issues.append(positions.issue(f"Unclosed '{{' inside {name} environment", braces.pop()))
+    return issues
+
+
+def _skip_space(source: str, pos: int) -> int:
+    while pos < len(source) and source[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def _skip_group(source: str, pos: int) -> tuple[int, int | None]:
+    """Skip the braced group at `pos`, if there is one.
+
+    Returns the position after it, and the offset of its `{` when the group
+    is never closed (the position is then the end of the source).
+    """
+    pos = _skip_space(source, pos)
+    if pos >= len(source) or source[pos] != "{":
+        return pos, None
+    depth = 0
+    index = pos
+    while index < len(source):
+        char = source[index]
+        if char == "\\":
+            index += 2
+            continue
+        if char == "%":
+            newline = source.find("\n", index)
+            index = len(source) if newline == -1 else newline
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1, None
+        index += 1
+    return len(source), pos
+
+
+def _skip_optional(source: str, pos: int) -> int:
+    """Skip any `[...]` arguments at `pos`."""
+    while True:
+        start = _skip_space(source, pos)
+        if start >= len(source) or source[start] != "[":
+            return pos
+        close = source.find("]", start)
+        if close == -1:
+            return pos
+        pos = close + 1
+
+
+def _skip_token(source: str, pos: int) -> int:
+    """Skip one control sequence or character."""
+    pos = _skip_space(source, pos)
+    match = CONTROL_SEQUENCE.match(source, pos)
+    if match is not None:
+        return match.end()
+    return min(pos + 1, len(source))
+
+
+def _skip_definition(source: str, pos: int, shape: str) -> tuple[int, int | None]:
+    """Skip the arguments of a definition command whose arguments have `shape`.
+
+    The definition ends where its own arguments do: `\\let` after the two
+    tokens, `\\def` after its body, `\\newcommand` and friends after their
+    last braced argument. Returns the position after it and the offset of a
+    `{` that is never closed, if any.
+    """
+    if shape == "let":
+        pos = _skip_token(source, pos)
+        pos = _skip_space(source, pos)
+        if pos < len(source) and source[pos] == "=":
+            pos += 1
+        return _skip_token(source, pos), None
+    if shape == "def":
+        pos = _skip_token(source, pos)
+        # Parameter text (#1#2 or delimiters) runs up to the body's brace
+        brace = source.find("{", pos)
+        if brace == -1:
+            return pos, None
+        return _skip_group(source, brace)
+
+    # The defined name: a braced group or a bare control sequence
+    start = _skip_space(source, pos)
+    if start < len(source) and source[start] == "{":
+        pos, unclosed = _skip_group(source, start)
+    else:
+        pos, unclosed = _skip_token(source, start), None
+    groups = {"command": 1, "environment": 2, "document_command": 2, "document_environment": 3}[shape]
+    if shape in ("command", "environment"):
+        pos = _skip_optional(source, pos)
+    for _ in range(groups):
+        if unclosed is not None:
+            break
+        pos, unclosed = _skip_group(source, pos)
+    return pos, unclosed
+
+
+def _skip_conditional(source: str, pos: int) -> int:
+    """Position after the `\\fi` that closes an `\\iffalse`, or -1."""
+    depth = 1
+    for match in CONDITIONAL.finditer(source, pos):
+        name = match.group(1)
+        if name == "fi":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif name not in NOT_CONDITIONALS:
+            depth += 1
+    return -1
+
+
+def _skip_verbatim_arg(source: str, pos: int) -> int:
+    """Skip a braced argument whose contents TeX reads verbatim."""
+    while pos < len(source) and source[pos] in " \t":
+        pos += 1
+    if pos >= len(source) or source[pos] != "{":
+        return pos
+    depth = 0
+    for index in range(pos, len(source)):
+        char = source[index]
+        if char == "\\":
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+        elif char == "\n" and index + 1 < len(source) and source[index + 1] == "\n":
+            break
+    # Unterminated; let the normal tokenizer report the brace
+    return pos
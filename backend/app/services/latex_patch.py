@@ -0,0 +1,98 @@
+SEARCH_MARKER = "<<<<<<< SEARCH"
+DIVIDER_MARKER = "======="
+REPLACE_MARKER = ">>>>>>> REPLACE"
+
+
+class PatchError(Exception):
+    """A patch is malformed or doesn't fit the document it was made for."""
+
+
+def parse_patch(text: str) -> list[tuple[str, str]]:
+    """Read SEARCH/REPLACE blocks into (search, replace) pairs.
+
+    A block looks like::
+
+        <<<<<<< SEARCH
+        lines copied from the document
+        =======
+        lines to put in their place
+        >>>>>>> REPLACE
+
+    Anything between blocks (commentary, code fences) is ignored.
+    """
+    edits: list[tuple[str, str]] = []
+    search: list[str] = []
+    replace: list[str] = []
+    state = None
+    for line in text.split("\n"):
+        marker = line.strip()
+        if state is None:
+            if marker == SEARCH_MARKER:
+                state, search, replace = "search", [], []
+        elif state == "search":
+            if marker == DIVIDER_MARKER:
+                state = "replace"
+            elif marker in (SEARCH_MARKER, REPLACE_MARKER):
+                raise PatchError(f"Expected '{DIVIDER_MARKER}' before '{marker}'")
+            else:
+                search.append(line)
+        elif marker == REPLACE_MARKER:
+            if not "".join(search).strip():
+                raise PatchError("A SEARCH block is empty")
+            edits.append(("\n".join(search), "\n".join(replace)))
+            state = None
+        elif marker == SEARCH_MARKER:
+            raise PatchError(f"Expected '{REPLACE_MARKER}' before a new SEARCH block")
+        else:
+            replace.append(line)
+    if state is not None:
+        raise PatchError("The last block is not closed")
+    if not edits:
+        raise PatchError("No SEARCH/REPLACE blocks found")
+    return edits
+
+
+def _find_lines(source: str, search: str) -> tuple[int, int] | None:
+    """Character span of the lines in `source` matching `search` up to surrounding whitespace.
+
+    Models often get indentation or trailing spaces slightly wrong when
+    copying. Returns None when there is no match. Raises PatchError when
+    there is more than one.
+    """
+    lines = source.split("\n")
+    wanted = [line.strip() for line in search.strip("\n").split("\n")]
+    starts = [0]
+    for line in lines:
+        starts.append(starts[-1] + len(line) + 1)
+    found = [
+        index for index in range(len(lines) - len(wanted) + 1)
+        if all(lines[index + k].strip() == wanted[k] for k in range(len(wanted)))
+    ]
+    if len(found) > 1:
+        raise PatchError(f"SEARCH text matches {len(found)} places: {wanted[0][:60]!r}")
+    if not found:
+        return None
+    first = found[0]
+    return starts[first], starts[first + len(wanted)] - 1
+
+
+def apply_patch(source: str, edits: list[tuple[str, str]]) -> str:
+    """Apply (search, replace) pairs in order.
+
+    Each search text has to occur exactly once, either verbatim or as a run
+    of whole lines when leading and trailing whitespace is ignored.
+    Otherwise the patch doesn't fit this document and PatchError is raised.
+    """
+    for search, replace in edits:
+        count = source.count(search)
+        if count == 1:
+            source = source.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"SEARCH text matches {count} places: {search.strip()[:60]!r}")
+        span = _find_lines(source, search)
+        if span is None:
+            raise PatchError(f"SEARCH text not found: {search.strip()[:60]!r}")
+        start, end = span
+        source = source[:start] + replace.strip("\n") + source[end:]
+    return source
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import re
+import tempfile
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Mapping
+
+from app.core.config import settings
+from app.services.compile_cache import CompileCache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+_SPACES = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_prompt(text: str) -> str:
+    """Canonical form of a prompt for cache keys.
+
+    Unicode is NFKC-normalised, runs of spaces and tabs become one space,
+    trailing spaces and extra blank lines go, and the ends are stripped.
+    Case and single line breaks are kept, since both matter in LaTeX.
+    """
+    text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n")
+    lines = [_SPACES.sub(" ", line).rstrip() for line in text.split("\n")]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+class LLMCache:
+    """Completions keyed on model, system prompt and normalised user prompt.
+
+    Hot entries live in an in-memory LRU; when a directory is configured
+    they are also written to disk (as JSON in a `CompileCache`), so they
+    survive restarts and are shared by workers on the same host. Every entry
+    carries its own expiry, set from the TTL of the call site that stored it.
+    """
+
+    def __init__(self, max_entries: int, disk_dir: Path | str | None = None, disk_max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._disk = CompileCache(disk_dir, disk_max_bytes, suffix=".json") if disk_dir else None
+
+    @staticmethod
+    def make_key(model: str, messages: list[dict[str, str]], options: Mapping[str, Any] | None = None) -> str:
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        conversation = [
+            (m["role"], normalize_prompt(m["content"])) for m in messages if m["role"] != "system"
+        ]
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(hashlib.sha256(system.encode("utf-8")).digest())
+        digest.update(json.dumps(conversation).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(json.dumps(options or {}, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Cached completion text for `key`, or None if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None and self._disk is not None:
+            entry = self._read_disk(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                self._entries.pop(key, None)
+                if self._disk is not None:
+                    self._disk.discard(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, text: str, ttl: int) -> None:
+        """Store `text` for `ttl` seconds; a TTL of 0 stores nothing."""
+        if ttl <= 0 or not text:
+            return
+        entry = (time.time() + ttl, text)
+        self._remember(key, entry)
+        if self._disk is not None:
+            try:
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    path = Path(temp_dir) / "entry.json"
+                    path.write_text(json.dumps({"expires": entry[0], "text": text}), encoding="utf-8")
+                    self._disk.put(key, path)
+            except OSError as e:
+                logger.warning(f"LLM_CACHE: Could not write {key[:12]} to disk: {e}")
+
+    def _remember(self, key: str, entry: tuple[float, str]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key: str) -> tuple[float, str] | None:
+        # Read the file itself rather than asking the disk cache, whose index
+        # only holds what was there at startup or written by this worker
+        try:
+            data = json.loads(self._disk.path_for(key).read_text(encoding="utf-8"))
+            entry = float(data["expires"]), str(data["text"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if entry[0] < time.time():
+            self._disk.discard(key)
+            return None
+        # Bumps the entry's recency when this worker has it indexed
+        self._disk.get(key, count=False)
+        return entry
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "disk": self._disk.stats() if self._disk is not None else None,
+        }
+
+
+llm_cache = LLMCache(
+    settings.llm_cache_max_entries,
+    disk_dir=settings.llm_cache_dir or None,
+    disk_max_bytes=settings.llm_cache_max_mb * 1024 * 1024,
+)
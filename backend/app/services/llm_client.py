@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator
+
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+from app.core.config import settings
+from app.services.llm_cache import LLMCache, llm_cache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    """One process-wide async Groq client shared by every call site.
+
+    The underlying httpx pool keeps connections alive between requests, so
+    TLS handshakes happen once per connection rather than once per call,
+    and awaiting a completion never blocks the event loop. A semaphore caps
+    how many requests are in flight at once; callers over the cap wait their
+    turn instead of piling onto the API's rate limit.
+
+    `complete` and `stream_chat` go through the response cache when given a
+    call `site` with a TTL in `settings.llm_cache_ttl_seconds`; pass
+    `use_cache=False` to always ask the model (the answer is still stored).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int,
+        timeout: float,
+        connect_timeout: float,
+        max_retries: int,
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self._client: AsyncGroq | None = None
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def client(self) -> AsyncGroq:
+        # Created on first use so importing this module opens no sockets
+        if self._client is None:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            )
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                max_retries=self.max_retries,
+                http_client=http_client,
+            )
+        return self._client
+
+    async def chat(self, messages: list[dict[str, str]], model: str, **kwargs: Any) -> Any:
+        """Create a chat completion and return the SDK's completion object."""
+        async with self._slots:
+            return await self.client.chat.completions.create(messages=messages, model=model, **kwargs)
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        site: str | None = None,
+        use_cache: bool = True,
+        **kwargs: Any,
+    ) -> str:
+        """Text of a chat completion, served from the cache when possible."""
+        ttl = self._cache_ttl(site)
+        key = LLMCache.make_key(model, messages, kwargs) if ttl else None
+        if key and use_cache and (text := llm_cache.get(key)) is not None:
+            logger.info(f"LLM_CLIENT: Cache hit for {site} ({key[:12]})")
+            return text
+        completion = await self.chat(messages, model, **kwargs)
+        text = completion.choices[0].message.content or ""
+        if key:
+            llm_cache.put(key, text, ttl)
+        return text
+
+    async def stream_chat(
+        self,
+        messages: list[dict[str, str]],
+        model: str,
+        site: str | None = None,
+        use_cache: bool = True,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """Create a streamed chat completion and yield its text as it arrives.
+
+        A cached completion is yielded in one piece. A streamed one is only
+        stored once the stream has run to the end. The concurrency slot is
+        held until the stream is exhausted or closed.
+        """
+        ttl = self._cache_ttl(site)
+        key = LLMCache.make_key(model, messages, kwargs) if ttl else None
+        if key and use_cache and (text := llm_cache.get(key)) is not None:
+            logger.info(f"LLM_CLIENT: Cache hit for {site} ({key[:12]})")
+            yield text
+            return
+        parts: list[str] = []
+        async with self._slots:
+            stream = await self.client.chat.completions.create(
+                messages=messages, model=model, stream=True, **kwargs
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and (text := chunk.choices[0].delta.content):
+                        parts.append(text)
+                        yield text
+            finally:
+                await stream.close()
+        if key:
+            llm_cache.put(key, "".join(parts), ttl)
+
+    async def transcribe(self, file: tuple[str, bytes], model: str, **kwargs: Any) -> Any:
+        """Transcribe an audio file with a Whisper model."""
+        async with self._slots:
+            return await self.client.audio.transcriptions.create(file=file, model=model, **kwargs)
+
+    @staticmethod
+    def _cache_ttl(site: str | None) -> int:
+        if site is None or not settings.llm_cache_enabled:
+            return 0
+        return settings.llm_cache_ttl_seconds.get(site, 0)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+llm_client = LLMClient(
+    settings.groq_api_key,
+    max_concurrency=settings.llm_max_concurrency,
+    timeout=settings.llm_timeout_seconds,
+    connect_timeout=settings.llm_connect_timeout_seconds,
+    max_retries=settings.llm_max_retries,
+)
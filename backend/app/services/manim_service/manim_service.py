@@ -1,10 +1,12 @@
+import asyncio
 import json
 import os
 import subprocess
 import sys
+import tempfile
+import uuid
 from pathlib import Path
 from typing import Dict, Any
-from groq import Groq
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -15,6 +17,11 @@ backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__
 if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
 from app.models.schemas import ManimAnimationInput, ManimAnimationOutput
+from app.services.llm_client import llm_client
+
+# manim keeps its settings in one process-wide `config`, so only one scene
+# may be configured and rendered at a time
+_render_lock = asyncio.Lock()
 
 class ManimService:
     def __init__(self, template_path: str = None):
@@ -30,29 +37,13 @@ class ManimService:
         # Ensure output directory exists
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def generate_animation_code(self, description: str, error_context: str = None, retry_count: int = 0) -> str:
+    async def generate_animation_code(self, description: str, error_context: str = None, retry_count: int = 0) -> str:
         print("=" * 80)
         print("STARTING ANIMATION CODE GENERATION")
         print("=" * 80)
         print(f"Description: {description}")
-        # Get API key directly from environment
-        api_key = os.getenv('GROQ_API_KEY')
-        
-        print(f"API Key available: {bool(api_key)}")
         print(f"Current working directory: {os.getcwd()}")
         
-        # Check if API key is available
-        if not api_key:
-            print("ERROR: No API key found!")
-            return "# Error: GROQ_API_KEY not found. Please set the environment variable."
-        
-        try:
-            print("Initializing Groq client...")
-            client = Groq(api_key=api_key)
-            print("Groq client initialized successfully")
-        except Exception as e:
-            return f"# Error initializing Groq client: {str(e)}"
-        
         # Build system instructions with error context if retrying
         base_instructions = (
             "### ROLE\n"
@@ -163,7 +154,7 @@ You MUST fix this specific error. Do not use the same parameters that caused thi
             print(f"RETRY COUNT: {retry_count}")
         
         try:
-            response = client.chat.completions.create(
+            response = await llm_client.chat(
                 messages=[
                     {"role": "system",
                      "content": system_instructions},
@@ -220,8 +211,8 @@ You MUST fix this specific error. Do not use the same parameters that caused thi
         }
         return quality_flags.get(quality, "--quality=m")
     
-    def generate_manim_file(self, input_data: ManimAnimationInput, error_context: str = None, retry_count: int = 0) -> str:
-        # this needs to inject all of the json input into the manim_template.py, and create/overwrite the persistent runner file
+    async def generate_manim_file(self, input_data: ManimAnimationInput, work_dir: str, error_context: str = None, retry_count: int = 0) -> str:
+        # this needs to inject all of the json input into the manim_template.py, and write it as a runner file in work_dir
         
         # Read the template file
         with open(self.template_path, 'r') as f:
@@ -236,7 +227,7 @@ config.background_color = {input_data.background_color}
 """
         
         # Generate animation code injection
-        animation_injection = self.generate_animation_code(input_data.description, error_context, retry_count)
+        animation_injection = await self.generate_animation_code(input_data.description, error_context, retry_count)
         
         # Generate output configuration injection
         output_config_injection = f"""
@@ -249,16 +240,15 @@ config.background_color = {input_data.background_color}
         temp_content = temp_content.replace("#{ANIMATION_INJECTION}", animation_injection)
         temp_content = temp_content.replace("#{OUTPUT_CONFIG_INJECTION}", output_config_injection)
         
-        # Create persistent file path in the same directory as the service
-        persistent_file_path = os.path.join(os.path.dirname(__file__), "tempCodeRunnerFile.py")
+        # Each request gets its own runner file so concurrent requests don't overwrite each other
+        runner_file_path = os.path.join(work_dir, f"manim_scene_{uuid.uuid4().hex}.py")
         
-        # Write to persistent file (overwrites existing file)
-        with open(persistent_file_path, 'w') as f:
+        with open(runner_file_path, 'w') as f:
             f.write(temp_content)
         
-        return persistent_file_path
+        return runner_file_path
         
-    def run_manim_animation(self, input_data: ManimAnimationInput) -> Dict[str, Any]:
+    async def run_manim_animation(self, input_data: ManimAnimationInput) -> Dict[str, Any]:
         # Retry up to 2 times with error context
         max_retries = 2
         last_error = None
@@ -267,23 +257,18 @@ config.background_color = {input_data.background_color}
             try:
                 print(f"Attempt {retry_count + 1}/{max_retries + 1}")
                 
-                # Generate the file with error context if retrying
-                persistent_file_path = self.generate_manim_file(
-                    input_data, 
-                    error_context=last_error, 
-                    retry_count=retry_count
-                )
-                
-                # Import the generated file and run the scene directly
-                import importlib.util
-                spec = importlib.util.spec_from_file_location("temp_manim", persistent_file_path)
-                temp_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(temp_module)
-                
-                # Get the MyAnimation class and run it
-                scene_class = getattr(temp_module, "MyAnimation")
-                scene = scene_class()
-                scene.render()
+                with tempfile.TemporaryDirectory(prefix="manim_") as work_dir:
+                    # Generate the file with error context if retrying
+                    runner_file_path = await self.generate_manim_file(
+                        input_data, 
+                        work_dir,
+                        error_context=last_error, 
+                        retry_count=retry_count
+                    )
+                    
+                    # Rendering is CPU-bound; keep it off the event loop
+                    async with _render_lock:
+                        await asyncio.to_thread(self.render_scene, runner_file_path)
                 
                 # Look for the generated video file
                 video_filename = f"{input_data.output_file}.mp4"
@@ -335,6 +320,20 @@ config.background_color = {input_data.background_color}
             "error": "Maximum retries exceeded"
         }
     
+    @staticmethod
+    def render_scene(runner_file_path: str) -> None:
+        # Import the generated file under its own module name and run the scene directly
+        import importlib.util
+        module_name = Path(runner_file_path).stem
+        spec = importlib.util.spec_from_file_location(module_name, runner_file_path)
+        temp_module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(temp_module)
+        
+        # Get the MyAnimation class and run it
+        scene_class = getattr(temp_module, "MyAnimation")
+        scene = scene_class()
+        scene.render()
+
     @staticmethod
     async def compile_manim(input_data: ManimAnimationInput) -> ManimAnimationOutput:
         # should parse the ManimAnimationInput, generate the animation code, generate the manim file, and run the manim animation
@@ -343,7 +342,7 @@ config.background_color = {input_data.background_color}
             service = ManimService()
             
             # Run the animation
-            result = service.run_manim_animation(input_data)
+            result = await service.run_manim_animation(input_data)
             
             # Return ManimAnimationOutput
             return ManimAnimationOutput(
@@ -377,7 +376,7 @@ def main():
     
     # Create service and run animation
     service = ManimService()
-    result = service.run_manim_animation(example_input)
+    result = asyncio.run(service.run_manim_animation(example_input))
     
     print("Animation generation result:")
     print(json.dumps(result, indent=2))
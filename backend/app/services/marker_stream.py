@@ -0,0 +1,152 @@
+MESSAGE_MARKER = "<<<MESSAGE>>>"
+LATEX_MARKER = "<<<LATEX>>>"
+FENCE = "```"
+
+
+def _partial_suffix(text: str, marker: str) -> int:
+    """Length of the longest tail of `text` that could start `marker`."""
+    for size in range(min(len(text), len(marker) - 1), 0, -1):
+        if marker.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class MarkerStreamParser:
+    """Split a streamed `<<<MESSAGE>>>` / `<<<LATEX>>>` completion as it arrives.
+
+    `feed()` takes raw deltas from the model and returns `(kind, text)`
+    pairs, where kind is "message" or "latex", ready to forward to the
+    client. Text that might be the start of a marker is held back until the
+    next delta settles it, so a marker split across deltas never leaks out.
+
+    The LaTeX block gets the same treatment as `ChatService._clean_fenced_code`,
+    done line by line: an opening ``` line is dropped, and blank lines and a
+    closing fence are only sent once real content follows them. Output with
+    no markers at all is treated as LaTeX when the stream ends, like the
+    non-streaming fallback.
+    """
+
+    def __init__(self):
+        self.state = "preamble"
+        self.message = ""
+        self.latex = ""
+        self.fallback = False
+        self._buffer = ""
+        self._message_started = False
+        self._latex_started = False
+        self._fenced = False
+        self._held_lines: list[str] = []
+        self._latex_lines = 0
+
+    def feed(self, text: str) -> list[tuple[str, str]]:
+        self._buffer += text
+        events: list[tuple[str, str]] = []
+        while True:
+            if self.state == "preamble":
+                if not self._leave_preamble():
+                    break
+            elif self.state == "message":
+                if not self._feed_message(events):
+                    break
+            else:
+                self._feed_latex(events)
+                break
+        return events
+
+    def finish(self) -> list[tuple[str, str]]:
+        """Flush whatever is held back once the stream has ended."""
+        events: list[tuple[str, str]] = []
+        if self.state == "preamble":
+            # No markers anywhere: the whole output is LaTeX
+            self.fallback = True
+            self.state = "latex"
+            self._feed_latex(events)
+        elif self.state == "message":
+            self._emit(events, "message", self._buffer.rstrip())
+            self._buffer = ""
+        if self.state == "latex":
+            line = self._buffer.rstrip()
+            self._buffer = ""
+            if not self._latex_started:
+                line = line.lstrip()
+                if line.startswith(FENCE):
+                    line = ""
+            if line and not (self._fenced and line.startswith(FENCE)):
+                self._emit_lines(events, self._held_lines + [line])
+            self._held_lines = []
+        return events
+
+    def _leave_preamble(self) -> bool:
+        # Whichever marker comes first starts the corresponding block
+        found = [
+            (index, marker, state)
+            for marker, state in ((MESSAGE_MARKER, "message"), (LATEX_MARKER, "latex"))
+            if (index := self._buffer.find(marker)) != -1
+        ]
+        if not found:
+            return False
+        index, marker, state = min(found)
+        self._buffer = self._buffer[index + len(marker):]
+        self.state = state
+        return True
+
+    def _feed_message(self, events: list[tuple[str, str]]) -> bool:
+        index = self._buffer.find(LATEX_MARKER)
+        if index != -1:
+            self._emit(events, "message", self._buffer[:index].rstrip())
+            self._buffer = self._buffer[index + len(LATEX_MARKER):]
+            self.state = "latex"
+            return True
+        keep = _partial_suffix(self._buffer, LATEX_MARKER)
+        ready = self._buffer[:len(self._buffer) - keep]
+        # Trailing whitespace may turn out to be the gap before the marker
+        settled = ready.rstrip()
+        self._emit(events, "message", settled)
+        self._buffer = self._buffer[len(settled):]
+        return False
+
+    def _feed_latex(self, events: list[tuple[str, str]]) -> None:
+        if not self._latex_started:
+            self._buffer = self._buffer.lstrip()
+            if not self._buffer or FENCE.startswith(self._buffer):
+                return
+            if self._buffer.startswith(FENCE):
+                newline = self._buffer.find("\n")
+                if newline == -1:
+                    return
+                self._buffer = self._buffer[newline + 1:]
+                self._fenced = True
+            self._latex_started = True
+
+        newline = self._buffer.rfind("\n")
+        if newline == -1:
+            return
+        lines = self._buffer[:newline].split("\n")
+        self._buffer = self._buffer[newline + 1:]
+        for line in lines:
+            if not line.strip() or (self._fenced and line.startswith(FENCE)):
+                self._held_lines.append(line)
+            else:
+                self._emit_lines(events, self._held_lines + [line])
+                self._held_lines = []
+
+    def _emit_lines(self, events: list[tuple[str, str]], lines: list[str]) -> None:
+        # Lines are joined with the newline in front, so nothing trails the block
+        text = "".join(
+            ("\n" if self._latex_lines + offset else "") + line
+            for offset, line in enumerate(lines)
+        )
+        self._latex_lines += len(lines)
+        self._emit(events, "latex", text)
+
+    def _emit(self, events: list[tuple[str, str]], kind: str, text: str) -> None:
+        if kind == "message" and not self._message_started:
+            text = text.lstrip()
+            self._message_started = bool(text)
+        if not text:
+            return
+        if kind == "message":
+            self.message += text
+        else:
+            self.latex += text
+        events.append((kind, text))
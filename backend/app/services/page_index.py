@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+from app.core.config import settings
+from app.services.compile_cache import CompileCache
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pypdf is optional; without it page hashes are unavailable
+    PdfReader = PdfWriter = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Hex digits kept per page hash; plenty to tell pages apart within a document
+PAGE_HASH_LENGTH = 16
+
+
+def page_hashes(pdf_path: Path) -> list[str]:
+    """Hash what each page of a PDF draws, in page order.
+
+    A page hash covers the page's content stream, its size and the data of
+    any images or forms it places. Font subsets are left out on purpose:
+    they are shared by the whole document and change whenever a new glyph
+    is used anywhere, which would mark every page as changed.
+    """
+    reader = PdfReader(str(pdf_path))
+    hashes = []
+    for page in reader.pages:
+        digest = hashlib.sha256()
+        digest.update(repr([float(v) for v in page.mediabox]).encode("ascii"))
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources is not None else None
+        if xobjects is not None:
+            xobjects = xobjects.get_object()
+            for name in sorted(xobjects):
+                digest.update(name.encode("utf-8"))
+                digest.update(hashlib.sha256(xobjects[name].get_object().get_data()).digest())
+        hashes.append(digest.hexdigest()[:PAGE_HASH_LENGTH])
+    return hashes
+
+
+def changed_pages(hashes: list[str], previous: list[str] | None) -> list[int]:
+    """1-based numbers of pages in `hashes` that differ from `previous`."""
+    if previous is None:
+        return list(range(1, len(hashes) + 1))
+    return [
+        number
+        for number, page_hash in enumerate(hashes, start=1)
+        if number > len(previous) or previous[number - 1] != page_hash
+    ]
+
+
+def extract_pages(pdf_path: Path, pages: list[int]) -> bytes:
+    """A new PDF holding only `pages` (1-based) of `pdf_path`."""
+    reader = PdfReader(str(pdf_path))
+    writer = PdfWriter()
+    for number in pages:
+        writer.add_page(reader.pages[number - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class PageIndex:
+    """Per-page hashes of compiled PDFs, stored next to the PDF cache.
+
+    The index is keyed by the same compile key as the PDF, and outlives it
+    when the PDF is evicted first. That way a client holding an old version
+    can still be told which pages changed.
+    """
+
+    def __init__(self, root: Path | str, max_bytes: int):
+        self._store = CompileCache(root, max_bytes, suffix=".json")
+
+    @property
+    def available(self) -> bool:
+        return PdfReader is not None
+
+    def get(self, cache_key: str) -> list[str] | None:
+        """Stored page hashes for `cache_key`, or None if never indexed."""
+        path = self._store.get(cache_key)
+        if path is None:
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    async def page_count(self, cache_key: str, pdf_path: Path) -> int | None:
+        """Number of pages of the PDF at `pdf_path`, without hashing them.
+
+        Uses the stored index when there is one. Returns None when pypdf
+        isn't installed or the PDF can't be parsed.
+        """
+        hashes = self.get(cache_key)
+        if hashes is not None:
+            return len(hashes)
+        if not self.available:
+            return None
+        try:
+            return await asyncio.to_thread(lambda: len(PdfReader(str(pdf_path)).pages))
+        except Exception as e:
+            logger.warning(f"PAGE_INDEX: Could not count pages of {cache_key[:12]}: {e}")
+            return None
+
+    async def index(self, cache_key: str, pdf_path: Path) -> list[str] | None:
+        """Page hashes for the PDF at `pdf_path`, computed once per key.
+
+        Returns None when pypdf isn't installed or the PDF can't be parsed.
+        """
+        hashes = self.get(cache_key)
+        if hashes is not None or not self.available:
+            return hashes
+        try:
+            hashes = await asyncio.to_thread(page_hashes, pdf_path)
+        except Exception as e:
+            logger.warning(f"PAGE_INDEX: Could not hash pages of {cache_key[:12]}: {e}")
+            return None
+        with tempfile.TemporaryDirectory() as temp_dir:
+            entry = Path(temp_dir) / "pages.json"
+            entry.write_text(json.dumps(hashes), encoding="utf-8")
+            self._store.put(cache_key, entry)
+        return hashes
+
+
+page_index = PageIndex(settings.page_index_dir, settings.page_index_max_mb * 1024 * 1024)
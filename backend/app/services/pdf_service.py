@@ -1,62 +1,842 @@
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any, AsyncIterator, Callable
 from fastapi import HTTPException, UploadFile
-from fastapi.responses import FileResponse
-import tempfile
-import subprocess
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import json
 import os
 import shutil
+import zipfile
+
+from app.core.config import settings
+from app.services.compile_executor import (
+    compile_executor,
+    session_coalescer,
+    queue_full_error,
+    CompileQueueFullError,
+    CompileSupersededError,
+    ProcessResult,
+)
+from app.services.asset_store import asset_store, project_path, MissingAssetsError
+from app.services.compile_cache import CACHE_KEY, pdf_cache
+from app.services.format_cache import format_cache, split_preamble
+from app.services.latex_lint import lint_latex
+from app.services.page_index import page_index, changed_pages, extract_pages
+from app.services.tex_log import TexLogParser
+from app.services.workspace_service import workspace_manager, aux_fingerprint
+from app.utils.sse import sse_response
+from app.utils.zip_stream import ZipStream
+
+EventCallback = Callable[[dict[str, Any]], None]
+
+# How often a batch item retries when the shared queue is full
+BATCH_QUEUE_RETRIES = 10
+# Lines of engine output kept for failures the log parser can't explain
+LOG_TAIL_LINES = 30
+
+ENGINES = ("pdflatex", "xelatex", "lualatex", "tectonic")
+# Engines whose preamble can be dumped into a format with mylatexformat
+FORMAT_ENGINES = ("pdflatex", "xelatex")
+DEFAULT_ENGINE = "pdflatex"
+
+
+def engine_command(engine: str, work_dir: Path, tex_file: Path, fmt: str | None = None) -> list[str]:
+    """Command line that compiles `tex_file` into `work_dir` with `engine`."""
+    if engine == "tectonic":
+        # Tectonic reruns internally and has its own flags
+        return ["tectonic", "--keep-intermediates", "--keep-logs", "--outdir", str(work_dir), str(tex_file)]
+    args = [engine]
+    if fmt:
+        # Load the dumped preamble instead of re-reading every package
+        args.append(f"-fmt={fmt}")
+    args += [
+        "-output-directory", str(work_dir),
+        "-interaction=nonstopmode",  # Don't stop for errors
+        "-file-line-error",
+        str(tex_file),
+    ]
+    return args
+
+
+@dataclass
+class CompileOutcome:
+    """Result of one compile, whether it ran TeX or came from the cache."""
+    cache_key: str
+    pdf_path: Path | None
+    cache_hit: bool
+    passes: int = 0
+    pages: int = 0
+    # Last lines of the engine's output
+    log_tail: str = ""
+    errors: list[dict[str, Any]] = field(default_factory=list)
+    warnings: list[dict[str, Any]] = field(default_factory=list)
+    # The engine was killed after reaching the requested error limit
+    stopped_early: bool = False
+    # The pre-lint rejected the source and TeX never ran
+    rejected: bool = False
+    # Resource limit that killed the engine ("wall", "cpu" or "output")
+    limit: str | None = None
+
 
 class PDFService:
     @staticmethod
-    async def compile_pdf(file: UploadFile) -> FileResponse:
+    async def compile_pdf(
+        file: UploadFile,
+        session_id: str | None = None,
+        max_errors: int | None = None,
+        engine: str = DEFAULT_ENGINE,
+    ) -> FileResponse:
+        PDFService._check_engine(engine)
+        content = await PDFService._read_upload(file, session_id)
+        try:
+            outcome = await PDFService.compile_source(
+                content,
+                file.filename,
+                session_id,
+                max_errors=max_errors,
+                engine=engine,
+            )
+        except Exception as e:
+            raise PDFService._compile_error(e)
+        return await PDFService._outcome_response(outcome, max_errors)
+
+    @staticmethod
+    async def compile_project(
+        main: str,
+        manifest: str | None = None,
+        files: list[UploadFile] | None = None,
+        bundle: UploadFile | None = None,
+        session_id: str | None = None,
+        max_errors: int | None = None,
+        engine: str = DEFAULT_ENGINE,
+    ) -> FileResponse:
+        """Compile a multi-file project (images, .bib, \\input chapters).
+
+        The project is the union of `manifest` (a JSON object mapping paths to
+        the sha256 of content uploaded earlier), the entries of a `bundle` zip
+        and the uploaded `files`, whose filenames are their project paths;
+        later sources win. New content goes into the asset store, so a client
+        can send only a manifest plus the files that changed. When the
+        manifest names content the server doesn't have, the answer is 409 with
+        the missing paths in `detail.missing`.
+        """
+        PDFService._check_engine(engine)
+        if session_id and not workspace_manager.is_valid_session(session_id):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid session id"
+            )
+        main_path = project_path(main)
+        if main_path is None or "/" in main_path or not main_path.endswith(".tex"):
+            raise HTTPException(
+                status_code=400,
+                detail="Main file must be a .tex file at the top level of the project"
+            )
+
+        project: dict[str, str] = {}
+        if manifest:
+            try:
+                entries = json.loads(manifest)
+            except ValueError:
+                entries = None
+            if not isinstance(entries, dict) or not all(isinstance(v, str) for v in entries.values()):
+                raise HTTPException(
+                    status_code=400,
+                    detail="Manifest must be a JSON object mapping paths to sha256 digests"
+                )
+            for name, digest in entries.items():
+                project[PDFService._checked_project_path(name)] = digest.lower()
+        if bundle is not None:
+            entries = await asyncio.to_thread(PDFService._read_bundle, bundle)
+            project.update({path: asset_store.add(data) for path, data in entries.items()})
+        total = 0
+        for file in files or []:
+            content = await file.read()
+            total += len(content)
+            if total > settings.project_max_mb * 1024 * 1024:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Project uploads are limited to {settings.project_max_mb} MB"
+                )
+            project[PDFService._checked_project_path(file.filename)] = asset_store.add(content)
+
+        if len(project) > settings.project_max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.project_max_files} files per project"
+            )
+        if main_path not in project:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Main file {main_path} is not part of the project"
+            )
+        content = asset_store.read(project[main_path])
+        try:
+            if content is None:
+                raise MissingAssetsError({main_path: project[main_path]})
+            outcome = await PDFService.compile_source(
+                content,
+                main_path,
+                session_id,
+                max_errors=max_errors,
+                engine=engine,
+                files=project,
+            )
+        except Exception as e:
+            raise PDFService._compile_error(e)
+        return await PDFService._outcome_response(outcome, max_errors)
+
+    @staticmethod
+    async def _outcome_response(outcome: CompileOutcome, max_errors: int | None) -> FileResponse:
+        if outcome.pdf_path is None:
+            raise HTTPException(status_code=400, detail=PDFService._failure_detail(outcome))
+        headers = {"X-Compile-Cache": "hit" if outcome.cache_hit else "miss"}
+        if not outcome.cache_hit:
+            headers["X-Compile-Passes"] = str(outcome.passes)
+        headers.update(await PDFService._page_headers(outcome.cache_key, outcome.pdf_path, outcome.pages))
+        return PDFService._pdf_response(outcome.cache_key, outcome.pdf_path, headers)
+
+    @staticmethod
+    async def compile_pdf_stream(
+        file: UploadFile,
+        session_id: str | None = None,
+        max_errors: int | None = None,
+        engine: str = DEFAULT_ENGINE,
+    ) -> StreamingResponse:
+        """Compile while streaming progress as Server-Sent Events.
+
+        Emits `pass`, `page`, `file`, `warning` and `error` events as the
+        engine runs, then one final `done` event with the URL of the PDF, or
+        a `failed` event. When page hashes are available the `done` event
+        carries them so the client can ask for just the changed pages.
+        """
+        PDFService._check_engine(engine)
+        content = await PDFService._read_upload(file, session_id)
+        queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+
+        async def run():
+            try:
+                outcome = await PDFService.compile_source(
+                    content,
+                    file.filename,
+                    session_id,
+                    on_event=queue.put_nowait,
+                    max_errors=max_errors,
+                    engine=engine,
+                )
+                if outcome.pdf_path is None:
+                    failure = PDFService._failure_detail(outcome)
+                    queue.put_nowait({
+                        "type": "failed",
+                        "status": 400,
+                        "detail": failure.pop("message"),
+                        **failure,
+                    })
+                else:
+                    queue.put_nowait({
+                        "type": "done",
+                        "key": outcome.cache_key,
+                        "url": f"/compile/result/{outcome.cache_key}",
+                        "cached": outcome.cache_hit,
+                        "passes": outcome.passes,
+                        "pages": outcome.pages,
+                        "warnings": len(outcome.warnings),
+                        "page_hashes": await page_index.index(outcome.cache_key, outcome.pdf_path),
+                    })
+            except Exception as e:
+                error = PDFService._compile_error(e)
+                queue.put_nowait({
+                    "type": "failed",
+                    "status": error.status_code,
+                    "detail": error.detail,
+                    **({"retry_after": e.retry_after} if isinstance(e, CompileQueueFullError) else {}),
+                })
+            finally:
+                queue.put_nowait(None)
+
+        async def events() -> AsyncIterator[dict[str, Any]]:
+            task = asyncio.create_task(run())
+            try:
+                while (event := await queue.get()) is not None:
+                    yield event
+            finally:
+                # Stops the engine if the client disconnects mid-compile
+                task.cancel()
+
+        return sse_response(events())
+
+    @staticmethod
+    async def compile_batch(
+        files: list[UploadFile],
+        max_errors: int | None = None,
+        engine: str = DEFAULT_ENGINE,
+    ) -> StreamingResponse:
+        """Compile many sources concurrently and stream back a zip.
+
+        Each PDF (or `<name>.errors.json` on failure) is written to the archive
+        as soon as its compile finishes, and a `manifest.json` summarising
+        every item closes it. A batch uses at most as many compiles at once as
+        there are workers, so it never floods the queue shared with
+        interactive users; when the queue is full anyway it waits and retries.
+        """
+        PDFService._check_engine(engine)
+        if len(files) > settings.compile_batch_max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {settings.compile_batch_max_files} files per batch"
+            )
+        items: list[tuple[str, bytes]] = []
+        seen: set[str] = set()
+        for file in files:
+            content = await PDFService._read_upload(file, None)
+            stem = Path(file.filename).stem
+            name, n = stem, 1
+            while name in seen:
+                n += 1
+                name = f"{stem}-{n}"
+            seen.add(name)
+            items.append((name, content))
+
+        limit = asyncio.Semaphore(compile_executor.workers)
+
+        async def compile_item(name: str, content: bytes) -> tuple[str, CompileOutcome | None, bytes | None, str | None]:
+            async with limit:
+                for _ in range(BATCH_QUEUE_RETRIES):
+                    try:
+                        outcome = await PDFService.compile_source(
+                            content,
+                            f"{name}.tex",
+                            max_errors=max_errors,
+                            engine=engine,
+                        )
+                    except CompileQueueFullError as e:
+                        await asyncio.sleep(min(e.retry_after, 10))
+                        continue
+                    except Exception as e:
+                        return name, None, None, PDFService._compile_error(e).detail
+                    if outcome.pdf_path is None:
+                        return name, outcome, None, None
+                    # Read the PDF now, pinned, so concurrent compiles can't
+                    # evict it while the archive is being streamed
+                    pdf_cache.pin(outcome.cache_key)
+                    try:
+                        pdf = await asyncio.to_thread(outcome.pdf_path.read_bytes)
+                    except OSError as e:
+                        return name, outcome, None, f"Compiled PDF could not be read: {e}"
+                    finally:
+                        pdf_cache.unpin(outcome.cache_key)
+                    return name, outcome, pdf, None
+                return name, None, None, "Compile queue stayed full"
+
+        async def archive() -> AsyncIterator[bytes]:
+            zip_stream = ZipStream()
+            manifest = []
+            tasks = [asyncio.create_task(compile_item(name, content)) for name, content in items]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    name, outcome, pdf, error = await next_done
+                    if pdf is not None:
+                        manifest.append({"file": f"{name}.tex", "status": "ok", "pdf": f"{name}.pdf", "key": outcome.cache_key})
+                        yield zip_stream.add(f"{name}.pdf", pdf, compress=False)
+                    else:
+                        failure = PDFService._failure_detail(outcome) if outcome else {"errors": []}
+                        message = failure.pop("message", "LaTeX compilation failed")
+                        entry = {"file": f"{name}.tex", "status": "failed", "detail": error or message, **failure}
+                        manifest.append(entry)
+                        yield zip_stream.add(f"{name}.errors.json", json.dumps(entry, indent=2).encode("utf-8"))
+                yield zip_stream.add("manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+                yield zip_stream.close()
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(
+            archive(),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=compiled.zip"}
+        )
+
+    @staticmethod
+    async def get_result(cache_key: str) -> FileResponse:
+        """Serve a previously compiled PDF by its compile key."""
+        pdf_path = pdf_cache.get(cache_key) if CACHE_KEY.match(cache_key) else None
+        if pdf_path is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Compiled PDF not found"
+            )
+        headers = {"X-Compile-Cache": "hit"}
+        headers.update(await PDFService._page_headers(cache_key, pdf_path))
+        return PDFService._pdf_response(cache_key, pdf_path, headers)
+
+    @staticmethod
+    async def get_pages(cache_key: str) -> JSONResponse:
+        """List the page hashes of a compiled PDF, hashing it on first request.
+
+        Clients compare these with the hashes of the version they have to
+        decide which pages to fetch again.
+        """
+        if not page_index.available:
+            raise HTTPException(
+                status_code=501,
+                detail="Page-level delivery requires pypdf to be installed"
+            )
+        pdf_path = pdf_cache.get(cache_key, count=False) if CACHE_KEY.match(cache_key) else None
+        if pdf_path is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Compiled PDF not found"
+            )
+
+        pdf_cache.pin(cache_key)
+        try:
+            hashes = await page_index.index(cache_key, pdf_path)
+        finally:
+            pdf_cache.unpin(cache_key)
+        if hashes is None:
+            raise HTTPException(
+                status_code=500,
+                detail="Could not read the pages of the compiled PDF"
+            )
+        return JSONResponse({"key": cache_key, "pages": len(hashes), "page_hashes": hashes})
+
+    @staticmethod
+    async def get_delta(cache_key: str, since: str, response_format: str = "json") -> Response:
+        """Report or serve the pages of `cache_key` that differ from `since`.
+
+        `since` is the compile key of the version the client already has. As
+        JSON, the response lists the current page hashes and the changed page
+        numbers; as PDF, it is a document holding only the changed pages, in
+        order, with their numbers in `X-Changed-Pages`. If `since` is unknown
+        every page counts as changed.
+        """
+        if response_format not in ("json", "pdf"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported delta format: {response_format}. Choose json or pdf"
+            )
+        if not page_index.available:
+            raise HTTPException(
+                status_code=501,
+                detail="Page-level delivery requires pypdf to be installed"
+            )
+        pdf_path = pdf_cache.get(cache_key, count=False) if CACHE_KEY.match(cache_key) else None
+        if pdf_path is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Compiled PDF not found"
+            )
+
+        pdf_cache.pin(cache_key)
+        try:
+            hashes = await page_index.index(cache_key, pdf_path)
+            if hashes is None:
+                raise HTTPException(
+                    status_code=500,
+                    detail="Could not read the pages of the compiled PDF"
+                )
+            previous = await PDFService._indexed_pages(since) if CACHE_KEY.match(since) else None
+            changed = changed_pages(hashes, previous)
+            if response_format == "json":
+                return JSONResponse({
+                    "key": cache_key,
+                    "since": since,
+                    "full": previous is None,
+                    "pages": len(hashes),
+                    "page_hashes": hashes,
+                    "changed": changed,
+                })
+
+            headers = {
+                "X-Compile-Key": cache_key,
+                "X-Page-Count": str(len(hashes)),
+                "X-Changed-Pages": ",".join(map(str, changed)),
+            }
+            if not changed:
+                return Response(status_code=204, headers=headers)
+            content = await asyncio.to_thread(extract_pages, pdf_path, changed)
+            return Response(content=content, media_type="application/pdf", headers=headers)
+        finally:
+            pdf_cache.unpin(cache_key)
+
+    @staticmethod
+    async def compile_source(
+        content: bytes,
+        filename: str,
+        session_id: str | None = None,
+        on_event: EventCallback | None = None,
+        max_errors: int | None = None,
+        engine: str = DEFAULT_ENGINE,
+        files: dict[str, str] | None = None,
+    ) -> CompileOutcome:
+        """Compile LaTeX source into the PDF cache with `engine`.
+
+        For a multi-file project, `files` maps every project path (including
+        `filename`, whose source is `content`) to its digest in the asset
+        store, and the compile key covers the whole mapping.
+
+        With `max_errors` set, the engine is killed as soon as that many errors
+        have been logged rather than left to grind through the rest of a
+        broken document. Sources that fail the structural pre-lint are
+        rejected without starting TeX at all.
+
+        Raises CompileQueueFullError when the pool is saturated,
+        CompileSupersededError when a newer compile for the same session
+        replaced this one, and FileNotFoundError when the engine is missing. A
+        document that fails to compile is not an exception: the outcome just
+        has no `pdf_path`. MissingAssetsError means some project file has to
+        be uploaded again.
+        """
+        if files is None:
+            cache_key = pdf_cache.make_key(content, engine, {"jobname": Path(filename).stem})
+        else:
+            cache_key = pdf_cache.make_key(
+                json.dumps(files, sort_keys=True).encode("utf-8"),
+                engine,
+                {"jobname": Path(filename).stem, "main": filename},
+            )
+        cached_pdf = pdf_cache.get(cache_key)
+        if cached_pdf is not None:
+            return CompileOutcome(cache_key=cache_key, pdf_path=cached_pdf, cache_hit=True)
+
+        if settings.compile_prelint:
+            issues = lint_latex(content.decode("utf-8", errors="replace"))
+            # Warnings are things TeX may still get right, so only errors reject
+            if on_event:
+                for issue in issues:
+                    if issue.severity == "warning":
+                        on_event({
+                            "type": "warning",
+                            "source": "lint",
+                            "file": filename,
+                            "line": issue.line,
+                            "column": issue.column,
+                            "message": issue.message,
+                        })
+            issues = [i for i in issues if i.severity == "error"]
+            if issues:
+                errors = [
+                    {"type": "error", "file": filename, "line": i.line, "column": i.column, "message": i.message}
+                    for i in issues
+                ]
+                if on_event:
+                    for error in errors:
+                        on_event(error)
+                return CompileOutcome(
+                    cache_key=cache_key,
+                    pdf_path=None,
+                    cache_hit=False,
+                    errors=errors,
+                    rejected=True,
+                )
+
+        compile_work = PDFService._compile_in_workspace(
+            content,
+            filename,
+            engine,
+            cache_key,
+            session_id,
+            on_event,
+            max_errors,
+            files,
+        )
+        if session_id:
+            # While someone types only the newest version is worth compiling
+            return await session_coalescer.run(session_id, compile_work)
+        return await compile_work
+
+    @staticmethod
+    async def _compile_in_workspace(
+        content: bytes,
+        filename: str,
+        engine: str,
+        cache_key: str,
+        session_id: str | None,
+        on_event: EventCallback | None,
+        max_errors: int | None,
+        files: dict[str, str] | None = None,
+    ) -> CompileOutcome:
+        async with workspace_manager.acquire(session_id) as work_dir:
+            if files is not None:
+                asset_store.materialize(files, work_dir)
+                tex_file = work_dir / filename
+            else:
+                tex_file = work_dir / Path(filename).name
+                # After a project compile this may be a link into the asset store
+                tex_file.unlink(missing_ok=True)
+                tex_file.write_bytes(content)
+            split = split_preamble(content.decode("utf-8", errors="replace"))
+            preamble = split[0] if split else None
+            if engine not in FORMAT_ENGINES:
+                preamble = None
+            fmt = format_cache.lookup(preamble, engine) if preamble else None
+
+            pdf_file = tex_file.with_suffix('.pdf')
+            # A PDF left over from the previous compile must not pass for this
+            # one. Unlinking (rather than letting TeX truncate it) also keeps
+            # the hard-linked cache entry intact.
+            pdf_file.unlink(missing_ok=True)
+
+            async with compile_executor.slot():
+                outcome = await PDFService._compile_passes(engine, work_dir, tex_file, pdf_file, fmt, on_event, max_errors)
+                if fmt and not pdf_file.exists() and not outcome.stopped_early and not outcome.limit:
+                    # A stale or broken format shouldn't fail the compile
+                    format_cache.discard(fmt)
+                    fmt = None
+                    outcome = await PDFService._compile_passes(engine, work_dir, tex_file, pdf_file, None, on_event, max_errors)
+
+            if preamble and not fmt and pdf_file.exists():
+                format_cache.schedule_build(preamble, engine)
+
+            outcome.cache_key = cache_key
+            if pdf_file.exists():
+                outcome.pdf_path = pdf_cache.put(cache_key, pdf_file)
+        if outcome.pdf_path is not None:
+            # Index now, while the PDF is certainly cached, so a later delta
+            # against this version knows its pages
+            pdf_cache.pin(cache_key)
+            try:
+                await page_index.index(cache_key, outcome.pdf_path)
+            finally:
+                pdf_cache.unpin(cache_key)
+        return outcome
+
+    @staticmethod
+    def _check_engine(engine: str) -> None:
+        if engine not in ENGINES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported engine: {engine}. Choose one of {', '.join(ENGINES)}"
+            )
+        if shutil.which(engine) is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Engine {engine} is not installed on this server"
+            )
+
+    @staticmethod
+    async def _read_upload(file: UploadFile, session_id: str | None) -> bytes:
         if not file.filename.endswith('.tex'):
             raise HTTPException(
                 status_code=400,
                 detail="Only .tex files are allowed"
             )
+        if session_id and not workspace_manager.is_valid_session(session_id):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid session id"
+            )
+        return await file.read()
+
+    @staticmethod
+    def _checked_project_path(name: str | None) -> str:
+        path = project_path(name or "")
+        if path is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid project path: {name!r}"
+            )
+        return path
+
+    @staticmethod
+    def _read_bundle(bundle: UploadFile) -> dict[str, bytes]:
+        """Unpack a zip bundle into project paths and contents."""
+        limit = settings.project_max_mb * 1024 * 1024
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir)
-                tex_file = temp_path / file.filename
-                content = await file.read()
-                tex_file.write_bytes(content)
-                result = subprocess.run([
-                    'pdflatex', 
-                    '-output-directory', str(temp_path),
-                    '-interaction=nonstopmode',  # Don't stop for errors
-                    str(tex_file)
-                ], capture_output=True, text=True, cwd=temp_path)
-                
-                pdf_filename = file.filename.replace('.tex', '.pdf')
-                pdf_file = temp_path / pdf_filename
-                
-                if not pdf_file.exists():
+            with zipfile.ZipFile(bundle.file) as archive:
+                entries = [info for info in archive.infolist() if not info.is_dir()]
+                if len(entries) > settings.project_max_files:
                     raise HTTPException(
-                        status_code=400, 
-                        detail=f"LaTeX compilation failed: {result.stderr}"
+                        status_code=400,
+                        detail=f"At most {settings.project_max_files} files per project"
                     )
-                
-                output_dir = Path("output")
-                output_dir.mkdir(exist_ok=True)
-                
-                output_pdf = output_dir / "compiled.pdf"
-                shutil.copy2(pdf_file, output_pdf)
-                
-                return FileResponse(
-                    path=str(output_pdf),
-                    media_type="application/pdf",
-                    filename="compiled.pdf"
-                )
-                
-        except FileNotFoundError:
+                if sum(info.file_size for info in entries) > limit:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Project uploads are limited to {settings.project_max_mb} MB"
+                    )
+                paths = {PDFService._checked_project_path(info.filename): info for info in entries}
+                return {path: archive.read(info) for path, info in paths.items()}
+        except zipfile.BadZipFile:
             raise HTTPException(
-                status_code=500,
-                detail="pdflatex not found. Please install LaTeX (MiKTeX or TeX Live)"
+                status_code=400,
+                detail="Project bundle is not a valid zip file"
             )
-        except Exception as e:
-            raise HTTPException(
+
+    @staticmethod
+    def _failure_message(outcome: CompileOutcome) -> str:
+        if outcome.rejected:
+            return "LaTeX source failed pre-compile checks"
+        if outcome.limit:
+            return f"LaTeX compilation exceeded its {outcome.limit} limit"
+        return "LaTeX compilation failed"
+
+    @staticmethod
+    def _failure_detail(outcome: CompileOutcome) -> dict[str, Any]:
+        """Structured diagnostics for a compile that produced no PDF.
+
+        The log tail is included whenever the parser found no error to
+        point at, since TeX reports some failures only in free-form text.
+        """
+        detail = {
+            "message": PDFService._failure_message(outcome),
+            "stopped_early": outcome.stopped_early,
+            "rejected": outcome.rejected,
+            "limit": outcome.limit,
+            "errors": outcome.errors,
+        }
+        if not outcome.errors and outcome.log_tail:
+            detail["log_tail"] = outcome.log_tail
+        return detail
+
+    @staticmethod
+    def _compile_error(e: Exception) -> HTTPException:
+        if isinstance(e, HTTPException):
+            return e
+        if isinstance(e, CompileSupersededError):
+            return HTTPException(
+                status_code=409,
+                detail="Superseded by a newer compile for this session"
+            )
+        if isinstance(e, MissingAssetsError):
+            return HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Some project files need to be uploaded",
+                    "missing": e.missing,
+                }
+            )
+        if isinstance(e, CompileQueueFullError):
+            return queue_full_error(e)
+        if isinstance(e, FileNotFoundError):
+            return HTTPException(
                 status_code=500,
-                detail=f"PDF compilation error: {str(e)}"
+                detail="LaTeX engine not found. Please install LaTeX (MiKTeX or TeX Live)"
             )
+        return HTTPException(
+            status_code=500,
+            detail=f"PDF compilation error: {str(e)}"
+        )
+
+    @staticmethod
+    async def _indexed_pages(cache_key: str) -> list[str] | None:
+        """Page hashes of an earlier version, indexing its PDF if it is still cached."""
+        hashes = page_index.get(cache_key)
+        if hashes is not None:
+            return hashes
+        pdf_path = pdf_cache.get(cache_key, count=False)
+        if pdf_path is None:
+            return None
+        pdf_cache.pin(cache_key)
+        try:
+            return await page_index.index(cache_key, pdf_path)
+        finally:
+            pdf_cache.unpin(cache_key)
+
+    @staticmethod
+    async def _page_headers(cache_key: str, pdf_path: Path, pages: int = 0) -> dict[str, str]:
+        # The hashes are too long for a header; get_pages serves them
+        count = pages or await page_index.page_count(cache_key, pdf_path)
+        if not count:
+            return {}
+        return {"X-Page-Count": str(count)}
+
+    @staticmethod
+    def _pdf_response(cache_key: str, pdf_path: Path, headers: dict[str, str]) -> FileResponse:
+        """Serve a cached PDF directly, pinned against eviction until sent.
 
-        
\ No newline at end of file
+        Cache entries are content-addressed and never rewritten in place, so
+        concurrent requests can't end up with each other's output.
+        """
+        pdf_cache.pin(cache_key)
+        return FileResponse(
+            path=str(pdf_path),
+            media_type="application/pdf",
+            filename="compiled.pdf",
+            headers={"X-Compile-Key": cache_key, **headers},
+            background=BackgroundTask(pdf_cache.unpin, cache_key)
+        )
+
+    @staticmethod
+    async def _compile_passes(
+        engine: str,
+        work_dir: Path,
+        tex_file: Path,
+        pdf_file: Path,
+        fmt: str | None,
+        on_event: EventCallback | None,
+        max_errors: int | None = None,
+    ) -> CompileOutcome:
+        """Run the engine until the auxiliary files stop changing.
+
+        In a persistent workspace the aux files from the last compile are
+        usually still valid, so a single pass is enough for most edits.
+        Tectonic does its own reruns and always gets exactly one pass.
+        """
+        max_passes = 1 if engine == "tectonic" else settings.compile_max_passes
+        fingerprint = aux_fingerprint(work_dir)
+        passes = 0
+        while True:
+            passes += 1
+            parser = TexLogParser(tex_file.name)
+            if on_event:
+                on_event({"type": "pass", "pass": passes})
+
+            def on_output(text: str) -> bool:
+                for event in parser.feed(text):
+                    if on_event:
+                        on_event(event)
+                return bool(max_errors) and len(parser.errors) >= max_errors
+
+            result = await PDFService._run_engine(engine, work_dir, tex_file, fmt, on_output)
+            for event in parser.close():
+                if on_event:
+                    on_event(event)
+            if result.stopped or result.limit:
+                # Whatever TeX managed to write before being killed is truncated
+                pdf_file.unlink(missing_ok=True)
+
+            done = not pdf_file.exists() or passes >= max_passes
+            if not done:
+                new_fingerprint = aux_fingerprint(work_dir)
+                done = new_fingerprint == fingerprint
+                fingerprint = new_fingerprint
+            if done:
+                return CompileOutcome(
+                    cache_key="",
+                    pdf_path=None,
+                    cache_hit=False,
+                    passes=passes,
+                    pages=parser.pages,
+                    log_tail=PDFService._log_tail(result),
+                    errors=parser.errors[:max_errors] if max_errors else parser.errors,
+                    warnings=parser.warnings,
+                    stopped_early=result.stopped,
+                    limit=result.limit,
+                )
+
+    @staticmethod
+    def _log_tail(result: ProcessResult) -> str:
+        # TeX writes its errors to stdout; stderr only has what crashed the engine
+        lines = (result.stdout + result.stderr).rstrip().splitlines()
+        return "\n".join(lines[-LOG_TAIL_LINES:])
+
+    @staticmethod
+    async def _run_engine(
+        engine: str,
+        work_dir: Path,
+        tex_file: Path,
+        fmt: str | None,
+        on_output: Callable[[str], bool] | None = None,
+    ) -> ProcessResult:
+        env = format_cache.env() if fmt else dict(os.environ)
+        # Keep log lines whole so they can be parsed as they stream
+        env["max_print_line"] = "10000"
+        return await compile_executor.run_process(
+            engine_command(engine, work_dir, tex_file, fmt),
+            cwd=work_dir,
+            env=env,
+            on_output=on_output,
+        )
@@ -0,0 +1,191 @@
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Pieces are trimmed in this order, lowest priority first
+PRIORITY = {"template": 0, "transcript": 1, "context": 2, "tex": 3, "prompt": 4}
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+_COMMENT = re.compile(r"(?<!\\)%.*$")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate BPE token count, computed locally.
+
+    Every punctuation mark is a token and words cost one token per four
+    characters, which slightly overestimates typical tokenizers, so a
+    prompt that fits this count fits the model.
+    """
+    return sum(max(1, math.ceil(len(token) / 4)) for token in _TOKEN.findall(text))
+
+
+def strip_latex_comments(text: str) -> str:
+    """Drop `%` comments (not `\\%`) and the lines left empty by them."""
+    lines = []
+    for line in text.split("\n"):
+        stripped = _COMMENT.sub("", line).rstrip()
+        if stripped or not line.strip():
+            lines.append(stripped)
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines))
+
+
+def dedupe_lines(text: str) -> str:
+    """Remove repeated non-blank lines, keeping the first occurrence."""
+    seen: set[str] = set()
+    lines = []
+    for line in text.split("\n"):
+        key = line.strip()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines))
+
+
+def summarize(text: str, max_tokens: int) -> str:
+    """Extractive summary of `text` within `max_tokens`.
+
+    Sentences are scored by how frequent their words are in the whole text
+    (so the recurring topics win), and the best ones are kept in their
+    original order. Text without usable sentence breaks is truncated.
+    """
+    sentences = [s.strip() for s in _SENTENCE.split(text) if s.strip()]
+    frequency: dict[str, int] = {}
+    for sentence in sentences:
+        for word in re.findall(r"\w{4,}", sentence.lower()):
+            frequency[word] = frequency.get(word, 0) + 1
+
+    def score(sentence: str) -> float:
+        words = re.findall(r"\w{4,}", sentence.lower())
+        return sum(frequency[w] for w in words) / math.sqrt(len(words)) if words else 0.0
+
+    kept: set[int] = set()
+    used = 0
+    for index in sorted(range(len(sentences)), key=lambda i: score(sentences[i]), reverse=True):
+        cost = count_tokens(sentences[index])
+        if used + cost <= max_tokens:
+            kept.add(index)
+            used += cost
+    if not kept:
+        return truncate(text, max_tokens)
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Keep the start of `text` within `max_tokens`, cutting at a line or word boundary."""
+    lines = []
+    used = 0
+    for line in text.split("\n"):
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            words = []
+            for word in line.split():
+                used += count_tokens(word)
+                if used > max_tokens:
+                    break
+                words.append(word)
+            if words:
+                lines.append(" ".join(words))
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+@dataclass
+class PromptPiece:
+    """One part of a prompt: the request itself, an attachment or an example.
+
+    `kind` is a key of PRIORITY and decides both the trimming order and how
+    the piece is compressed. Required pieces are never trimmed.
+    """
+    name: str
+    kind: str
+    text: str
+    required: bool = False
+    original_tokens: int = 0
+    actions: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.original_tokens = count_tokens(self.text)
+
+    @property
+    def tokens(self) -> int:
+        return count_tokens(self.text)
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "original_tokens": self.original_tokens,
+            "tokens": self.tokens,
+            "actions": self.actions,
+        }
+
+
+def _compress(piece: PromptPiece) -> None:
+    # Changes the model doesn't need to see, done whatever the budget.
+    # Repeated lines are normal in LaTeX and `%` is literal in prose, so
+    # each kind only gets the compression that is safe for it.
+    if piece.kind == "template":
+        text, action = strip_latex_comments(piece.text), "comments stripped"
+    elif piece.kind in ("context", "transcript"):
+        text, action = dedupe_lines(piece.text), "deduplicated"
+    else:
+        return
+    if text != piece.text:
+        piece.text = text
+        piece.actions.append(action)
+
+
+def _shrink(piece: PromptPiece, allowance: int) -> None:
+    if allowance <= 0:
+        piece.text = ""
+        piece.actions.append("dropped")
+        return
+    if piece.kind == "tex" and "%" in piece.text:
+        piece.text = strip_latex_comments(piece.text)
+        piece.actions.append("comments stripped")
+        if piece.tokens <= allowance:
+            return
+    if piece.kind in ("transcript", "context"):
+        piece.text = summarize(piece.text, allowance)
+        piece.actions.append("summarized")
+    else:
+        dropped = piece.tokens
+        piece.text = truncate(piece.text, allowance)
+        piece.actions.append(f"truncated ({dropped - piece.tokens} tokens dropped)")
+
+
+def fit_pieces(pieces: list[PromptPiece], budget: int) -> dict[str, Any]:
+    """Compress and trim `pieces` in place so together they fit `budget` tokens.
+
+    Required pieces are counted first. The rest of the budget goes to the
+    other pieces from highest priority down; pieces of the same kind split
+    what is left evenly, and one that needs less than its share passes the
+    remainder on. Returns a report of what was done to each piece.
+    """
+    for piece in pieces:
+        _compress(piece)
+
+    remaining = budget - sum(p.tokens for p in pieces if p.required)
+    optional = [p for p in pieces if not p.required]
+    for kind in sorted({p.kind for p in optional}, key=lambda k: PRIORITY[k], reverse=True):
+        group = sorted((p for p in optional if p.kind == kind), key=lambda p: p.tokens)
+        for position, piece in enumerate(group):
+            share = max(remaining, 0) // (len(group) - position)
+            if piece.tokens > share:
+                _shrink(piece, share)
+            remaining -= piece.tokens
+
+    total = sum(p.tokens for p in pieces)
+    if total > budget:
+        logger.warning(f"PROMPT_BUDGET: Required pieces alone take {total} of {budget} tokens")
+    return {"budget": budget, "tokens": total, "pieces": [p.report() for p in pieces]}
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+
+from app.core.config import settings
+from app.services.compile_cache import CACHE_KEY, CompileCache, pdf_cache
+from app.services.compile_executor import compile_executor, queue_full_error, CompileQueueFullError, ResourceLimits
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; only needed for WebP
+    Image = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+# Page renders are quick; anything slower than this is a pathological PDF
+RASTER_LIMITS = ResourceLimits(wall_seconds=30, cpu_seconds=30, memory_mb=1024, output_mb=100)
+
+raster_caches = {
+    image_format: CompileCache(
+        Path(settings.raster_cache_dir) / image_format,
+        settings.raster_cache_max_mb * 1024 * 1024 // len(MEDIA_TYPES),
+        suffix=f".{image_format}",
+    )
+    for image_format in MEDIA_TYPES
+}
+
+
+class RasterService:
+    """Render single pages of compiled PDFs to images.
+
+    Pages are rendered with pdftoppm at the requested DPI and cached by PDF
+    key, page and DPI, so the editor can show page 1 of a large document
+    without downloading it and browse the rest lazily. WebP output needs
+    Pillow.
+    """
+
+    @staticmethod
+    async def render_page(cache_key: str, page: int, dpi: int, image_format: str) -> FileResponse:
+        if image_format not in MEDIA_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported image format: {image_format}. Choose png or webp"
+            )
+        if image_format == "webp" and Image is None:
+            raise HTTPException(
+                status_code=400,
+                detail="WebP output requires Pillow to be installed"
+            )
+
+        if page < 1:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Page {page} not found"
+            )
+
+        cache = raster_caches[image_format]
+        image_key = f"{cache_key}-p{page}-d{dpi}"
+        image_path = cache.get(image_key) if CACHE_KEY.match(cache_key) else None
+        if image_path is None:
+            pdf_path = pdf_cache.get(cache_key, count=False) if CACHE_KEY.match(cache_key) else None
+            if pdf_path is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail="Compiled PDF not found"
+                )
+            pdf_cache.pin(cache_key)
+            try:
+                image_path = await RasterService._rasterize(pdf_path, image_key, page, dpi, image_format)
+            finally:
+                pdf_cache.unpin(cache_key)
+
+        cache.pin(image_key)
+        return FileResponse(
+            path=str(image_path),
+            media_type=MEDIA_TYPES[image_format],
+            headers={"Cache-Control": "public, max-age=31536000, immutable"},
+            background=BackgroundTask(cache.unpin, image_key)
+        )
+
+    @staticmethod
+    async def _rasterize(pdf_path: Path, image_key: str, page: int, dpi: int, image_format: str) -> Path:
+        if shutil.which("pdftoppm") is None:
+            raise HTTPException(
+                status_code=500,
+                detail="pdftoppm not found. Please install poppler-utils"
+            )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            prefix = Path(temp_dir) / "page"
+            try:
+                async with compile_executor.slot():
+                    result = await compile_executor.run_process([
+                        "pdftoppm",
+                        "-png",
+                        "-r", str(dpi),
+                        "-f", str(page),
+                        "-l", str(page),
+                        "-singlefile",
+                        str(pdf_path),
+                        str(prefix),
+                    ], cwd=temp_dir, limits=RASTER_LIMITS)
+            except CompileQueueFullError as e:
+                raise queue_full_error(e)
+
+            png_path = prefix.with_suffix(".png")
+            if not png_path.exists():
+                if result.limit:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"Page rendering exceeded its {result.limit} limit"
+                    )
+                # pdftoppm produces nothing for a page past the end
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Page {page} not found"
+                )
+
+            if image_format == "webp":
+                webp_path = prefix.with_suffix(".webp")
+                await asyncio.to_thread(RasterService._to_webp, png_path, webp_path)
+                return raster_caches["webp"].put(image_key, webp_path)
+            return raster_caches["png"].put(image_key, png_path)
+
+    @staticmethod
+    def _to_webp(png_path: Path, webp_path: Path) -> None:
+        with Image.open(png_path) as image:
+            image.save(webp_path, format="WEBP", quality=85, method=4)
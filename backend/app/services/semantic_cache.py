@@ -0,0 +1,227 @@
+import hashlib
+import re
+import time
+from typing import Any
+
+from app.core.config import settings
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; without it the semantic cache is off
+    np = None
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CASED_WORD = re.compile(r"[A-Za-z0-9]+")
+# Filler and request verbs that change the wording of a request but not
+# what is asked for
+_STOPWORDS = frozenset(
+    "a an the me my i we us our you your please can could would will kindly "
+    "for to of and with some just now it this that is be in up "
+    "create make write generate give build produce draft need want like get".split()
+)
+_NUMBER_WORDS = frozenset(
+    "one two three four five six seven eight nine ten eleven twelve "
+    "single double triple first second third fourth fifth".split()
+)
+# Lower edge of the similarity histogram; anything below lands in the first bucket
+HISTOGRAM_FLOOR = 0.5
+HISTOGRAM_BUCKETS = 10
+# Rows allocated up front; the matrix doubles from here up to max_entries
+INITIAL_ROWS = 64
+
+
+def _feature(name: str, dim: int) -> tuple[int, float]:
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def _stem(word: str) -> str:
+    # Just enough to make "columns" and "column" the same word
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def content_words(text: str) -> list[str]:
+    """The words of `text` that say what is asked for, in order, minus filler."""
+    return [_stem(word) for word in _WORD.findall(text.lower()) if word not in _STOPWORDS]
+
+
+def distinctive_words(text: str) -> frozenset[str]:
+    """Names and numbers in `text`: the words a reworded request must keep.
+
+    Names are words capitalised anywhere but at the very start. Two prompts
+    that differ in one of these ask for different things ("resume for John
+    Smith" and "resume for Jane Smith") however similar they look otherwise.
+    """
+    words = _CASED_WORD.findall(text)
+    return frozenset(
+        word.lower()
+        for index, word in enumerate(words)
+        if any(c.isdigit() for c in word)
+        or word.lower() in _NUMBER_WORDS
+        or (index > 0 and word[0].isupper())
+    )
+
+
+def _guard(text: str) -> int:
+    # One integer per prompt, so rows can be compared with a vector op
+    names = "\0".join(sorted(distinctive_words(text)))
+    return int.from_bytes(hashlib.blake2b(names.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def embed(text: str, dim: int) -> "np.ndarray":
+    """Unit-length hashing-trick vector for `text`.
+
+    Words (minus filler such as "please" or "create"), word pairs and
+    character trigrams of each word are hashed into `dim` signed buckets
+    with sublinear term frequency. Trigrams let "two-column" and "columns"
+    share weight; pairs keep some word order.
+    No model is loaded, so embedding is a few microseconds of CPU.
+    """
+    words = content_words(text)
+    counts: dict[str, int] = {}
+    for word in words:
+        counts[f"w:{word}"] = counts.get(f"w:{word}", 0) + 1
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            counts[f"c:{padded[i:i + 3]}"] = counts.get(f"c:{padded[i:i + 3]}", 0) + 1
+    for first, second in zip(words, words[1:]):
+        counts[f"b:{first} {second}"] = counts.get(f"b:{first} {second}", 0) + 1
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for name, count in counts.items():
+        index, sign = _feature(name, dim)
+        vector[index] += sign * (1.0 + np.log(count))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Reuse answers to prompts that mean the same thing in other words.
+
+    Prompts are embedded with `embed` and kept in one matrix, grown as
+    entries arrive, so a lookup is a single matrix-vector product over every
+    stored row. The most similar row is reused when it was stored under the
+    same scope (model and system prompt), has not expired, names the same
+    names and numbers as the prompt (see `distinctive_words`) and its cosine
+    similarity reaches `threshold`. When full, an expired row or else the
+    least recently used one is overwritten.
+
+    A histogram of best-match similarities across all lookups shows how
+    close the near misses were, which is what to look at when tuning the
+    threshold.
+    """
+
+    def __init__(self, dim: int, max_entries: int, threshold: float):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._hit_similarity = 0.0
+        self._histogram = [0] * HISTOGRAM_BUCKETS
+        self._size = 0
+        self._scope_ids: dict[str, int] = {}
+        self._values: list[Any] = []
+        self._vectors = None
+        self._scopes = None
+        self._guards = None
+        self._expires = None
+        self._last_used = None
+
+    @property
+    def available(self) -> bool:
+        return np is not None
+
+    def lookup(self, scope: str, prompt: str) -> tuple[Any, float] | None:
+        """The stored value closest to `prompt` and its similarity, if close enough."""
+        scope_id = self._scope_ids.get(scope)
+        if not self._size or scope_id is None:
+            self.misses += 1
+            return None
+        size = self._size
+        similarities = self._vectors[:size] @ embed(prompt, self.dim)
+        live = (self._scopes[:size] == scope_id) & (self._expires[:size] > time.time())
+        similarities = np.where(live, similarities, -1.0)
+        # The histogram shows the closest match of any wording, near misses included
+        self._record(min(float(similarities.max()), 1.0))
+        similarities = np.where(self._guards[:size] == _guard(prompt), similarities, -1.0)
+        best = int(np.argmax(similarities))
+        similarity = min(float(similarities[best]), 1.0)
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._hit_similarity += similarity
+        self._last_used[best] = time.monotonic()
+        return self._values[best], similarity
+
+    def store(self, scope: str, prompt: str, value: Any, ttl: int) -> None:
+        """Keep `value` for `ttl` seconds; a TTL of 0 stores nothing."""
+        if ttl <= 0:
+            return
+        if self._size < self.max_entries:
+            self._grow(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._values.append(value)
+        else:
+            # Expired rows go first, then the least recently used
+            expired = self._expires < time.time()
+            row = int(np.argmin(np.where(expired, -np.inf, self._last_used)))
+            self._values[row] = value
+        self._vectors[row] = embed(prompt, self.dim)
+        self._scopes[row] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+        self._guards[row] = _guard(prompt)
+        self._expires[row] = time.time() + ttl
+        self._last_used[row] = time.monotonic()
+
+    def _grow(self, rows: int) -> None:
+        capacity = 0 if self._vectors is None else len(self._vectors)
+        if rows <= capacity:
+            return
+        capacity = min(max(INITIAL_ROWS, capacity * 2), self.max_entries)
+        size = self._size
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        scopes = np.zeros(capacity, dtype=np.int32)
+        guards = np.zeros(capacity, dtype=np.int64)
+        expires = np.zeros(capacity, dtype=np.float64)
+        last_used = np.zeros(capacity, dtype=np.float64)
+        if size:
+            vectors[:size] = self._vectors[:size]
+            scopes[:size] = self._scopes[:size]
+            guards[:size] = self._guards[:size]
+            expires[:size] = self._expires[:size]
+            last_used[:size] = self._last_used[:size]
+        self._vectors, self._scopes, self._guards = vectors, scopes, guards
+        self._expires, self._last_used = expires, last_used
+
+    def _record(self, similarity: float) -> None:
+        width = (1.0 - HISTOGRAM_FLOOR) / HISTOGRAM_BUCKETS
+        bucket = int((similarity - HISTOGRAM_FLOOR) / width)
+        self._histogram[min(max(bucket, 0), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        width = (1.0 - HISTOGRAM_FLOOR) / HISTOGRAM_BUCKETS
+        return {
+            "available": self.available,
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "allocated_rows": 0 if self._vectors is None else len(self._vectors),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "mean_hit_similarity": self._hit_similarity / self.hits if self.hits else None,
+            "best_match_histogram": {
+                f"{HISTOGRAM_FLOOR + i * width:.2f}": count for i, count in enumerate(self._histogram)
+            },
+        }
+
+
+semantic_cache = SemanticCache(
+    settings.semantic_cache_dim,
+    settings.semantic_cache_max_entries,
+    settings.semantic_cache_threshold,
+)
@@ -0,0 +1,123 @@
+import re
+from typing import Any
+
+# `./doc.tex:12: Undefined control sequence.` (needs -file-line-error)
+FILE_LINE_ERROR = re.compile(r"^(?P<file>.+?):(?P<line>\d+): (?P<message>.+)$")
+# `! Undefined control sequence.` (classic error format)
+BANG_ERROR = re.compile(r"^! (?P<message>.+)$")
+# `l.12 \foo` context line that follows a classic error
+ERROR_CONTEXT = re.compile(r"^l\.(?P<line>\d+)\b")
+WARNING = re.compile(
+    r"^(?P<source>LaTeX|LaTeX Font|pdfTeX|Package [\w.-]+|Class [\w.-]+) Warning: (?P<message>.+)$"
+)
+BAD_BOX = re.compile(r"^(?P<message>(?:Overfull|Underfull) \\[hv]box .+)$")
+# `(./doc.aux` or `(/usr/share/texlive/.../article.cls`
+FILE_OPEN = re.compile(r"\((?P<path>(?:[A-Za-z]:)?[./\\][^\s()\[\]{}]*\.[A-Za-z0-9]+)")
+# `[1` `[2 <./img.png>]` `[3{/.../pdftex.map}]`
+PAGE = re.compile(r"\[(?P<page>\d+)(?=[\s\]{<]|$)")
+
+# Lines a classic error may span before its `l.N` context shows up
+MAX_CONTEXT_LINES = 8
+
+
+class TexLogParser:
+    """Incremental parser for TeX terminal output.
+
+    Feed it chunks as they arrive and it returns structured events:
+
+      {"type": "page", "page": 3}
+      {"type": "file", "path": "/.../article.cls"}
+      {"type": "warning", "source": "LaTeX", "message": "..."}
+      {"type": "error", "file": "./doc.tex", "line": 12, "message": "..."}
+
+    Expects TeX to run with `max_print_line` raised so messages aren't
+    wrapped at 79 columns. Page markers are reported on the fly; everything
+    else once its line is complete.
+    """
+
+    def __init__(self, filename: str | None = None):
+        self.filename = filename
+        self.pages = 0
+        self.errors: list[dict[str, Any]] = []
+        self.warnings: list[dict[str, Any]] = []
+        self._buffer = ""
+        self._pending_error: dict[str, Any] | None = None
+        self._pending_lines = 0
+
+    def feed(self, text: str) -> list[dict[str, Any]]:
+        events: list[dict[str, Any]] = []
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self._parse_line(line.rstrip("\r"), events)
+        # Page markers are printed without a newline; report them right away
+        self._scan_pages(self._buffer, events)
+        return events
+
+    def close(self) -> list[dict[str, Any]]:
+        events: list[dict[str, Any]] = []
+        if self._buffer:
+            self._parse_line(self._buffer, events, pages_seen=True)
+            self._buffer = ""
+        self._flush_error(events)
+        return events
+
+    def _parse_line(self, line: str, events: list[dict[str, Any]], pages_seen: bool = False) -> None:
+        if self._pending_error is not None:
+            context = ERROR_CONTEXT.match(line)
+            self._pending_lines += 1
+            if context:
+                self._pending_error["line"] = int(context.group("line"))
+                self._flush_error(events)
+                return
+            if self._pending_lines > MAX_CONTEXT_LINES:
+                self._flush_error(events)
+
+        match = FILE_LINE_ERROR.match(line)
+        if match and not line.startswith("("):
+            self._flush_error(events)
+            self._emit_error(events, match.group("file"), int(match.group("line")), match.group("message"))
+            return
+        match = BANG_ERROR.match(line)
+        if match:
+            self._flush_error(events)
+            self._pending_error = {"file": self.filename, "line": None, "message": match.group("message")}
+            self._pending_lines = 0
+            return
+        match = WARNING.match(line)
+        if match:
+            self._emit_warning(events, match.group("source"), match.group("message"))
+            return
+        match = BAD_BOX.match(line)
+        if match:
+            self._emit_warning(events, "TeX", match.group("message"))
+            return
+
+        for file_match in FILE_OPEN.finditer(line):
+            events.append({"type": "file", "path": file_match.group("path")})
+        if not pages_seen:
+            self._scan_pages(line, events)
+
+    def _scan_pages(self, text: str, events: list[dict[str, Any]]) -> None:
+        for match in PAGE.finditer(text):
+            page = int(match.group("page"))
+            # Only count the next page in sequence; other brackets are noise
+            if page == self.pages + 1:
+                self.pages = page
+                events.append({"type": "page", "page": page})
+
+    def _flush_error(self, events: list[dict[str, Any]]) -> None:
+        if self._pending_error is not None:
+            error = self._pending_error
+            self._pending_error = None
+            self._emit_error(events, error["file"], error["line"], error["message"])
+
+    def _emit_error(self, events: list[dict[str, Any]], file: str | None, line: int | None, message: str) -> None:
+        error = {"type": "error", "file": file, "line": line, "message": message.strip()}
+        self.errors.append(error)
+        events.append(error)
+
+    def _emit_warning(self, events: list[dict[str, Any]], source: str, message: str) -> None:
+        warning = {"type": "warning", "source": source, "message": message.strip()}
+        self.warnings.append(warning)
+        events.append(warning)
@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import logging
+import re
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
+
+from app.core.config import settings
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+MARKER = ".last_used"
+
+# Auxiliary files whose contents feed back into the next pass
+AUX_SUFFIXES = (".aux", ".toc", ".out", ".lof", ".lot", ".nav", ".snm")
+# Lines the kernel writes on every run that never need another pass
+TRIVIAL_AUX_LINES = re.compile(r"^\\(relax|gdef\s*\\@abspage@last\{\d+\})\s*$")
+
+
+def aux_fingerprint(work_dir: Path) -> str:
+    """Hash the auxiliary files in a workspace.
+
+    When this changes across a pass, cross-references, the table of contents
+    or bookmarks may still be stale and TeX should run again.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(p for p in work_dir.rglob("*") if p.suffix in AUX_SUFFIXES and p.is_file()):
+        lines = [
+            line for line in path.read_bytes().decode("utf-8", errors="replace").splitlines()
+            if line.strip() and not TRIVIAL_AUX_LINES.match(line.strip())
+        ]
+        if not lines:
+            continue
+        digest.update(str(path.relative_to(work_dir)).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update("\n".join(lines).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class WorkspaceManager:
+    """Per-session compile directories that survive between requests.
+
+    Keeping a session's directory means `.aux`, `.toc` and `.out` files from
+    the previous compile are already in place, so most edits settle in a
+    single pass. Compiles without a session get a throwaway directory.
+    Sessions idle for longer than `idle_seconds` are removed by an
+    opportunistic sweep that runs at most every `gc_interval` seconds.
+    """
+
+    def __init__(self, root: Path | str, idle_seconds: int, gc_interval: int = 60):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.idle_seconds = idle_seconds
+        self.gc_interval = gc_interval
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._last_gc = 0.0
+
+    @staticmethod
+    def is_valid_session(session_id: str) -> bool:
+        return bool(SESSION_ID.match(session_id))
+
+    @asynccontextmanager
+    async def acquire(self, session_id: str | None) -> AsyncIterator[Path]:
+        """Yield a working directory, exclusive to this caller while held."""
+        self.collect_if_due()
+        if not session_id:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                yield Path(temp_dir)
+            return
+
+        if not self.is_valid_session(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            path = self.root / session_id
+            path.mkdir(parents=True, exist_ok=True)
+            (path / MARKER).touch()
+            try:
+                yield path
+            finally:
+                (path / MARKER).touch()
+
+    def collect_if_due(self) -> None:
+        now = time.monotonic()
+        if now - self._last_gc >= self.gc_interval:
+            self._last_gc = now
+            self.collect()
+
+    def collect(self) -> int:
+        """Remove workspaces idle for longer than `idle_seconds`."""
+        cutoff = time.time() - self.idle_seconds
+        removed = 0
+        for path in self.root.iterdir():
+            if not path.is_dir():
+                continue
+            lock = self._locks.get(path.name)
+            if lock is not None and lock.locked():
+                continue
+            marker = path / MARKER
+            last_used = marker.stat().st_mtime if marker.exists() else path.stat().st_mtime
+            if last_used < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                self._locks.pop(path.name, None)
+                removed += 1
+        if removed:
+            logger.info(f"WORKSPACE: Collected {removed} idle workspace(s)")
+        return removed
+
+
+workspace_manager = WorkspaceManager(settings.workspace_dir, settings.workspace_idle_minutes * 60)
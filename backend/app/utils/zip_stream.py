@@ -0,0 +1,43 @@
+import io
+import zipfile
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer that ZipFile can stream into."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """Build a zip archive incrementally, handing back bytes as entries are added.
+
+    Because the sink can't seek, ZipFile writes each entry with a trailing
+    data descriptor, so every entry can be sent as soon as it is added and
+    the central directory goes out on `close()`.
+    """
+
+    def __init__(self):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w")
+
+    def add(self, name: str, data: bytes, compress: bool = True) -> bytes:
+        compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        self._zip.writestr(name, data, compress_type=compress_type)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        return self._sink.drain()
@@ -0,0 +1,282 @@
+"""Cross-engine LaTeX compile benchmark.
+
+Compiles a corpus (the six agent templates plus generated stress documents)
+with each installed engine and reports cold and warm p50/p95 latency and peak
+RSS. A cold compile starts from an empty directory without a preamble format;
+a warm compile reuses the previous run's aux files and, for engines that
+support it, a precompiled preamble format, the same way PDFService does for a
+session workspace.
+
+Usage (from backend/):
+    python benchmarks/compile_benchmark.py
+    python benchmarks/compile_benchmark.py --engines pdflatex xelatex --runs 10 --json results.json
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Add backend directory to Python path for direct execution
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+# Settings require a Groq key, which compiling never uses
+os.environ.setdefault("GROQ_API_KEY", "unused")
+
+from app.agent.templates.letter import LETTER_TEMPLATE
+from app.agent.templates.presentation import PRESENTATION_TEMPLATE
+from app.agent.templates.research import RESEARCH_TEMPLATE
+from app.agent.templates.swe_resume import SWE_RESUME_TEMPLATE
+from app.agent.templates.textbook import TEXTBOOK_TEMPLATE
+from app.agent.templates.two_row_resume import TWO_ROW_RESUME_TEMPLATE
+from app.services.format_cache import format_build_command, preamble_document, split_preamble
+from app.services.pdf_service import ENGINES, FORMAT_ENGINES, engine_command
+from app.services.workspace_service import aux_fingerprint
+
+MAX_PASSES = 3
+TIMEOUT_SECONDS = 300
+
+FILLER = (
+    "The quick brown fox jumps over the lazy dog while the committee reviews "
+    "the proposal, noting that every claim must be backed by measurement. "
+)
+
+
+def stress_long_document() -> str:
+    """A book with many chapters, a table of contents and cross-references."""
+    parts = [
+        "\\documentclass{book}\n\\usepackage{amsmath}\n\\usepackage{hyperref}\n",
+        "\\begin{document}\n\\tableofcontents\n",
+    ]
+    for chapter in range(1, 41):
+        parts.append(f"\\chapter{{Chapter {chapter}}}\\label{{ch:{chapter}}}\n")
+        for section in range(1, 6):
+            parts.append(f"\\section{{Section {chapter}.{section}}}\\label{{sec:{chapter}-{section}}}\n")
+            parts.append(FILLER * 12 + f"See Chapter~\\ref{{ch:{max(1, chapter - 1)}}}.\n\n")
+    parts.append("\\end{document}\n")
+    return "".join(parts)
+
+
+def stress_tikz_document() -> str:
+    """A single TikZ picture with thousands of nodes."""
+    return (
+        "\\documentclass{article}\n\\usepackage{tikz}\n\\begin{document}\n"
+        "\\begin{tikzpicture}[scale=0.05]\n"
+        "\\foreach \\x in {1,...,60} {\n"
+        "  \\foreach \\y in {1,...,60} {\n"
+        "    \\fill[blue!\\x] (\\x,\\y) circle (0.4);\n"
+        "  }\n"
+        "}\n"
+        "\\end{tikzpicture}\n\\end{document}\n"
+    )
+
+
+def stress_math_document() -> str:
+    """Hundreds of numbered display equations."""
+    body = "".join(
+        f"\\begin{{align}}\n  f_{{{i}}}(x) &= \\sum_{{k=0}}^{{{i}}} \\binom{{{i}}}{{k}} x^k \\label{{eq:{i}}}\\\\\n"
+        f"  g_{{{i}}}(x) &= \\int_0^x f_{{{i}}}(t)\\,dt\n\\end{{align}}\n"
+        for i in range(1, 301)
+    )
+    return "\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n" + body + "\\end{document}\n"
+
+
+def corpus() -> dict[str, str]:
+    return {
+        "swe_resume": SWE_RESUME_TEMPLATE,
+        "two_row_resume": TWO_ROW_RESUME_TEMPLATE,
+        "textbook": TEXTBOOK_TEMPLATE,
+        "research": RESEARCH_TEMPLATE,
+        "presentation": PRESENTATION_TEMPLATE,
+        "letter": LETTER_TEMPLATE,
+        "stress_long": stress_long_document(),
+        "stress_tikz": stress_tikz_document(),
+        "stress_math": stress_math_document(),
+    }
+
+
+def run_measured(args: list[str], cwd: Path, env: dict[str, str]) -> tuple[int, int]:
+    """Run a command, returning (exit code, peak RSS in bytes).
+
+    Commands still running after TIMEOUT_SECONDS are killed.
+    """
+    proc = subprocess.Popen(
+        args,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if hasattr(os, "wait4"):
+        # wait4 itself has no timeout; the kill makes it return
+        timer = threading.Timer(TIMEOUT_SECONDS, proc.kill)
+        timer.start()
+        try:
+            _, status, usage = os.wait4(proc.pid, 0)
+        finally:
+            timer.cancel()
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+        return proc.returncode, peak
+    try:
+        return proc.wait(timeout=TIMEOUT_SECONDS), 0
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        return proc.wait(), 0
+
+
+def compile_once(engine: str, work_dir: Path, tex_file: Path, fmt: str | None, fmt_dir: Path) -> dict:
+    """One compile, rerunning until the aux files settle like PDFService does."""
+    env = dict(os.environ)
+    env["max_print_line"] = "10000"
+    if fmt:
+        env["TEXFORMATS"] = f"{fmt_dir}{os.pathsep}"
+    pdf_file = tex_file.with_suffix(".pdf")
+    pdf_file.unlink(missing_ok=True)
+    max_passes = 1 if engine == "tectonic" else MAX_PASSES
+
+    fingerprint = aux_fingerprint(work_dir)
+    passes = 0
+    peak = 0
+    started = time.perf_counter()
+    while True:
+        passes += 1
+        _, rss = run_measured(engine_command(engine, work_dir, tex_file, fmt), work_dir, env)
+        peak = max(peak, rss)
+        if not pdf_file.exists() or passes >= max_passes:
+            break
+        new_fingerprint = aux_fingerprint(work_dir)
+        if new_fingerprint == fingerprint:
+            break
+        fingerprint = new_fingerprint
+    return {
+        "seconds": time.perf_counter() - started,
+        "passes": passes,
+        "peak_rss": peak,
+        "ok": pdf_file.exists(),
+    }
+
+
+def build_format(engine: str, source: str, fmt_dir: Path) -> str | None:
+    split = split_preamble(source)
+    if engine not in FORMAT_ENGINES or split is None:
+        return None
+    name = f"bench-{engine}"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_path = Path(temp_dir)
+        (temp_path / f"{name}.tex").write_text(preamble_document(split[0]), encoding="utf-8")
+        run_measured(format_build_command(engine, name, f"{name}.tex"), temp_path, dict(os.environ))
+        fmt_file = temp_path / f"{name}.fmt"
+        if not fmt_file.exists():
+            return None
+        shutil.move(str(fmt_file), str(fmt_dir / fmt_file.name))
+    return name
+
+
+def benchmark(engine: str, name: str, source: str, runs: int) -> dict:
+    cold, warm = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            work_dir = Path(temp_dir)
+            tex_file = work_dir / f"{name}.tex"
+            tex_file.write_text(source, encoding="utf-8")
+            cold.append(compile_once(engine, work_dir, tex_file, None, work_dir))
+
+    with tempfile.TemporaryDirectory() as temp_dir, tempfile.TemporaryDirectory() as fmt_temp:
+        work_dir = Path(temp_dir)
+        fmt_dir = Path(fmt_temp)
+        tex_file = work_dir / f"{name}.tex"
+        fmt = build_format(engine, source, fmt_dir)
+        tex_file.write_text(source, encoding="utf-8")
+        # Prime the workspace; not timed
+        compile_once(engine, work_dir, tex_file, fmt, fmt_dir)
+        for run in range(runs):
+            # A trailing comment stands in for a small edit
+            tex_file.write_text(f"{source}\n% edit {run}\n", encoding="utf-8")
+            warm.append(compile_once(engine, work_dir, tex_file, fmt, fmt_dir))
+
+    return {
+        "engine": engine,
+        "document": name,
+        "format": fmt is not None,
+        "cold": cold,
+        "warm": warm,
+    }
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(result: dict) -> dict:
+    summary = {"engine": result["engine"], "document": result["document"], "format": result["format"]}
+    for phase in ("cold", "warm"):
+        samples = result[phase]
+        seconds = [s["seconds"] for s in samples if s["ok"]]
+        summary[f"{phase}_p50_ms"] = percentile(seconds, 50) * 1000
+        summary[f"{phase}_p95_ms"] = percentile(seconds, 95) * 1000
+        summary[f"{phase}_failures"] = sum(1 for s in samples if not s["ok"])
+    summary["peak_rss_mb"] = max(s["peak_rss"] for s in result["cold"] + result["warm"]) / (1024 * 1024)
+    return summary
+
+
+def print_table(summaries: list[dict]) -> None:
+    header = f"{'engine':<10} {'document':<16} {'fmt':<4} {'cold p50':>9} {'cold p95':>9} {'warm p50':>9} {'warm p95':>9} {'rss MB':>8} {'fail':>5}"
+    print(header)
+    print("-" * len(header))
+    for s in summaries:
+        failures = s["cold_failures"] + s["warm_failures"]
+        print(
+            f"{s['engine']:<10} {s['document']:<16} {'yes' if s['format'] else 'no':<4} "
+            f"{s['cold_p50_ms']:>9.0f} {s['cold_p95_ms']:>9.0f} "
+            f"{s['warm_p50_ms']:>9.0f} {s['warm_p95_ms']:>9.0f} "
+            f"{s['peak_rss_mb']:>8.1f} {failures:>5}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, help="Engines to compare (default: all installed)")
+    parser.add_argument("--documents", nargs="+", help="Subset of the corpus to compile")
+    parser.add_argument("--runs", type=int, default=5, help="Compiles per phase (default: 5)")
+    parser.add_argument("--json", dest="json_path", help="Also write raw samples and summaries to this file")
+    args = parser.parse_args()
+
+    engines = [e for e in (args.engines or ENGINES) if shutil.which(e)]
+    if not engines:
+        parser.error("None of the requested engines are installed")
+    documents = corpus()
+    if args.documents:
+        unknown = set(args.documents) - set(documents)
+        if unknown:
+            parser.error(f"Unknown documents: {', '.join(sorted(unknown))}")
+        documents = {name: documents[name] for name in args.documents}
+
+    results = []
+    for engine in engines:
+        for name, source in documents.items():
+            print(f"Benchmarking {engine} / {name} ...", file=sys.stderr)
+            results.append(benchmark(engine, name, source, args.runs))
+
+    summaries = [summarize(r) for r in results]
+    print_table(summaries)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({"summaries": summaries, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
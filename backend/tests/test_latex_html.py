@@ -0,0 +1,54 @@
+import pytest
+
+from app.agent.templates.letter import LETTER_TEMPLATE
+from app.agent.templates.presentation import PRESENTATION_TEMPLATE
+from app.agent.templates.research import RESEARCH_TEMPLATE
+from app.agent.templates.swe_resume import SWE_RESUME_TEMPLATE
+from app.agent.templates.textbook import TEXTBOOK_TEMPLATE
+from app.services.latex_html import UnsupportedLatex, render_document
+
+
+def body(source: str) -> str:
+    page = render_document(source)
+    return page[page.index("<body>") + len("<body>"):page.index("</body>")]
+
+
+def document(content: str, preamble: str = "") -> str:
+    return f"\\documentclass{{article}}\n{preamble}\\begin{{document}}\n{content}\n\\end{{document}}\n"
+
+
+@pytest.mark.parametrize(
+    "template", [LETTER_TEMPLATE, PRESENTATION_TEMPLATE, RESEARCH_TEMPLATE, SWE_RESUME_TEMPLATE, TEXTBOOK_TEMPLATE]
+)
+def test_templates_render(template):
+    assert body(template)
+
+
+def test_macro_arguments_and_defaults():
+    preamble = "\\newcommand{\\pair}[2]{(#1, #2)}\n\\newcommand\\greet[1][world]{hello #1}\n"
+    assert body(document("\\pair{a}{b} \\greet{} \\greet[you]", preamble)) == "<p>(a, b) hello world hello you</p>"
+
+
+def test_macro_argument_after_control_word():
+    preamble = "\\newcommand{\\note}[1]{\\textit{\\small#1}}\n"
+    assert body(document("\\note{x}", preamble)) == "<p><i>x</i></p>"
+
+
+def test_recursive_macro_is_unsupported():
+    with pytest.raises(UnsupportedLatex):
+        render_document(document("\\loop", "\\newcommand{\\loop}{\\loop}\n"))
+
+
+def test_frame_title():
+    source = "\\documentclass{beamer}\n\\begin{document}\n\\begin{frame}[t]{Intro}\nx\n\\end{frame}\n\\end{document}\n"
+    assert body(source) == '<section class="frame"><h2>Intro</h2><p>x</p></section>'
+
+
+@pytest.mark.parametrize("url", ["javascript:alert(1)", " JavaScript:alert(1)", "java\tscript:alert(1)", "data:text/html,x"])
+def test_unsafe_links_are_plain_text(url):
+    assert "<a" not in body(document(f"\\href{{{url}}}{{click}} \\url{{{url}}}"))
+
+
+def test_safe_links():
+    out = body(document("\\href{https://example.com}{site} \\href{mailto:a@b.c}{mail}"))
+    assert '<a href="https://example.com">site</a>' in out and '<a href="mailto:a@b.c">mail</a>' in out
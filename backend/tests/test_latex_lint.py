@@ -0,0 +1,79 @@
+from app.services.latex_lint import lint_latex
+
+
+def messages(source: str, **kwargs) -> list[str]:
+    return [issue.message for issue in lint_latex(source, **kwargs)]
+
+
+def test_clean_document():
+    source = "\\documentclass{article}\n\\begin{document}\n\\begin{center}x\\end{center}\n\\end{document}\n"
+    assert lint_latex(source) == []
+
+
+def test_let_without_braces_ends_at_next_token():
+    source = "\\documentclass{article}\n\\let\\oldemph\\emph\n\\begin{document}\nx\n\\end{document}\n"
+    assert lint_latex(source) == []
+
+
+def test_def_with_parameters():
+    source = (
+        "\\documentclass{article}\n\\def\\wrap#1{\\begin{center}#1}\\def\\unwrap{\\end{center}}\n"
+        "\\begin{document}\n\\wrap{x}\\unwrap\n\\end{document}\n"
+    )
+    assert lint_latex(source) == []
+
+
+def test_one_line_newenvironment():
+    source = (
+        "\\documentclass{article}\n"
+        "\\newenvironment{foo}{\\begin{center}}{\\end{center}}\\begin{document}\n"
+        "\\begin{foo}x\\end{foo}\n\\end{document}\n"
+    )
+    assert lint_latex(source) == []
+
+
+def test_newcommand_with_optional_arguments():
+    source = (
+        "\\documentclass{article}\n\\newcommand{\\open}[1][x]{\\begin{itemize}}\\begin{document}\n"
+        "\\begin{itemize}\\item a\n\\end{document}\n"
+    )
+    assert messages(source) == ["\\begin{itemize} is never closed"]
+
+
+def test_environment_after_definition_is_still_checked():
+    source = "\\documentclass{article}\n\\let\\a\\b\n\\begin{document}\n\\begin{center}\n\\end{document}\n"
+    assert any("center" in message for message in messages(source))
+
+
+def test_unclosed_definition_body():
+    source = "\\documentclass{article}\n\\newcommand{\\x}{\\textbf{x}\n\\begin{document}\n\\end{document}\n"
+    assert any("\\newcommand" in message for message in messages(source))
+
+
+def test_iffalse_block_is_skipped():
+    source = (
+        "\\documentclass{article}\n\\begin{document}\n"
+        "\\iffalse\n\\begin{foo}\n\\ifx\\a\\b\\fi\n\\fi\n\\end{document}\n"
+    )
+    assert lint_latex(source) == []
+
+
+def test_unclosed_iffalse():
+    source = "\\documentclass{article}\n\\begin{document}\n\\iffalse\n\\begin{foo}\n\\end{document}\n"
+    assert "\\iffalse is never closed by \\fi" in messages(source)
+
+
+def test_input_downgrades_document_checks_to_warnings():
+    source = "\\input{preamble}\n\\begin{document}\nx\n\\end{document}\n"
+    issues = lint_latex(source)
+    assert issues and all(issue.severity == "warning" for issue in issues)
+
+
+def test_missing_documentclass_is_an_error_without_input():
+    issues = lint_latex("\\begin{document}\nx\n\\end{document}\n")
+    assert [issue.severity for issue in issues] == ["error"]
+
+
+def test_include_only_file_is_not_rejected():
+    issues = lint_latex("\\include{chapter1}\n\\include{chapter2}\n")
+    assert issues and all(issue.severity == "warning" for issue in issues)
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.semantic_cache import SemanticCache
+
+SCOPE = "model"
+TTL = 3600
+
+
+@pytest.fixture
+def cache():
+    return SemanticCache(dim=4096, max_entries=16, threshold=settings.semantic_cache_threshold)
+
+
+@pytest.mark.parametrize(
+    "stored, asked",
+    [
+        ("create a two-column resume", "make me a two column resume"),
+        ("create a two-column resume", "two-column resume please"),
+        ("make me a two column resume", "I need a resume with two columns"),
+        ("make me a resume for John Smith", "Please make a resume for John Smith"),
+        ("write a cover letter for a software engineer", "cover letter for a software engineer please"),
+    ],
+)
+def test_reworded_prompt_hits(cache, stored, asked):
+    cache.store(SCOPE, stored, "stored", TTL)
+    hit = cache.lookup(SCOPE, asked)
+    assert hit is not None and hit[0] == "stored"
+
+
+@pytest.mark.parametrize(
+    "stored, asked",
+    [
+        ("resume for John Smith", "resume for Jane Smith"),
+        ("two column layout for my paper", "three column layout for my paper"),
+        ("resume for a nurse with 5 years experience", "resume for a nurse with 10 years experience"),
+        ("add a table of contents", "remove the table of contents"),
+        ("write a cover letter for a data engineer", "write a cover letter for a data scientist"),
+        ("a title page with the date", "a title page without the date"),
+    ],
+)
+def test_near_miss_prompts_do_not_hit(cache, stored, asked):
+    cache.store(SCOPE, stored, "stored", TTL)
+    assert cache.lookup(SCOPE, asked) is None
+
+
+def test_other_scope_does_not_hit(cache):
+    cache.store(SCOPE, "resume for John Smith", "john", TTL)
+    assert cache.lookup("other model", "resume for John Smith") is None
+
+
+def test_near_miss_does_not_shadow_match(cache):
+    cache.store(SCOPE, "resume for Jane Smith", "jane", TTL)
+    cache.store(SCOPE, "resume for John Smith", "john", TTL)
+    hit = cache.lookup(SCOPE, "a resume for John Smith please")
+    assert hit is not None and hit[0] == "john"
+
+
+def test_expired_entry_does_not_hit(cache, monkeypatch):
+    cache.store(SCOPE, "two column resume", "stored", 60)
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    assert cache.lookup(SCOPE, "two column resume") is None
+
+
+def test_zero_ttl_stores_nothing(cache):
+    cache.store(SCOPE, "two column resume", "stored", 0)
+    assert cache.stats()["entries"] == 0
+
+
+def test_matrix_grows_on_demand():
+    cache = SemanticCache(dim=64, max_entries=200, threshold=0.9)
+    cache.store(SCOPE, "prompt 0", 0, TTL)
+    assert cache.stats()["allocated_rows"] == 64
+    for i in range(1, 200):
+        cache.store(SCOPE, f"prompt {i}", i, TTL)
+    assert cache.stats()["allocated_rows"] == 200
+    assert cache.lookup(SCOPE, "prompt 7")[0] == 7
+    cache.store(SCOPE, "prompt 200", 200, TTL)
+    assert cache.stats()["entries"] == 200